@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Офлайн-проверка http_response: ETag и 304, сжатие gzip и isBase64Encoded,
+версии из data_versions. Без БД и сети.
+
+    python backend/_shared/check_http_response.py
+"""
+import base64
+import gzip
+import json
+import sys
+
+import http_response
+
+class VersionsCursor:
+    """Курсор, который отвечает только на запрос data_versions"""
+    
+    def __init__(self, rows):
+        self.rows = rows
+        self.query = None
+    
+    def execute(self, sql, params=None):
+        if 'FROM data_versions' not in sql:
+            raise AssertionError(f'Неожиданный запрос: {sql}')
+        self.query = (sql, params)
+    
+    def fetchall(self):
+        sources = self.query[1][0]
+        return [row for row in self.rows if (row['source'] if isinstance(row, dict) else row[0]) in sources]
+
+def json_response(payload) -> dict:
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(payload)
+    }
+
+def run_check() -> bool:
+    etag = http_response.make_etag({'products': 7}, {'limit': '24'})
+    gzip_event = {'headers': {'accept-encoding': 'br, gzip;q=0.8'}}
+    large = [{'id': i, 'title': f'Диван угловой {i}'} for i in range(200)]
+    
+    compressed = http_response.finalize_response(gzip_event, json_response(large), etag)
+    plain = http_response.finalize_response({'headers': {}}, json_response(large), etag)
+    small = http_response.finalize_response(gzip_event, json_response({'id': 1}), etag)
+    refused = http_response.finalize_response({'headers': {'Accept-Encoding': 'gzip;q=0'}}, json_response(large), etag)
+    not_modified = http_response.not_modified_response(etag)
+    
+    gzip_etag = etag[:-1] + '-gzip"'
+    dict_rows = VersionsCursor([{'source': 'products', 'version': 7}, {'source': 'bundle_items', 'version': 3}])
+    tuple_rows = VersionsCursor([('products', 8)])
+    
+    checks = {
+        'gzip и isBase64Encoded': (
+            compressed['isBase64Encoded'] is True
+            and compressed['headers']['Content-Encoding'] == 'gzip'
+            and json.loads(gzip.decompress(base64.b64decode(compressed['body']))) == large
+            and compressed['headers']['ETag'] == gzip_etag
+            and compressed['headers']['Vary'] == 'Accept-Encoding'
+        ),
+        'без сжатия': (
+            plain['isBase64Encoded'] is False and 'Content-Encoding' not in plain['headers']
+            and plain['headers']['ETag'] == etag and json.loads(plain['body']) == large
+            and small['isBase64Encoded'] is False and small['headers']['ETag'] == etag
+            and refused['isBase64Encoded'] is False
+        ),
+        'заголовок ETag': (
+            plain['headers']['Cache-Control'] == 'no-cache'
+            and plain['headers']['Access-Control-Expose-Headers'] == 'ETag'
+            and 'ETag' not in http_response.finalize_response({}, json_response({'id': 1}))['headers']
+        ),
+        'If-None-Match': (
+            http_response.matched_etag({'headers': {'If-None-Match': etag}}, etag) == etag
+            and http_response.matched_etag({'headers': {'if-none-match': f'"x", W/{gzip_etag}'}}, etag) == gzip_etag
+            and http_response.matched_etag({'headers': {'If-None-Match': '*'}}, etag) == etag
+            and http_response.matched_etag({'headers': {'If-None-Match': '"stale"'}}, etag) is None
+            and http_response.matched_etag({}, etag) is None
+        ),
+        'ответ 304': (
+            not_modified['statusCode'] == 304 and not_modified['body'] == ''
+            and not_modified['isBase64Encoded'] is False
+            and not_modified['headers']['ETag'] == etag
+            and not_modified['headers']['Access-Control-Allow-Origin'] == '*'
+        ),
+        'версии data_versions': (
+            http_response.data_versions(dict_rows, ['products', 'product_bundles']) == {'products': 7, 'product_bundles': 0}
+            and http_response.data_versions(tuple_rows, ['products']) == {'products': 8}
+            and http_response.make_etag({'products': 7}, {'limit': '24'}) == etag
+            and http_response.make_etag({'products': 8}, {'limit': '24'}) != etag
+            and http_response.make_etag({'products': 7}, {'limit': '48'}) != etag
+        )
+    }
+    
+    for name, ok in checks.items():
+        print(f"{'OK' if ok else 'MISMATCH'}: {name}", file=sys.stderr)
+    return all(checks.values())
+
+if __name__ == '__main__':
+    sys.exit(0 if run_check() else 1)
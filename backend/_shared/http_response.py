@@ -0,0 +1,93 @@
+"""
+Условные GET (ETag/If-None-Match -> 304) и сжатие ответов gzip
+"""
+import base64
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+# Ответы GET крупнее этого порога сжимаются gzip, если клиент его принимает
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_LEVEL = 6
+
+def header_value(event: Dict[str, Any], name: str) -> str:
+    """Заголовок запроса без учёта регистра имени"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value or ''
+    return ''
+
+def accepts_gzip(event: Dict[str, Any]) -> bool:
+    for part in header_value(event, 'Accept-Encoding').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            q = params.strip()
+            return not (q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'))
+    return False
+
+def data_versions(cur, sources: List[str]) -> Dict[str, int]:
+    """
+    Версии таблиц из data_versions. Счётчик увеличивает триггер в транзакции,
+    изменившей таблицу, под блокировкой строки, поэтому версии идут в порядке commit:
+    поздний commit не прячется за уже выданным ETag, как было с MAX(updated_at)
+    """
+    cur.execute('SELECT source, version FROM data_versions WHERE source = ANY(%s)', (sources,))
+    versions = dict.fromkeys(sources, 0)
+    for row in cur.fetchall():
+        source, version = (row['source'], row['version']) if isinstance(row, dict) else row
+        versions[source] = version
+    return versions
+
+def make_etag(*parts: Any) -> str:
+    """Сильный ETag из версий данных и параметров запроса"""
+    key = json.dumps(parts, default=str, sort_keys=True)
+    return '"' + hashlib.md5(key.encode('utf-8')).hexdigest() + '"'
+
+def matched_etag(event: Dict[str, Any], etag: str) -> Optional[str]:
+    """
+    Тег из If-None-Match, совпавший с ETag (у сжатого ответа он с суффиксом -gzip),
+    или None, если ответ нужно отдавать целиком
+    """
+    candidates = {etag, etag[:-1] + '-gzip"'}
+    for tag in header_value(event, 'If-None-Match').split(','):
+        tag = tag.strip().removeprefix('W/')
+        if tag == '*':
+            return etag
+        if tag in candidates:
+            return tag
+    return None
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def finalize_response(event: Dict[str, Any], response: Dict[str, Any], etag: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Проставляет ETag и сжимает тело gzip (в base64, isBase64Encoded), если клиент
+    принимает gzip и тело больше COMPRESSION_MIN_BYTES
+    """
+    headers = response['headers']
+    headers['Vary'] = 'Accept-Encoding'
+    raw = response['body'].encode('utf-8')
+    compress = len(raw) >= COMPRESSION_MIN_BYTES and accepts_gzip(event)
+    if etag:
+        headers['ETag'] = etag[:-1] + '-gzip"' if compress else etag
+        headers['Cache-Control'] = 'no-cache'
+        headers['Access-Control-Expose-Headers'] = 'ETag'
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+        response['body'] = base64.b64encode(gzip.compress(raw, COMPRESSION_LEVEL)).decode('ascii')
+    response['isBase64Encoded'] = compress
+    return response
@@ -0,0 +1,65 @@
+"""
+Slug товаров: транслитерация названия и подбор свободного slug для пачки товаров
+"""
+import re
+from typing import Any, List, Optional
+
+# Транслитерация кириллицы; её же использует generate_variant_group_id анализа вариантов
+TRANSLIT_MAP = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+SLUG_MAX_LENGTH = 60
+_SLUG_SEPARATORS_RE = re.compile(r'-{2,}')
+
+def slugify(text: str) -> str:
+    """Slug из названия: кириллица транслитерируется, всё кроме [a-z0-9] становится дефисом"""
+    chars = []
+    for char in text.lower():
+        if char in TRANSLIT_MAP:
+            chars.append(TRANSLIT_MAP[char])
+        elif char.isascii() and char.isalnum():
+            chars.append(char)
+        else:
+            chars.append('-')
+    slug = _SLUG_SEPARATORS_RE.sub('-', ''.join(chars)).strip('-')
+    return slug[:SLUG_MAX_LENGTH].rstrip('-') or 'product'
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def allocate_slugs(cursor, base_slugs: List[str], articles: Optional[List[Any]] = None,
+                   clear_before: bool = False) -> List[str]:
+    """
+    Подбирает свободные slug для пачки одним запросом по префиксам (base, base-2, base-3...).
+    Slug товара с тем же артикулом остаётся за ним - это тот же товар. С clear_before
+    свободны и slug товаров с артикулом не из пачки: импорт удалит их до вставки.
+    Работает и с обычным курсором, и с RealDictCursor
+    """
+    articles = articles if articles is not None else [None] * len(base_slugs)
+    prefixes = sorted(set(base_slugs))
+    cursor.execute(
+        'SELECT slug, supplier_article FROM products WHERE slug LIKE ANY(%s)',
+        ([escape_like(p) + '%' for p in prefixes],)
+    )
+    batch_articles = {article for article in articles if article}
+    owners = {}
+    for row in cursor.fetchall():
+        slug, owner_article = (row['slug'], row['supplier_article']) if isinstance(row, dict) else row
+        if clear_before and owner_article and owner_article not in batch_articles:
+            continue
+        owners[slug] = owner_article
+    
+    used = set()
+    slugs = []
+    for base_slug, article in zip(base_slugs, articles):
+        slug, suffix = base_slug, 1
+        while slug in used or (slug in owners and (article is None or owners[slug] != article)):
+            suffix += 1
+            slug = f'{base_slug}-{suffix}'
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
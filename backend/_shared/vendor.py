@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Раскладывает общие модули из backend/_shared по папкам функций.
+
+Каждая функция деплоится отдельной папкой, поэтому общий код лежит в ней
+копией. Править нужно только оригинал в _shared и затем запускать скрипт;
+--check падает, если какая-то копия разошлась с оригиналом.
+
+    python backend/_shared/vendor.py
+    python backend/_shared/vendor.py --check
+"""
+import argparse
+import os
+import sys
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SHARED_DIR)
+
+# Модуль -> функции, в которые он копируется
+MANIFEST = {
+    'db.py': [
+        'employee-auth', 'employee-change-password', 'employees', 'favorites', 'orders',
+        'ozon-import', 'product-bundles', 'product-variants-analysis', 'products',
+        'products-import', 'profile'
+    ],
+    'http_response.py': ['orders', 'product-bundles', 'product-variants-analysis', 'products'],
+    'slugs.py': ['ozon-import', 'product-variants-analysis', 'products', 'products-import']
+}
+
+def vendored_source(module: str) -> str:
+    with open(os.path.join(SHARED_DIR, module), encoding='utf-8') as f:
+        source = f.read()
+    header = f'# Копия backend/_shared/{module}: правьте оригинал и запускайте python backend/_shared/vendor.py\n'
+    return header + source
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Копирование общих модулей в функции')
+    parser.add_argument('--check', action='store_true', help='только проверить, что копии совпадают с оригиналами')
+    args = parser.parse_args()
+    
+    stale = []
+    for module, functions in MANIFEST.items():
+        expected = vendored_source(module)
+        for function in functions:
+            path = os.path.join(BACKEND_DIR, function, module)
+            current = None
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    current = f.read()
+            if current == expected:
+                continue
+            if args.check:
+                stale.append(os.path.relpath(path, BACKEND_DIR))
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(expected)
+                print(f'updated {os.path.relpath(path, BACKEND_DIR)}')
+    
+    if stale:
+        print('Копии расходятся с backend/_shared:', file=sys.stderr)
+        for path in stale:
+            print(f'  {path}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,15 +6,10 @@ Returns: HTTP response dict с результатом изменения пар
 '''
 
 import json
-import os
 import hashlib
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+from db import get_db_connection, release_db_connection
 
 def hash_password(password: str) -> str:
     """Хэширует пароль с использованием SHA-256"""
@@ -133,4 +128,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
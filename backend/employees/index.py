@@ -6,18 +6,13 @@ Returns: HTTP response dict с данными сотрудников
 '''
 
 import json
-import os
 import hashlib
 import secrets
 import string
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+from db import get_db_connection, release_db_connection
 
 def generate_password(length: int = 12) -> str:
     """Генерирует случайный пароль"""
@@ -328,4 +323,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
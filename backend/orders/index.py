@@ -6,15 +6,370 @@ Returns: HTTP response dict с данными заказов или статус
 '''
 
 import json
-import os
+import time
+import select
+import base64
+import hashlib
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from db import get_db_connection, release_db_connection
+from http_response import data_versions, finalize_response, make_etag, matched_etag, not_modified_response
 
-def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+DEFAULT_FEED_LIMIT = 50
+MAX_FEED_LIMIT = 200
+
+VALID_ORDER_STATUSES = ['new', 'pending', 'in_processing', 'in_delivery', 'delivered', 'completed', 'cancelled']
+
+# Допустимые переходы статусов для массового обновления
+ORDER_STATUS_TRANSITIONS = {
+    'pending': {'new', 'in_processing', 'cancelled'},
+    'new': {'in_processing', 'cancelled'},
+    'in_processing': {'in_delivery', 'cancelled'},
+    'in_delivery': {'delivered', 'cancelled'},
+    'delivered': {'completed'},
+    'completed': set(),
+    'cancelled': set()
+}
+MAX_BULK_STATUS_UPDATES = 500
+
+# Длина колонки orders.idempotency_key
+MAX_IDEMPOTENCY_KEY_LENGTH = 100
+
+ORDERS_CHANNEL = 'orders_changed'
+MAX_CHANGES_WAIT_SECONDS = 25
+CHANGES_BATCH_LIMIT = 100
+# Перепроверка горизонта после NOTIFY, пока долгая транзакция задерживает выдачу
+CHANGES_RECHECK_SECONDS = 0.5
+
+# Таблицы data_versions, от которых зависит список заказов (имена и телефоны - из users)
+ORDERS_VERSION_SOURCES = ['orders', 'order_items', 'users']
+
+STAFF_ORDER_COLUMNS = "o.id, o.order_number, o.total_amount, o.status, o.delivery_type, o.payment_type, o.delivery_address, o.delivery_apartment, o.delivery_entrance, o.delivery_floor, o.delivery_intercom, o.comment, o.created_at, u.email, u.name, u.phone"
+
+def orders_etag(cur, event: Dict[str, Any], user_email: Optional[str]) -> str:
+    """
+    Сильный ETag из версий заказов, позиций и покупателей, параметров запроса и
+    пользователя из X-User-Id - считается до выборки самих заказов
+    """
+    return make_etag(
+        data_versions(cur, ORDERS_VERSION_SOURCES),
+        event.get('queryStringParameters') or {}, user_email or ''
+    )
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), order_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def parse_feed_params(query_params: Dict[str, str]) -> tuple:
+    """
+    Разбирает status, created_from, created_to, limit, after для ленты заказов сотрудников
+    """
+    conditions = []
+    args = []
+    
+    statuses = [st.strip() for st in (query_params.get('status') or '').split(',') if st.strip()]
+    if statuses:
+        conditions.append('o.status = ANY(%s)')
+        args.append(statuses)
+    
+    for param, operator in (('created_from', '>='), ('created_to', '<')):
+        if query_params.get(param):
+            try:
+                conditions.append(f'o.created_at {operator} %s')
+                args.append(datetime.fromisoformat(query_params[param]))
+            except ValueError as e:
+                raise ValueError(f'{param} must be an ISO date') from e
+    
+    limit = None
+    if 'limit' in query_params or 'after' in query_params:
+        try:
+            limit = int(query_params.get('limit') or DEFAULT_FEED_LIMIT)
+        except ValueError as e:
+            raise ValueError('limit must be an integer') from e
+        limit = max(1, min(limit, MAX_FEED_LIMIT))
+    
+    if query_params.get('after'):
+        conditions.append('(o.created_at, o.id) < (%s, %s)')
+        args.extend(decode_cursor(query_params['after']))
+    
+    return conditions, args, limit
+
+def get_employee_status_filters(employee_type: str) -> List[str]:
+    """Статусы заказов, которые видит сотрудник (несколько типов через запятую)"""
+    employee_types_list = employee_type.split(',')
+    
+    status_filters = []
+    for etype in employee_types_list:
+        etype = etype.strip()
+        status_map = {
+            'new': 'new',
+            'order_processing': 'in_processing',
+            'delivery': 'in_delivery',
+            'assembly': 'delivered'
+        }
+        if etype in status_map:
+            status_filters.append(status_map[etype])
+    
+    # Всегда включаем статус 'new' для сотрудников с несколькими типами
+    if len(employee_types_list) > 1 and 'new' not in status_filters:
+        status_filters.append('new')
+    
+    return status_filters
+
+def serialize_orders(cur, orders: List[Dict[str, Any]], include_customer: bool) -> List[Dict[str, Any]]:
+    """Подгружает позиции заказов и приводит заказы к формату ответа API"""
+    # Позиции всех заказов одним запросом вместо запроса на каждый заказ
+    items_by_order = {}
+    if orders:
+        cur.execute(
+            "SELECT order_id, product_id, product_title, product_price, quantity FROM order_items WHERE order_id = ANY(%s) ORDER BY order_id, id",
+            ([order['id'] for order in orders],)
+        )
+        for item in cur.fetchall():
+            order_id = item.pop('order_id')
+            items_by_order.setdefault(order_id, []).append(dict(item))
+    
+    result = []
+    for order in orders:
+        order_data = {
+            'id': order['id'],
+            'orderNumber': order['order_number'],
+            'totalAmount': order['total_amount'],
+            'status': order['status'],
+            'deliveryType': order['delivery_type'],
+            'paymentType': order['payment_type'],
+            'deliveryAddress': order['delivery_address'],
+            'deliveryApartment': order.get('delivery_apartment', ''),
+            'deliveryEntrance': order.get('delivery_entrance', ''),
+            'deliveryFloor': order.get('delivery_floor', ''),
+            'deliveryIntercom': order.get('delivery_intercom', ''),
+            'comment': order['comment'],
+            'createdAt': order['created_at'].isoformat() if order['created_at'] else None,
+            'items': items_by_order.get(order['id'], [])
+        }
+        
+        if include_customer:
+            order_data['userEmail'] = order.get('email')
+            order_data['userName'] = order.get('name')
+            order_data['userPhone'] = order.get('phone')
+        
+        result.append(order_data)
+    
+    return result
+
+def notify_order_changed(cur, order_id: int, status: str) -> None:
+    """Сообщает слушателям ленты изменений; доставляется после commit"""
+    cur.execute("SELECT pg_notify(%s, %s)", (ORDERS_CHANNEL, json.dumps({'id': order_id, 'status': status})))
+
+def encode_change_cursor(tx_from: int, tx_to: Optional[int], after_change_id: int) -> str:
+    raw = json.dumps([tx_from, tx_to, after_change_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_change_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        tx_from, tx_to, after_change_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        return int(tx_from), (int(tx_to) if tx_to is not None else None), int(after_change_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def current_change_horizon(cur) -> int:
+    """
+    Самая старая незавершённая транзакция-писатель: всё, что ниже, уже закоммичено или откачено.
+    Долгая транзакция держит горизонт, и более поздние закоммиченные изменения ждут её завершения
+    """
+    cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) AS horizon")
+    return cur.fetchone()['horizon']
+
+def fetch_order_changes(cur, cursor: tuple, status_filters: Optional[List[str]]) -> tuple:
+    """
+    Изменения заказов из журнала order_changes после курсора (tx_from, tx_to, change_id).
+    Выдаются только транзакции из [tx_from, tx_to), где tx_to - горизонт завершённых
+    транзакций, поэтому поздний commit не оказывается позади курсора. Диапазон фиксируется
+    на время постраничной выдачи, затем курсор переходит к [tx_to, новый горизонт).
+    Заказы, ушедшие из статусов сотрудника, возвращаются отдельно, чтобы дашборд их убрал.
+    Возвращает (заказы, ушедшие заказы, следующий курсор, есть ли ещё)
+    """
+    tx_from, tx_to, after_change_id = cursor
+    if tx_to is None:
+        tx_to = current_change_horizon(cur)
+    cur.execute(
+        "SELECT change_id, order_id, status, old_status FROM order_changes WHERE tx_id >= %s AND tx_id < %s AND change_id > %s ORDER BY change_id LIMIT %s",
+        (tx_from, tx_to, after_change_id, CHANGES_BATCH_LIMIT)
+    )
+    log = cur.fetchall()
+    has_more = len(log) >= CHANGES_BATCH_LIMIT
+    next_cursor = (tx_from, tx_to, log[-1]['change_id']) if has_more else (tx_to, None, 0)
+    
+    # Несколько изменений одного заказа схлопываются в одно, порядок - по последнему изменению
+    touched = {}
+    for change in log:
+        was_visible = touched.pop(change['order_id'], False)
+        touched[change['order_id']] = was_visible or status_filters is None or change['status'] in status_filters or change['old_status'] in status_filters
+    if not touched:
+        return [], [], next_cursor, has_more
+    
+    cur.execute(
+        f"SELECT {STAFF_ORDER_COLUMNS} FROM orders o JOIN users u ON o.user_id = u.id WHERE o.id = ANY(%s)",
+        (list(touched),)
+    )
+    current = {order['id']: order for order in cur.fetchall()}
+    
+    changes = []
+    removed = []
+    for order_id, was_visible in touched.items():
+        order = current.get(order_id)
+        if order is None:
+            continue
+        if status_filters is None or order['status'] in status_filters:
+            changes.append(order)
+        elif was_visible:
+            removed.append({'id': order_id, 'orderNumber': order['order_number'], 'status': order['status']})
+    return changes, removed, next_cursor, has_more
+
+def wait_for_order_changes(conn, cur, cursor: tuple, status_filters: Optional[List[str]], wait_seconds: float) -> tuple:
+    """
+    Long-poll: ждёт NOTIFY по каналу заказов до wait_seconds, не нагружая БД в простое.
+    LISTEN выполняется до первой выборки, чтобы не пропустить изменения между ними.
+    После каждой выборки транзакция закрывается: уведомления доставляются только вне неё.
+    
+    Горизонт выдачи - самая старая незавершённая транзакция. Пока её держит долгий писатель,
+    закоммиченные после неё изменения не выдаются, хотя NOTIFY о них уже пришёл и был
+    прочитан. Поэтому после NOTIFY без изменений горизонт перепроверяется каждые
+    CHANGES_RECHECK_SECONDS до конца ожидания, а не только по следующему уведомлению.
+    Если писатель так и не завершится, ответ будет пустым, а изменения выдаст следующий запрос
+    """
+    cur.execute(f"LISTEN {ORDERS_CHANNEL}")
+    conn.commit()
+    try:
+        changes, removed, cursor, has_more = fetch_order_changes(cur, cursor, status_filters)
+        conn.commit()
+        deadline = time.monotonic() + wait_seconds
+        notified = False
+        while not changes and not removed and not has_more:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = min(remaining, CHANGES_RECHECK_SECONDS) if notified else remaining
+            if select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+            if conn.notifies:
+                conn.notifies.clear()
+                notified = True
+            elif not notified:
+                continue
+            changes, removed, cursor, has_more = fetch_order_changes(cur, cursor, status_filters)
+            conn.commit()
+        return changes, removed, cursor, has_more
+    finally:
+        cur.execute(f"UNLISTEN {ORDERS_CHANNEL}")
+        conn.commit()
+        conn.notifies.clear()
+
+def idempotency_payload_hash(body_data: Dict[str, Any]) -> str:
+    """md5 тела заказа без учёта порядка ключей: им сверяется повтор с тем же ключом идемпотентности"""
+    return hashlib.md5(json.dumps(body_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def idempotent_replay_response(existing_order: Dict[str, Any], payload_hash: str) -> Dict[str, Any]:
+    """Ответ на повтор заказа: прежний заказ или 422, если под тем же ключом пришёл другой заказ"""
+    stored_hash = existing_order.get('idempotency_payload_hash')
+    if stored_hash is not None and stored_hash != payload_hash:
+        print(f"[WARN] Idempotency key reused with different payload: {existing_order['order_number']}")
+        return {
+            'statusCode': 422,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Idempotency key was already used for a different order'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'success': True,
+            'orderNumber': existing_order['order_number'],
+            'orderId': existing_order['id']
+        }),
+        'isBase64Encoded': False
+    }
+
+def apply_bulk_status_update(cur, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Проверяет переходы по ORDER_STATUS_TRANSITIONS и применяет допустимые
+    одним UPDATE ... FROM (VALUES ...); возвращает результат по каждой строке
+    """
+    results = []
+    requested = {}
+    for update in updates:
+        order_id = update.get('orderId') if isinstance(update, dict) else None
+        new_status = update.get('status') if isinstance(update, dict) else None
+        if isinstance(order_id, str) and order_id.isdigit():
+            order_id = int(order_id)
+        result = {'orderId': order_id, 'success': False}
+        results.append(result)
+        
+        if not isinstance(order_id, int) or isinstance(order_id, bool) or not new_status:
+            result['error'] = 'Missing orderId or status'
+        elif new_status not in VALID_ORDER_STATUSES:
+            result['error'] = f'Invalid status. Must be one of: {", ".join(VALID_ORDER_STATUSES)}'
+        elif order_id in requested:
+            result['error'] = 'Duplicate orderId in request'
+        else:
+            result['newStatus'] = new_status
+            requested[order_id] = result
+    
+    if not requested:
+        return results
+    
+    cur.execute("SELECT id, status FROM orders WHERE id = ANY(%s) FOR UPDATE", (list(requested),))
+    current_statuses = {row['id']: row['status'] for row in cur.fetchall()}
+    
+    transitions = []
+    for order_id, result in requested.items():
+        current_status = current_statuses.get(order_id)
+        if current_status is None:
+            result['error'] = 'Order not found'
+            continue
+        result['previousStatus'] = current_status
+        if result['newStatus'] not in ORDER_STATUS_TRANSITIONS.get(current_status, set()):
+            result['error'] = f"Transition {current_status} -> {result['newStatus']} is not allowed"
+            continue
+        transitions.append((order_id, current_status, result['newStatus']))
+    
+    if transitions:
+        updated_rows = execute_values(
+            cur,
+            """UPDATE orders AS o
+               SET status = v.new_status, updated_at = CURRENT_TIMESTAMP
+               FROM (VALUES %s) AS v(id, old_status, new_status)
+               WHERE o.id = v.id AND o.status = v.old_status
+               RETURNING o.id""",
+            transitions,
+            page_size=len(transitions),
+            fetch=True
+        )
+        updated_ids = [row['id'] for row in updated_rows]
+        for order_id in updated_ids:
+            requested[order_id]['success'] = True
+        if updated_ids:
+            cur.execute("SELECT pg_notify(%s, %s)", (ORDERS_CHANNEL, json.dumps({'ids': updated_ids})))
+    
+    return results
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -26,7 +381,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Employee-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Employee-Type, X-Idempotency-Key, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -57,6 +412,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method == 'POST':
             print(f"[POST] Creating new order")
             body_data = json.loads(event.get('body', '{}'))
+            idempotency_key = headers.get('X-Idempotency-Key') or headers.get('x-idempotency-key')
+            payload_hash = idempotency_payload_hash(body_data)
+            
+            if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': f'X-Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters'}),
+                    'isBase64Encoded': False
+                }
+            
+            # Повторная отправка того же заказа клиентом возвращает уже созданный заказ;
+            # ключ ищется только среди заказов этого покупателя
+            if idempotency_key:
+                cur.execute(
+                    "SELECT o.id, o.order_number, o.idempotency_payload_hash FROM orders o JOIN users u ON o.user_id = u.id WHERE u.email = %s AND o.idempotency_key = %s",
+                    (user_email, idempotency_key)
+                )
+                existing_order = cur.fetchone()
+                if existing_order:
+                    print(f"[INFO] Idempotent replay: {existing_order['order_number']}")
+                    return idempotent_replay_response(existing_order, payload_hash)
             
             cur.execute(
                 "INSERT INTO users (email, name, phone, address, city) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name, phone = EXCLUDED.phone, address = EXCLUDED.address, city = EXCLUDED.city RETURNING id",
@@ -64,20 +444,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             user_id = cur.fetchone()['id']
             
-            order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{user_id}-{int(datetime.now().timestamp())}"
-            
+            # Номер заказа из последовательности БД - не совпадает при одновременных оформлениях
             cur.execute(
                 """INSERT INTO orders (
                     user_id, order_number, total_amount, status, delivery_type, payment_type, 
                     delivery_address, delivery_city, delivery_apartment, delivery_entrance, 
                     delivery_floor, delivery_intercom, comment,
                     items_total, delivery_price, is_free_delivery, delivery_distance, 
-                    delivery_estimated_days, carry_price, carry_category, carry_details
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
-                RETURNING id""",
+                    delivery_estimated_days, carry_price, carry_category, carry_details, idempotency_key,
+                    idempotency_payload_hash
+                ) VALUES (
+                    %s, 'ORD-' || to_char(CURRENT_TIMESTAMP, 'YYYYMMDD') || '-' || lpad(nextval('order_number_seq')::text, 6, '0'),
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                )
+                ON CONFLICT (user_id, idempotency_key) DO NOTHING
+                RETURNING id, order_number""",
                 (
                     user_id,
-                    order_number,
                     body_data.get('totalAmount', 0),
                     'new',
                     body_data.get('deliveryType'),
@@ -96,17 +479,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     body_data.get('deliveryEstimatedDays', ''),
                     body_data.get('carryPrice', 0),
                     body_data.get('carryCategory', ''),
-                    body_data.get('carryDetails', '')
+                    body_data.get('carryDetails', ''),
+                    idempotency_key,
+                    payload_hash if idempotency_key else None
                 )
             )
-            order_id = cur.fetchone()['id']
+            created_order = cur.fetchone()
             
-            for item in body_data.get('items', []):
+            if not created_order:
+                # Параллельный запрос с тем же ключом успел создать заказ первым
+                conn.rollback()
                 cur.execute(
-                    "INSERT INTO order_items (order_id, product_id, product_title, product_price, quantity) VALUES (%s, %s, %s, %s, %s)",
-                    (order_id, item.get('id'), item.get('title'), item.get('price'), item.get('quantity'))
+                    "SELECT id, order_number, idempotency_payload_hash FROM orders WHERE user_id = %s AND idempotency_key = %s",
+                    (user_id, idempotency_key)
                 )
+                existing_order = cur.fetchone()
+                print(f"[INFO] Idempotent replay after conflict: {existing_order['order_number']}")
+                return idempotent_replay_response(existing_order, payload_hash)
+            
+            order_id = created_order['id']
+            order_number = created_order['order_number']
             
+            items = body_data.get('items', [])
+            if items:
+                execute_values(
+                    cur,
+                    "INSERT INTO order_items (order_id, product_id, product_title, product_price, quantity) VALUES %s",
+                    [(order_id, item.get('id'), item.get('title'), item.get('price'), item.get('quantity')) for item in items],
+                    page_size=len(items)
+                )
+            
+            notify_order_changed(cur, order_id, 'new')
             conn.commit()
             print(f"[SUCCESS] Order created: {order_number} (ID: {order_id})")
             
@@ -126,38 +529,87 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         elif method == 'GET':
             print(f"[GET] Fetching orders - admin: {is_admin_request}, employeeType: {employee_type}")
-            if is_admin_request:
-                cur.execute(
-                    "SELECT o.id, o.order_number, o.total_amount, o.status, o.delivery_type, o.payment_type, o.delivery_address, o.delivery_apartment, o.delivery_entrance, o.delivery_floor, o.delivery_intercom, o.comment, o.created_at, u.email, u.name, u.phone FROM orders o JOIN users u ON o.user_id = u.id ORDER BY o.created_at DESC"
-                )
-                orders = cur.fetchall()
-            elif employee_type:
-                # Поддержка нескольких типов через запятую
-                employee_types_list = employee_type.split(',')
+            next_cursor = None
+            since = query_params.get('since')
+            if since and (is_admin_request or employee_type):
+                status_filters = None if is_admin_request else get_employee_status_filters(employee_type)
+                
+                if since == 'now':
+                    cursor = encode_change_cursor(current_change_horizon(cur), None, 0)
+                    changes, removed, has_more = [], [], False
+                else:
+                    try:
+                        since_cursor = decode_change_cursor(since)
+                        wait_seconds = min(float(query_params.get('wait') or 0), MAX_CHANGES_WAIT_SECONDS)
+                    except ValueError as e:
+                        return {
+                            'statusCode': 400,
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': json.dumps({'error': str(e)}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    if wait_seconds > 0:
+                        changes, removed, next_since, has_more = wait_for_order_changes(conn, cur, since_cursor, status_filters, wait_seconds)
+                    else:
+                        changes, removed, next_since, has_more = fetch_order_changes(cur, since_cursor, status_filters)
+                    cursor = encode_change_cursor(*next_since)
                 
-                status_filters = []
-                for etype in employee_types_list:
-                    etype = etype.strip()
-                    status_map = {
-                        'new': 'new',
-                        'order_processing': 'in_processing',
-                        'delivery': 'in_delivery',
-                        'assembly': 'delivered'
+                return finalize_response(event, {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({
+                        'orders': serialize_orders(cur, changes, True),
+                        'removed': removed,
+                        'cursor': cursor,
+                        'hasMore': has_more
+                    }),
+                    'isBase64Encoded': False
+                })
+            
+            # Версии читаются до выборки: изменение, закоммиченное между ними, даст новый ETag
+            # при следующем запросе, а не застрявший 304
+            etag = orders_etag(cur, event, user_email)
+            not_modified_etag = matched_etag(event, etag)
+            if not_modified_etag:
+                return not_modified_response(not_modified_etag)
+            
+            if is_admin_request or employee_type:
+                try:
+                    conditions, args, limit = parse_feed_params(query_params)
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
                     }
-                    if etype in status_map:
-                        status_filters.append(status_map[etype])
                 
-                # Всегда включаем статус 'new' для сотрудников с несколькими типами
-                if len(employee_types_list) > 1 and 'new' not in status_filters:
-                    status_filters.append('new')
+                if not is_admin_request:
+                    conditions.insert(0, 'o.status = ANY(%s)')
+                    args.insert(0, get_employee_status_filters(employee_type))
                 
-                if status_filters:
-                    placeholders = ','.join(['%s'] * len(status_filters))
-                    query = f"SELECT o.id, o.order_number, o.total_amount, o.status, o.delivery_type, o.payment_type, o.delivery_address, o.delivery_apartment, o.delivery_entrance, o.delivery_floor, o.delivery_intercom, o.comment, o.created_at, u.email, u.name, u.phone FROM orders o JOIN users u ON o.user_id = u.id WHERE o.status IN ({placeholders}) ORDER BY o.created_at DESC"
-                    cur.execute(query, tuple(status_filters))
-                    orders = cur.fetchall()
-                else:
-                    orders = []
+                where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+                query = f"SELECT {STAFF_ORDER_COLUMNS} FROM orders o JOIN users u ON o.user_id = u.id {where_sql} ORDER BY o.created_at DESC, o.id DESC"
+                if limit:
+                    # Берём на одну запись больше, чтобы узнать о следующей странице
+                    query += ' LIMIT %s'
+                    args.append(limit + 1)
+                cur.execute(query, tuple(args))
+                orders = cur.fetchall()
+                
+                if limit and len(orders) > limit:
+                    orders = orders[:limit]
+                    next_cursor = encode_cursor(orders[-1]['created_at'], orders[-1]['id'])
             else:
                 cur.execute(
                     "SELECT id FROM users WHERE email = %s",
@@ -184,51 +636,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 orders = cur.fetchall()
             
-            result = []
-            for order in orders:
-                cur.execute(
-                    "SELECT product_id, product_title, product_price, quantity FROM order_items WHERE order_id = %s",
-                    (order['id'],)
-                )
-                items = cur.fetchall()
-                
-                order_data = {
-                    'id': order['id'],
-                    'orderNumber': order['order_number'],
-                    'totalAmount': order['total_amount'],
-                    'status': order['status'],
-                    'deliveryType': order['delivery_type'],
-                    'paymentType': order['payment_type'],
-                    'deliveryAddress': order['delivery_address'],
-                    'deliveryApartment': order.get('delivery_apartment', ''),
-                    'deliveryEntrance': order.get('delivery_entrance', ''),
-                    'deliveryFloor': order.get('delivery_floor', ''),
-                    'deliveryIntercom': order.get('delivery_intercom', ''),
-                    'comment': order['comment'],
-                    'createdAt': order['created_at'].isoformat() if order['created_at'] else None,
-                    'items': [dict(item) for item in items]
-                }
-                
-                if is_admin_request or employee_type:
-                    order_data['userEmail'] = order.get('email')
-                    order_data['userName'] = order.get('name')
-                    order_data['userPhone'] = order.get('phone')
-                
-                result.append(order_data)
+            result = serialize_orders(cur, orders, is_admin_request or bool(employee_type))
             
-            return {
+            return finalize_response(event, {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'orders': result}),
+                'body': json.dumps({'orders': result, 'nextCursor': next_cursor}),
                 'isBase64Encoded': False
-            }
+            }, etag)
         
         elif method == 'PUT':
             try:
                 body_data = json.loads(event.get('body', '{}'))
+                
+                bulk_updates = body_data.get('orders')
+                if isinstance(bulk_updates, list):
+                    print(f"[PUT REQUEST] Bulk status update for {len(bulk_updates)} orders")
+                    if not bulk_updates or len(bulk_updates) > MAX_BULK_STATUS_UPDATES:
+                        return {
+                            'statusCode': 400,
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': json.dumps({'error': f'orders must contain 1 to {MAX_BULK_STATUS_UPDATES} items'}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    results = apply_bulk_status_update(cur, bulk_updates)
+                    conn.commit()
+                    updated_count = sum(1 for r in results if r['success'])
+                    print(f"[SUCCESS] Bulk status update: {updated_count}/{len(results)} orders updated")
+                    
+                    return {
+                        'statusCode': 200,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({
+                            'success': updated_count == len(results),
+                            'updated': updated_count,
+                            'results': results
+                        }),
+                        'isBase64Encoded': False
+                    }
+                
                 order_id = body_data.get('orderId')
                 new_status = body_data.get('status')
                 
@@ -247,7 +703,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 # Валидация статуса
-                valid_statuses = ['new', 'pending', 'in_processing', 'in_delivery', 'delivered', 'completed', 'cancelled']
+                valid_statuses = VALID_ORDER_STATUSES
                 if new_status not in valid_statuses:
                     print(f"[ERROR] Invalid status: {new_status}. Valid statuses: {valid_statuses}")
                     return {
@@ -279,7 +735,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 print(f"[INFO] Updating order {order_id} from status '{existing_order['status']}' to '{new_status}'")
                 
                 cur.execute(
-                    "UPDATE orders SET status = %s WHERE id = %s",
+                    "UPDATE orders SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
                     (new_status, order_id)
                 )
                 
@@ -296,6 +752,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                notify_order_changed(cur, order_id, new_status)
                 conn.commit()
                 print(f"[SUCCESS] Order {order_id} status updated to '{new_status}'")
                 
@@ -405,5 +862,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
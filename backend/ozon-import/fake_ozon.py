@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка Ozon Seller API для проверки синхронизации без сети.
+
+Отдаёт v3/product/list (пагинация по last_id) и v4/product/info/attributes
+для сгенерированного с фиксированным seed каталога мебели. Может отвечать
+429 на каждый N-й запрос и добавлять задержку, чтобы проверить повторы и пул.
+--check прогоняет настоящий sync_ozon_catalog против заглушки и базы в памяти:
+обрыв и продолжение с контрольной точки, блокировку, выборку по сохранённым
+хэшам, пропуск по хэшу содержимого, сохранение цены и ежедневную долю обновления.
+
+    python fake_ozon.py --check
+    python fake_ozon.py --products 2500 --port 8089 --throttle-every 10
+
+Во втором случае функцию запускают с OZON_API_URL=http://127.0.0.1:8089,
+OZON_CLIENT_ID=fake-client и OZON_API_KEY=fake-key.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+import index
+
+CATALOG_SEED = 7
+FAKE_CLIENT_ID = 'fake-client'
+FAKE_API_KEY = 'fake-key'
+
+FAKE_TYPES = ['Диван угловой', 'Кровать', 'Шкаф-купе', 'Комод', 'Стол обеденный', 'Тумба ТВ', 'Кресло']
+FAKE_MODELS = ['Комфорт', 'Лофт', 'Айден', 'Милан', 'Сканди', 'Веста']
+FAKE_COLORS = ['белый', 'серый', 'дуб сонома', 'венге', 'графит', '']
+
+def generate_catalog(size: int, seed: int = CATALOG_SEED) -> List[Dict[str, Any]]:
+    """Карточки в формате v4/product/info/attributes, отсортированные по product_id"""
+    rng = random.Random(seed)
+    catalog = []
+    for idx in range(size):
+        product_id = 900000000 + idx * 3
+        model = rng.choice(FAKE_MODELS)
+        color = rng.choice(FAKE_COLORS)
+        kind = rng.choice(FAKE_TYPES)
+        attributes = [
+            {'attribute_id': 9048, 'values': [{'value': model}]},
+            {'attribute_id': 8229, 'values': [{'value': kind}]},
+            {'attribute_id': 4191, 'values': [{'value': f'{kind} {model} для дома'}]}
+        ]
+        if color:
+            attributes.append({'attribute_id': 10096, 'values': [{'value': color}]})
+        catalog.append({
+            'id': product_id,
+            # Примерно у каждой сотой карточки нет артикула - синхронизация её пропускает
+            'offer_id': '' if idx % 100 == 99 else f'OZ-{idx:06d}',
+            'name': f'{kind} {model} {color}'.strip(),
+            'price': f'{rng.randint(50, 900) * 100}.00',
+            'images': [{'default': f'https://cdn.example.com/{product_id}/{n}.jpg'} for n in range(rng.randint(0, 3))],
+            'stocks': {'present': rng.choice([0, 1, 3, 10]), 'reserved': 0},
+            'attributes': attributes
+        })
+    return catalog
+
+def list_entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Запись v3/product/list: меняется вместе с наличием на складе и уценкой"""
+    return {
+        'product_id': item['id'],
+        'offer_id': item['offer_id'],
+        'archived': False,
+        'has_fbo_stocks': item['stocks']['present'] > 0,
+        'has_fbs_stocks': False,
+        'is_discounted': item.get('is_discounted', False),
+        'quants': []
+    }
+
+class FakeOzon:
+    """Состояние заглушки: каталог, счётчики запросов и имитация ограничения частоты"""
+    
+    def __init__(self, catalog: List[Dict[str, Any]], throttle_every: int = 0, latency: float = 0.0):
+        self.catalog = catalog
+        self.by_id = {item['id']: item for item in catalog}
+        self.throttle_every = throttle_every
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+    
+    def mutate(self, count: int, seed: int = CATALOG_SEED) -> List[int]:
+        """Меняет наличие у count случайных товаров, как ночные движения склада"""
+        changed = random.Random(seed).sample(self.catalog, count)
+        for item in changed:
+            item['stocks']['present'] = 0 if item['stocks']['present'] else 5
+        return [item['id'] for item in changed]
+    
+    def touch(self, count: int, seed: int, drop_price: bool = False) -> List[int]:
+        """
+        Меняет у count товаров только запись списка (уценку), а с drop_price ещё
+        убирает цену из карточки, как бывает в ответах Ozon
+        """
+        changed = random.Random(seed).sample(self.catalog, count)
+        for item in changed:
+            item['is_discounted'] = not item.get('is_discounted', False)
+            if drop_price:
+                item.pop('price', None)
+        return [item['id'] for item in changed]
+    
+    def product_list(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        limit = min(int(payload.get('limit') or 100), 1000)
+        last_id = payload.get('last_id') or ''
+        start = 0
+        if last_id:
+            after = int(last_id)
+            start = next((i for i, item in enumerate(self.catalog) if item['id'] > after), len(self.catalog))
+        page = self.catalog[start:start + limit]
+        return {
+            'result': {
+                'items': [list_entry(item) for item in page],
+                'total': len(self.catalog),
+                'last_id': str(page[-1]['id']) if page else ''
+            }
+        }
+    
+    def attributes(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        ids = (payload.get('filter') or {}).get('product_id') or []
+        if len(ids) > 100:
+            raise ValueError('product_id: не больше 100 значений')
+        items = [self.by_id[int(pid)] for pid in ids if int(pid) in self.by_id]
+        return {'result': items, 'total': len(items), 'last_id': ''}
+
+def make_handler(fake: FakeOzon):
+    routes = {
+        '/v3/product/list': fake.product_list,
+        '/v4/product/info/attributes': fake.attributes
+    }
+    
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+        
+        def send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_POST(self):
+            if self.headers.get('Client-Id') != FAKE_CLIENT_ID or self.headers.get('Api-Key') != FAKE_API_KEY:
+                self.send_json(403, {'code': 7, 'message': 'Invalid Api-Key'})
+                return
+            route = routes.get(self.path)
+            if route is None:
+                self.send_json(404, {'code': 5, 'message': 'Not found'})
+                return
+            
+            with fake.lock:
+                fake.requests += 1
+                throttle = fake.throttle_every and fake.requests % fake.throttle_every == 0
+                if throttle:
+                    fake.throttled += 1
+            if throttle:
+                self.send_json(429, {'code': 8, 'message': 'Too many requests'})
+                return
+            if fake.latency:
+                time.sleep(fake.latency)
+            
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                self.send_json(200, route(payload))
+            except ValueError as e:
+                self.send_json(400, {'code': 3, 'message': str(e)})
+    
+    return Handler
+
+def start_server(fake: FakeOzon, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# День, от которого SQL синхронизации считает долю ежедневного обновления
+REFRESH_EPOCH = date(2000, 1, 1)
+
+class StubDB:
+    """
+    База в памяти для --check. Понимает только запросы sync_ozon_catalog и
+    upsert_ozon_products (на любой другой падает) и повторяет их смысл: upsert по
+    артикулу с сохранением цены и остатка, хэши, контрольную точку, advisory lock.
+    Транзакция - рабочая копия таблиц, которую commit публикует, а rollback сбрасывает.
+    Строки не меняются на месте, поэтому копии таблиц достаточно поверхностной
+    """
+    
+    def __init__(self):
+        self.committed = {'products': {}, 'sync': {}, 'state': {'last_id': None, 'completed': None}}
+        self.rollback()
+        self.lock_holder = None
+        self.today = (date.today() - REFRESH_EPOCH).days
+        self.fail_on_checkpoint = 0
+        self.checkpoints = 0
+    
+    def commit(self) -> None:
+        self.committed = {name: dict(table) for name, table in self.work.items()}
+    
+    def rollback(self) -> None:
+        self.work = {name: dict(table) for name, table in self.committed.items()}
+    
+    def stale(self, pid: int, synced_day: int) -> bool:
+        """Условие перезапроса из sync_ozon_catalog: доля дня или предел в два цикла"""
+        days = index.SYNC_REFRESH_DAYS
+        return synced_day < self.today - days * 2 or (synced_day < self.today and pid % days == self.today % days)
+    
+    def upsert_product(self, new: Dict[str, Any]) -> Optional[bool]:
+        """INSERT ... ON CONFLICT (supplier_article) из upsert_ozon_products: True - вставка, False - обновление"""
+        products = self.work['products']
+        current = products.get(new['supplier_article'])
+        for col, default in (('price', 0), ('in_stock', False), ('stock_quantity', None)):
+            if new[col] is None:
+                new[col] = current[col] if current else default
+        if current is None:
+            if any(p['slug'] == new['slug'] for p in products.values()):
+                raise AssertionError(f"slug {new['slug']} уже занят")
+            products[new['supplier_article']] = new
+            return True
+        updated = dict(current)
+        for col in index.SYNC_UPDATED_COLUMNS:
+            if col in ('variant_group_id', 'color_variant'):
+                updated[col] = current[col] if current[col] is not None else new[col]
+            else:
+                updated[col] = new[col]
+        if updated == current:
+            return None
+        products[new['supplier_article']] = updated
+        return False
+
+class StubConnection:
+    def __init__(self, db: StubDB):
+        self.db = db
+    
+    def cursor(self) -> 'StubCursor':
+        return StubCursor(self)
+    
+    def commit(self) -> None:
+        self.db.commit()
+    
+    def rollback(self) -> None:
+        self.db.rollback()
+
+class StubCursor:
+    def __init__(self, conn: StubConnection):
+        self.conn = conn
+        self.db = conn.db
+        self.result = []
+    
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        query = ' '.join(sql.split())
+        state = self.db.work['state']
+        self.result = []
+        if query.startswith('SELECT pg_try_advisory_lock'):
+            acquired = self.db.lock_holder in (None, self.conn)
+            if acquired:
+                self.db.lock_holder = self.conn
+            self.result = [(acquired,)]
+        elif query.startswith('SELECT pg_advisory_unlock'):
+            released = self.db.lock_holder is self.conn
+            if released:
+                self.db.lock_holder = None
+            self.result = [(released,)]
+        elif query.startswith('UPDATE ozon_sync_state SET last_run_at'):
+            self.result = [(state['last_id'],)]
+        elif query.startswith('UPDATE ozon_sync_state SET last_id = NULL'):
+            state['last_id'] = None
+            state['completed'] = self.db.today
+        elif query.startswith('UPDATE ozon_sync_state SET last_id ='):
+            self.db.checkpoints += 1
+            if self.db.checkpoints == self.db.fail_on_checkpoint:
+                raise RuntimeError('обрыв вызова функции')
+            state['last_id'] = params[0]
+        elif query.startswith('SELECT ozon_product_id, list_hash, content_hash'):
+            sync = self.db.work['sync']
+            self.result = [
+                (pid, sync[pid][0], sync[pid][1], self.db.stale(pid, sync[pid][2]))
+                for pid in params[0] if pid in sync
+            ]
+        elif query.startswith('SELECT slug, supplier_article FROM products WHERE slug LIKE ANY'):
+            # Slug из slugify состоят из [a-z0-9-], экранировать в префиксах нечего
+            prefixes = [pattern[:-1] for pattern in params[0]]
+            self.result = [
+                (p['slug'], p['supplier_article']) for p in self.db.work['products'].values()
+                if any(p['slug'].startswith(prefix) for prefix in prefixes)
+            ]
+        else:
+            raise AssertionError(f'Неожиданный запрос: {query[:80]}')
+    
+    def execute_values(self, sql: str, rows: List[tuple], fetch: bool = False) -> List[tuple]:
+        query = ' '.join(sql.split())
+        if query.startswith('INSERT INTO products'):
+            for fragment in ('ON CONFLICT (supplier_article) DO UPDATE',
+                             'LEFT JOIN products p ON p.supplier_article = v.supplier_article',
+                             'IS DISTINCT FROM', 'RETURNING (xmax = 0)'):
+                if fragment not in query:
+                    raise AssertionError(f'В upsert товаров нет {fragment}')
+            results = []
+            for row in rows:
+                if len(row) != len(index.SYNC_COLUMNS):
+                    raise AssertionError('Число значений не совпадает с SYNC_COLUMNS')
+                new = dict(zip(index.SYNC_COLUMNS, row))
+                new['colors'], new['images'] = json.loads(new['colors']), json.loads(new['images'])
+                is_insert = self.db.upsert_product(new)
+                if is_insert is not None:
+                    results.append((is_insert,))
+            return results if fetch else None
+        if query.startswith('INSERT INTO ozon_product_sync'):
+            for pid, offer_id, list_hash, content in rows:
+                self.db.work['sync'][pid] = (list_hash, content, self.db.today)
+            return None
+        raise AssertionError(f'Неожиданный запрос: {query[:80]}')
+    
+    def fetchone(self) -> Optional[tuple]:
+        return self.result[0] if self.result else None
+    
+    def fetchall(self) -> List[tuple]:
+        return self.result
+    
+    def close(self) -> None:
+        pass
+
+def stub_execute_values(cur: StubCursor, sql: str, rows: List[tuple], template: Optional[str] = None,
+                        page_size: int = 100, fetch: bool = False) -> Optional[List[tuple]]:
+    """Подмена psycopg2.extras.execute_values: VALUES %s раскрывает сама база-заглушка"""
+    return cur.execute_values(sql, rows, fetch)
+
+def sync(db: StubDB, full: bool = False) -> Dict[str, Any]:
+    return index.sync_ozon_catalog(StubConnection(db), FAKE_CLIENT_ID, FAKE_API_KEY, full)
+
+def run_check(size: int) -> bool:
+    """
+    Прогоны настоящего sync_ozon_catalog против заглушки с 429 и задержкой:
+    первая синхронизация обрывается на второй контрольной точке и продолжается
+    с первой сохранённой; занятая блокировка даёт SyncInProgressError; повтор без
+    изменений ничего не запрашивает; после изменений склада запрашиваются только
+    изменившиеся, а группа из анализа вариантов у них сохраняется; смена одной
+    записи списка не переписывает товар; пропавшая цена не затирает сохранённую;
+    на следующий день перезапрашивается только его доля
+    """
+    fake = FakeOzon(generate_catalog(size), throttle_every=9, latency=0.02)
+    server = start_server(fake, 0)
+    index.OZON_API_URL = f'http://127.0.0.1:{server.server_port}'
+    index.execute_values = stub_execute_values
+    
+    db = StubDB()
+    with_offer = {item['id'] for item in fake.catalog if item['offer_id']}
+    page_last_ids = [str(item['id']) for item in fake.catalog[index.SYNC_LIST_LIMIT - 1::index.SYNC_LIST_LIMIT]]
+    total_pages = -(-size // index.SYNC_LIST_LIMIT)
+    articles = {item['id']: item['offer_id'] for item in fake.catalog}
+    started = time.monotonic()
+    try:
+        db.fail_on_checkpoint = 2
+        try:
+            sync(db)
+            interrupted = None
+        except RuntimeError:
+            interrupted = dict(db.committed['state'])
+        db.fail_on_checkpoint = 0
+        first = sync(db)
+        
+        db.lock_holder = 'другой вызов'
+        try:
+            sync(db)
+            locked = False
+        except index.SyncInProgressError:
+            locked = True
+        db.lock_holder = None
+        
+        idle = sync(db)
+        changed = set(fake.mutate(min(37, size)))
+        grouped = {articles[pid] for pid in changed & with_offer}
+        for article in grouped:
+            db.committed['products'][article]['variant_group_id'] = f'analysis-{article}'
+        delta = sync(db)
+        touched = set(fake.touch(min(20, size), seed=11))
+        relisted = sync(db)
+        prices = {article: p['price'] for article, p in db.committed['products'].items()}
+        unpriced = set(fake.touch(min(10, size), seed=13, drop_price=True))
+        unpriced_run = sync(db)
+        db.today += 1
+        next_day = sync(db)
+    finally:
+        server.shutdown()
+    elapsed = time.monotonic() - started
+    
+    products = db.committed['products']
+    today_share = {pid for pid in fake.by_id if pid % index.SYNC_REFRESH_DAYS == db.today % index.SYNC_REFRESH_DAYS}
+    checks = {
+        'обрыв и продолжение': (
+            interrupted is not None
+            and interrupted['last_id'] in page_last_ids
+            and first['resumedFrom'] == interrupted['last_id']
+            and first['complete'] and first['pages'] == total_pages - 1 - page_last_ids.index(interrupted['last_id'])
+            and db.committed['state']['last_id'] is None
+        ),
+        'полный обход': (
+            len(products) == len(with_offer)
+            and set(db.committed['sync']) == set(fake.by_id)
+            and first['failedBatches'] == 0
+            and db.lock_holder is None
+        ),
+        'блокировка': locked,
+        'выборка по хэшам': idle['requested'] == 0 and idle['inserted'] + idle['updated'] == 0,
+        'только изменения': (
+            delta['requested'] == len(changed)
+            and delta['updated'] == len(changed & with_offer)
+            and delta['skipped'] == len(changed - with_offer)
+        ),
+        'группа из анализа вариантов': (
+            len(grouped) > 0
+            and all(products[article]['variant_group_id'] == f'analysis-{article}' for article in grouped)
+        ),
+        'хэш содержимого': (
+            relisted['requested'] == len(touched)
+            and relisted['unchanged'] == len(touched & with_offer)
+            and relisted['updated'] == 0
+        ),
+        'цена без изменений': (
+            unpriced_run['requested'] == len(unpriced)
+            and unpriced_run['updated'] == 0
+            and all(products[articles[pid]]['price'] == prices[articles[pid]] for pid in unpriced & with_offer)
+        ),
+        'доля дня': (
+            next_day['requested'] == len(today_share)
+            and 0 < len(today_share) < size // index.SYNC_REFRESH_DAYS * 2
+        )
+    }
+    
+    for name, ok in checks.items():
+        print(f"{'OK' if ok else 'MISMATCH'}: {name}", file=sys.stderr)
+    print(
+        f"страниц {total_pages}, товаров {len(products)}/{size}, "
+        f"после изменений запрошено {delta['requested']}/{len(changed)}, "
+        f"на следующий день {next_day['requested']}, ответов 429 {fake.throttled}, {elapsed:.2f} с",
+        file=sys.stderr
+    )
+    return all(checks.values())
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Заглушка Ozon Seller API')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--products', type=int, default=2500, help='размер каталога')
+    parser.add_argument('--throttle-every', type=int, default=0, help='отвечать 429 на каждый N-й запрос')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунды')
+    parser.add_argument('--check', action='store_true', help='прогнать обход каталога против заглушки и выйти')
+    args = parser.parse_args()
+    
+    if args.check:
+        return 0 if run_check(args.products) else 1
+    
+    fake = FakeOzon(generate_catalog(args.products), args.throttle_every, args.latency)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(fake))
+    print(f'Заглушка Ozon: http://127.0.0.1:{args.port} ({args.products} товаров), '
+          f'Client-Id={FAKE_CLIENT_ID} Api-Key={FAKE_API_KEY}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,438 @@
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Optional, Iterator, Callable, Tuple
 import urllib.request
 import urllib.error
+from psycopg2.extras import execute_values
+from db import get_db_connection, release_db_connection
+from slugs import allocate_slugs, slugify
+
+# Базовый адрес Seller API; для офлайн-проверки подменяется на fake_ozon.py
+OZON_API_URL = os.environ.get('OZON_API_URL', 'https://api-seller.ozon.ru').rstrip('/')
+OZON_REQUEST_TIMEOUT = 30
+
+# Полная синхронизация: список товаров идёт страницами по last_id, атрибуты -
+# пачками по 100 (предел v4/product/info/attributes) в несколько потоков.
+# Все запросы, включая страницы списка, проходят через общий ограничитель частоты
+SYNC_LIST_LIMIT = 1000
+SYNC_ATTRIBUTES_BATCH = 100
+SYNC_WORKERS = 4
+SYNC_REQUESTS_PER_SECOND = 8
+SYNC_MAX_RETRIES = 4
+
+# Запись в v3/product/list не отражает всех правок карточки (цена, описание),
+# поэтому карточки перезапрашиваются и без изменений в списке: каждый день своя
+# седьмая часть (по ozon product_id), чтобы не весь каталог разом через неделю
+# после первой ночи. Пропущенные дни добирает предел в два цикла
+SYNC_REFRESH_DAYS = 7
+
+# Session-level advisory lock: два прогона синхронизации одновременно не идут
+SYNC_LOCK_KEY = 'ozon-import-sync'
+
+# Атрибуты карточки Ozon, как в ozonApi.ts на фронтенде
+ATTR_COLOR_NAME = 10096
+ATTR_MODEL_NAME = 9048
+ATTR_ANNOTATION = 4191
+ATTR_CATEGORY_TYPE = 8229
+
+# Категория по ключевым словам, как mapOzonCategory в productMapper.ts; порядок важен
+CATEGORY_KEYWORDS = [
+    (('диван', 'кресло', 'пуф'), 'Гостиная'),
+    (('кровать', 'матрас'), 'Спальня'),
+    (('стол', 'стул', 'табурет'), 'Кухня'),
+    (('шкаф', 'комод', 'тумба'), 'Прихожая'),
+    (('детск',), 'Детская')
+]
+DEFAULT_CATEGORY = 'Гостиная'
+
+# Поля товара, которые синхронизация перезаписывает при совпадении артикула (offer_id).
+# Цены со скидкой, стиль и состав комплекта Ozon не отдаёт - их не трогаем
+SYNC_COLUMNS = (
+    'title', 'slug', 'description', 'price', 'category', 'colors', 'images',
+    'in_stock', 'supplier_article', 'stock_quantity', 'variant_group_id', 'color_variant'
+)
+SYNC_UPDATED_COLUMNS = (
+    'title', 'description', 'price', 'category', 'colors', 'images',
+    'in_stock', 'stock_quantity', 'variant_group_id', 'color_variant'
+)
+
+class SyncInProgressError(Exception):
+    """Синхронизация уже идёт в другом вызове функции"""
+
+class RateLimiter:
+    """Не чаще rate запросов в секунду суммарно по всем потокам"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def ozon_post(path: str, payload: Dict[str, Any], client_id: str, api_key: str,
+              limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """
+    POST в Seller API. На 429 и 5xx повторяет запрос с нарастающей паузой
+    (или по Retry-After), остальные ошибки пробрасывает как HTTPError
+    """
+    data = json.dumps(payload).encode('utf-8')
+    for attempt in range(SYNC_MAX_RETRIES + 1):
+        if limiter:
+            limiter.wait()
+        req = urllib.request.Request(
+            f'{OZON_API_URL}{path}',
+            data=data,
+            headers={
+                'Client-Id': client_id,
+                'Api-Key': api_key,
+                'Content-Type': 'application/json'
+            },
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=OZON_REQUEST_TIMEOUT) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            if attempt == SYNC_MAX_RETRIES or (e.code != 429 and e.code < 500):
+                raise
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 0.5 * 2 ** attempt
+            print(f'[OZON] {path}: HTTP {e.code}, повтор через {delay:.1f} с')
+            time.sleep(delay)
+
+def iter_product_list_pages(client_id: str, api_key: str, limiter: RateLimiter,
+                            last_id: str = '') -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+    """
+    Проходит v3/product/list по last_id до конца (или с переданного last_id),
+    отдавая записи списка постранично вместе с last_id, после которого идёт следующая страница
+    """
+    while True:
+        request_data = {'filter': {'visibility': 'ALL'}, 'limit': SYNC_LIST_LIMIT}
+        if last_id:
+            request_data['last_id'] = last_id
+        result = ozon_post('/v3/product/list', request_data, client_id, api_key, limiter).get('result', {})
+        items = result.get('items', [])
+        last_id = result.get('last_id', '')
+        if items:
+            yield items, last_id
+        if not last_id or len(items) < SYNC_LIST_LIMIT:
+            return
+
+def fetch_attributes(product_ids: List[int], client_id: str, api_key: str, limiter: RateLimiter) -> List[Dict[str, Any]]:
+    """Карточки с атрибутами для не более чем SYNC_ATTRIBUTES_BATCH товаров"""
+    request_data = {
+        'filter': {'product_id': product_ids, 'visibility': 'ALL'},
+        'limit': SYNC_ATTRIBUTES_BATCH
+    }
+    return ozon_post('/v4/product/info/attributes', request_data, client_id, api_key, limiter).get('result', [])
+
+def attribute_value(item: Dict[str, Any], attribute_id: int) -> str:
+    for attr in item.get('attributes') or []:
+        if attr.get('attribute_id') == attribute_id or attr.get('id') == attribute_id:
+            values = attr.get('values') or []
+            return str(values[0].get('value', '')) if values else ''
+    return ''
+
+def map_ozon_category(ozon_category: str, product_name: str) -> str:
+    """Сначала по «Категории и типу» Ozon, затем по названию товара"""
+    for text in (ozon_category.lower(), product_name.lower()):
+        for keywords, category in CATEGORY_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return category
+    return DEFAULT_CATEGORY
+
+def map_ozon_item(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Карточка Ozon -> поля products, как mapOzonProducts + convertOzonToProduct
+    без пользовательских маппингов. Без offer_id товар сопоставить не с чем - пропускаем.
+    Цена и остаток, которых нет в карточке, остаются None: upsert их не перезаписывает
+    """
+    offer_id = str(item.get('offer_id') or '').strip()
+    if not offer_id:
+        return None
+    
+    name = item.get('name') or f'Товар {offer_id}'
+    images = []
+    for image in item.get('images') or []:
+        url = image if isinstance(image, str) else (image.get('default') or image.get('url') or '')
+        url = url.split(' ')[0].strip()
+        if url.startswith('http'):
+            images.append(url)
+    
+    price = None
+    for key in ('marketing_price', 'price', 'old_price'):
+        digits = ''.join(filter(str.isdigit, item[key].split('.')[0])) if isinstance(item.get(key), str) else ''
+        if digits:
+            price = float(digits)
+            break
+    
+    stock = (item.get('stocks') or {}).get('present')
+    color = attribute_value(item, ATTR_COLOR_NAME)
+    
+    return {
+        'title': name[:255],
+        'description': attribute_value(item, ATTR_ANNOTATION) or item.get('description') or name,
+        'price': price,
+        'category': map_ozon_category(attribute_value(item, ATTR_CATEGORY_TYPE), name),
+        'colors': [color] if color else [],
+        'images': images,
+        'in_stock': stock > 0 if stock is not None else None,
+        'supplier_article': offer_id,
+        'stock_quantity': stock,
+        'variant_group_id': attribute_value(item, ATTR_MODEL_NAME) or None,
+        'color_variant': color or None
+    }
+
+def list_entry_hash(entry: Dict[str, Any]) -> str:
+    """Хэш записи v3/product/list: меняется при смене артикула, архивации, остатков"""
+    return hashlib.md5(json.dumps(entry, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def content_hash(product: Dict[str, Any]) -> str:
+    """Хэш полей products, в которые отображается карточка (результат map_ozon_item)"""
+    return hashlib.md5(json.dumps(product, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def upsert_ozon_products(cursor, products: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Одна пачка карточек в products одним INSERT ... ON CONFLICT (supplier_article).
+    Неизменённые товары не переписываются, variant_group_id и color_variant
+    из Ozon заполняются только у товаров, где они пусты: группировку, которую
+    уже проставил анализ вариантов, синхронизация не меняет. Цена и остаток,
+    которых нет в карточке, берутся из текущей строки товара (новому товару - 0 и
+    нет в наличии): price NOT NULL проверяется до ON CONFLICT, поэтому подставлять
+    их в DO UPDATE через COALESCE(EXCLUDED.price, products.price) нельзя
+    """
+    by_article = {p['supplier_article']: p for p in products}
+    products = list(by_article.values())
+    slugs = allocate_slugs(cursor, [slugify(p['title']) for p in products], list(by_article))
+    
+    rows = [
+        (
+            p['title'], slug, p['description'], p['price'], p['category'],
+            json.dumps(p['colors'], ensure_ascii=False), json.dumps(p['images'], ensure_ascii=False),
+            p['in_stock'], p['supplier_article'], p['stock_quantity'],
+            p['variant_group_id'], p['color_variant']
+        )
+        for p, slug in zip(products, slugs)
+    ]
+    
+    assignments = {col: f'EXCLUDED.{col}' for col in SYNC_UPDATED_COLUMNS}
+    for col in ('variant_group_id', 'color_variant'):
+        assignments[col] = f'COALESCE(products.{col}, EXCLUDED.{col})'
+    set_clause = ', '.join(f'{col} = {expr}' for col, expr in assignments.items())
+    changed = ' OR '.join(f'products.{col} IS DISTINCT FROM {expr}' for col, expr in assignments.items())
+    
+    results = execute_values(
+        cursor,
+        f'''
+            INSERT INTO products ({', '.join(SYNC_COLUMNS)}, style, items, is_new)
+            SELECT v.title, v.slug, v.description, COALESCE(v.price::numeric, p.price::numeric, 0),
+                   v.category, v.colors::jsonb, v.images::jsonb,
+                   COALESCE(v.in_stock::boolean, p.in_stock, FALSE), v.supplier_article,
+                   COALESCE(v.stock_quantity::integer, p.stock_quantity), v.variant_group_id, v.color_variant,
+                   'Современный', '[]'::jsonb, FALSE
+            FROM (VALUES %s) AS v ({', '.join(SYNC_COLUMNS)})
+            LEFT JOIN products p ON p.supplier_article = v.supplier_article
+            ON CONFLICT (supplier_article) DO UPDATE SET
+                {set_clause},
+                updated_at = CURRENT_TIMESTAMP
+            WHERE {changed}
+            RETURNING (xmax = 0)
+        ''',
+        rows,
+        page_size=len(rows),
+        fetch=True
+    )
+    inserted = sum(1 for (is_insert,) in results if is_insert)
+    return {'inserted': inserted, 'updated': len(results) - inserted, 'unchanged': len(rows) - len(results)}
+
+def crawl_ozon_catalog(client_id: str, api_key: str, stats: Dict[str, Any],
+                       select: Optional[Callable[[List[Dict[str, Any]]], List[int]]] = None, last_id: str = '',
+                       workers: int = SYNC_WORKERS,
+                       rate: float = SYNC_REQUESTS_PER_SECOND) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Обходит каталог Ozon и отдаёт карточки с атрибутами пачками по мере готовности.
+    
+    Страницы списка читаются последовательно (last_id есть только у предыдущей
+    страницы), а пачки атрибутов уходят в пул сразу, так что список и атрибуты
+    грузятся параллельно. В работе не больше двух пачек на поток. select получает
+    записи страницы и возвращает id, для которых нужны атрибуты (по умолчанию - все).
+    
+    Вместе с пачкой отдаётся контрольная точка: last_id, до которого все страницы
+    обработаны целиком (None - продвижения нет). Упавшая пачка пропускается и
+    считается в stats['failedBatches']
+    """
+    limiter = RateLimiter(rate)
+    pages = deque()
+    pending = {}
+    
+    def advance() -> Optional[str]:
+        checkpoint = None
+        while pages and pages[0][0] == 0:
+            checkpoint = pages.popleft()[1]
+        return checkpoint
+    
+    def collect(done) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        for future in done:
+            page = pending.pop(future)
+            page[0] -= 1
+            try:
+                items = future.result()
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                stats['failedBatches'] += 1
+                print(f'[OZON] Пачка атрибутов не загружена: {e}')
+                items = []
+            stats['fetched'] += len(items)
+            yield items, advance()
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entries, page_last_id in iter_product_list_pages(client_id, api_key, limiter, last_id):
+            stats['pages'] += 1
+            stats['listed'] += len(entries)
+            product_ids = select(entries) if select else [entry['product_id'] for entry in entries]
+            batches = [product_ids[i:i + SYNC_ATTRIBUTES_BATCH] for i in range(0, len(product_ids), SYNC_ATTRIBUTES_BATCH)]
+            page = [len(batches), page_last_id]
+            pages.append(page)
+            if not batches:
+                yield [], advance()
+            for batch in batches:
+                pending[pool.submit(fetch_attributes, batch, client_id, api_key, limiter)] = page
+                while len(pending) >= workers * 2:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            yield from collect(done)
+
+def acquire_sync_lock(cur) -> bool:
+    cur.execute('SELECT pg_try_advisory_lock(hashtext(%s))', (SYNC_LOCK_KEY,))
+    return cur.fetchone()[0]
+
+def release_sync_lock(cur) -> None:
+    cur.execute('SELECT pg_advisory_unlock(hashtext(%s))', (SYNC_LOCK_KEY,))
+
+def sync_ozon_catalog(conn, client_id: str, api_key: str, full: bool = False) -> Dict[str, Any]:
+    """
+    Синхронизация каталога Ozon в products.
+    
+    Инкрементально (по умолчанию) атрибуты запрашиваются только для товаров, чья
+    запись в списке изменилась, появилась или попала в сегодняшнюю долю обновления
+    (см. SYNC_REFRESH_DAYS), а в products пишутся только карточки с изменившимся хэшем содержимого.
+    full=True запрашивает и перезаписывает всё. Обход начинается с сохранённой
+    контрольной точки, если прошлый прогон оборвался. Каждая готовая пачка вместе
+    с хэшами и контрольной точкой коммитится сразу, так что таймаут функции не
+    теряет сделанного. Если синхронизация уже идёт, бросает SyncInProgressError
+    """
+    stats = {
+        'full': full, 'resumedFrom': None, 'complete': False, 'pages': 0, 'listed': 0, 'requested': 0,
+        'fetched': 0, 'skipped': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'failedBatches': 0
+    }
+    started = time.monotonic()
+    # ozon product_id -> (хэш записи списка, сохранённый хэш содержимого)
+    known: Dict[int, Tuple[str, Optional[str]]] = {}
+    
+    cur = conn.cursor()
+    if not acquire_sync_lock(cur):
+        cur.close()
+        raise SyncInProgressError('Синхронизация с Ozon уже выполняется')
+    conn.commit()
+    
+    try:
+        cur.execute('UPDATE ozon_sync_state SET last_run_at = CURRENT_TIMESTAMP WHERE id = 1 RETURNING last_id')
+        row = cur.fetchone()
+        start_last_id = (row[0] if row else None) or ''
+        conn.commit()
+        stats['resumedFrom'] = start_last_id or None
+        
+        def select(entries: List[Dict[str, Any]]) -> List[int]:
+            hashes = {entry['product_id']: list_entry_hash(entry) for entry in entries}
+            stored = {}
+            if not full:
+                cur.execute(f'''
+                    SELECT ozon_product_id, list_hash, content_hash,
+                           synced_at < CURRENT_TIMESTAMP - INTERVAL '{SYNC_REFRESH_DAYS * 2} days'
+                           OR (synced_at < CURRENT_DATE
+                               AND ozon_product_id %% {SYNC_REFRESH_DAYS} = (CURRENT_DATE - DATE '2000-01-01') %% {SYNC_REFRESH_DAYS})
+                    FROM ozon_product_sync
+                    WHERE ozon_product_id = ANY(%s)
+                ''', (list(hashes),))
+                stored = {pid: (list_hash, stored_content, stale) for pid, list_hash, stored_content, stale in cur.fetchall()}
+            
+            selected = []
+            for pid, list_hash in hashes.items():
+                prev = stored.get(pid)
+                if prev is None or prev[0] != list_hash or prev[2]:
+                    known[pid] = (list_hash, prev[1] if prev else None)
+                    selected.append(pid)
+            stats['requested'] += len(selected)
+            return selected
+        
+        for items, checkpoint in crawl_ozon_catalog(client_id, api_key, stats, select, start_last_id):
+            products = []
+            sync_rows = []
+            for item in items:
+                pid = item.get('id') or item.get('product_id')
+                list_hash, stored_content = known.pop(pid, ('', None))
+                product = map_ozon_item(item)
+                new_content = content_hash(product) if product else ''
+                if product is None:
+                    stats['skipped'] += 1
+                elif new_content == stored_content:
+                    stats['unchanged'] += 1
+                else:
+                    products.append(product)
+                sync_rows.append((pid, item.get('offer_id') or None, list_hash, new_content))
+            
+            if products:
+                for key, value in upsert_ozon_products(cur, products).items():
+                    stats[key] += value
+            if sync_rows:
+                execute_values(
+                    cur,
+                    '''
+                        INSERT INTO ozon_product_sync (ozon_product_id, offer_id, list_hash, content_hash)
+                        VALUES %s
+                        ON CONFLICT (ozon_product_id) DO UPDATE SET
+                            offer_id = EXCLUDED.offer_id,
+                            list_hash = EXCLUDED.list_hash,
+                            content_hash = EXCLUDED.content_hash,
+                            synced_at = CURRENT_TIMESTAMP
+                    ''',
+                    sync_rows,
+                    page_size=len(sync_rows)
+                )
+            if checkpoint is not None:
+                cur.execute('UPDATE ozon_sync_state SET last_id = %s WHERE id = 1', (checkpoint,))
+            conn.commit()
+        
+        cur.execute('UPDATE ozon_sync_state SET last_id = NULL, last_completed_at = CURRENT_TIMESTAMP WHERE id = 1')
+        conn.commit()
+        stats['complete'] = True
+    finally:
+        conn.rollback()
+        release_sync_lock(cur)
+        conn.commit()
+        cur.close()
+    
+    stats['seconds'] = round(time.monotonic() - started, 2)
+    print(f'[OZON] Синхронизация: {json.dumps(stats, ensure_ascii=False)}')
+    return stats
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Импорт карточек товаров из Ozon Seller API
-    Args: event с httpMethod GET (список товаров) или POST (детали товара)
-    Returns: JSON с товарами или детальной информацией о товаре
+    Args: event с httpMethod GET (список товаров), POST (детали товара) или POST {action: 'sync', full?} с заголовком X-Admin-Key (синхронизация в каталог, по умолчанию инкрементальная)
+    Returns: JSON с товарами, детальной информацией о товаре или итогами синхронизации
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -18,7 +442,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
@@ -57,7 +481,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             request_data['last_id'] = last_id
         
         req = urllib.request.Request(
-            'https://api-seller.ozon.ru/v3/product/list',
+            f'{OZON_API_URL}/v3/product/list',
             data=json.dumps(request_data).encode('utf-8'),
             headers={
                 'Client-Id': client_id,
@@ -104,6 +528,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
+        
+        if body_data.get('action') == 'sync':
+            headers = event.get('headers', {})
+            admin_key = headers.get('X-Admin-Key') or headers.get('x-admin-key')
+            
+            if admin_key != 'larana-admin-2024':
+                return {
+                    'statusCode': 403,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Forbidden - admin key required'})
+                }
+            
+            conn = None
+            try:
+                conn = get_db_connection()
+                stats = sync_ozon_catalog(conn, client_id, api_key, full=bool(body_data.get('full')))
+            except SyncInProgressError as e:
+                return {
+                    'statusCode': 409,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': str(e)})
+                }
+            except urllib.error.HTTPError as e:
+                error_body = e.read().decode('utf-8')
+                print(f'Ошибка Ozon API при синхронизации: {error_body}')
+                return {
+                    'statusCode': 502,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': f'Ozon API error: {error_body}'})
+                }
+            except (urllib.error.URLError, OSError) as e:
+                print(f'Ozon API недоступен при синхронизации: {str(e)}')
+                return {
+                    'statusCode': 502,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': f'Request error: {str(e)}'})
+                }
+            except Exception as e:
+                print(f'Ошибка синхронизации: {str(e)}')
+                return {
+                    'statusCode': 500,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': f'Sync error: {str(e)}'})
+                }
+            finally:
+                if conn is not None:
+                    release_db_connection(conn)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, **stats})
+            }
+        
         product_ids = body_data.get('product_ids', [])
         
         if not product_ids:
@@ -128,7 +625,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
         req = urllib.request.Request(
-            'https://api-seller.ozon.ru/v4/product/info/attributes',
+            f'{OZON_API_URL}/v4/product/info/attributes',
             data=json.dumps(request_data).encode('utf-8'),
             headers={
                 'Client-Id': client_id,
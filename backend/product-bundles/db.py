@@ -0,0 +1,38 @@
+# Копия backend/_shared/db.py: правьте оригинал и запускайте python backend/_shared/vendor.py
+"""
+Переиспользуемое соединение с БД между тёплыми вызовами функции
+"""
+import os
+import psycopg2
+
+_db_connection = None
+
+def get_db_connection():
+    """Возвращает переиспользуемое соединение с БД, при обрыве переподключается"""
+    global _db_connection
+    conn = _db_connection
+    if conn is not None and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            return conn
+        except psycopg2.Error:
+            print('[DB] Stale connection dropped, reconnecting')
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+    _db_connection = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    return _db_connection
+
+def release_db_connection(conn) -> None:
+    """Сбрасывает незавершённую транзакцию, оставляя соединение открытым"""
+    if conn is None or conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        conn.close()
@@ -5,35 +5,20 @@ Args: event с httpMethod, body, queryStringParameters
 Returns: HTTP response с данными наборов
 """
 import json
-import os
 from typing import Dict, Any, List, Optional
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_db_connection, release_db_connection
+from http_response import data_versions, finalize_response, make_etag, matched_etag, not_modified_response
 
-def get_db_connection():
-    """Создает подключение к БД"""
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+# Таблицы data_versions, от которых зависит ответ наборов: сами наборы, их состав и
+# наличие (bundle_availability обновляют триггеры на products и bundle_items)
+BUNDLES_VERSION_SOURCES = ['product_bundles', 'bundle_items', 'bundle_availability']
 
-def check_bundle_availability(conn, supplier_articles: List[str]) -> bool:
-    """Проверяет доступность всех товаров в наборе"""
-    with conn.cursor() as cur:
-        placeholders = ','.join(f"'{article}'" for article in supplier_articles)
-        cur.execute(f"""
-            SELECT supplier_article, stock_quantity 
-            FROM products 
-            WHERE supplier_article IN ({placeholders})
-        """)
-        products = cur.fetchall()
-        
-        if len(products) < len(supplier_articles):
-            return False
-        
-        for product in products:
-            if product['stock_quantity'] <= 0:
-                return False
-        
-        return True
+def bundles_etag(cur, event: Dict[str, Any]) -> str:
+    """
+    Сильный ETag из версии наборов и параметров запроса - без выборки самих наборов
+    """
+    return make_etag(data_versions(cur, BUNDLES_VERSION_SOURCES), event.get('queryStringParameters') or {})
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -44,7 +29,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -57,7 +42,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters', {})
             bundle_id = params.get('id')
             
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                etag = bundles_etag(cur, event)
+                not_modified_etag = matched_etag(event, etag)
+                if not_modified_etag:
+                    return not_modified_response(not_modified_etag)
+                
                 if bundle_id:
                     cur.execute("""
                         SELECT pb.*, 
@@ -68,17 +58,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                                        'product_name', bi.product_name,
                                        'quantity', bi.quantity
                                    )
-                               ) as items
+                               ) as items,
+                               COALESCE(ba.in_stock, false) as in_stock,
+                               COALESCE(ba.available_count, 0) as available_count,
+                               COALESCE(ba.missing_articles, '{}') as missing_articles,
+                               ba.components_price
                         FROM product_bundles pb
                         LEFT JOIN bundle_items bi ON pb.id = bi.bundle_id
+                        LEFT JOIN bundle_availability ba ON ba.bundle_id = pb.id
                         WHERE pb.id = %s
-                        GROUP BY pb.id
+                        GROUP BY pb.id, ba.bundle_id
                     """, (bundle_id,))
                     bundle = cur.fetchone()
                     
                     if bundle:
-                        articles = [item['supplier_article'] for item in bundle['items']]
-                        bundle['in_stock'] = check_bundle_availability(conn, articles)
                         result = dict(bundle)
                     else:
                         result = {'error': 'Bundle not found'}
@@ -93,34 +86,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                                        'product_name', bi.product_name,
                                        'quantity', bi.quantity
                                    )
-                               ) as items
+                               ) as items,
+                               COALESCE(ba.in_stock, false) as in_stock,
+                               COALESCE(ba.available_count, 0) as available_count,
+                               COALESCE(ba.missing_articles, '{}') as missing_articles,
+                               ba.components_price
                         FROM product_bundles pb
                         LEFT JOIN bundle_items bi ON pb.id = bi.bundle_id
-                        GROUP BY pb.id
+                        LEFT JOIN bundle_availability ba ON ba.bundle_id = pb.id
+                        GROUP BY pb.id, ba.bundle_id
                         ORDER BY pb.created_at DESC
                     """)
                     bundles = cur.fetchall()
                     
-                    result = []
-                    for bundle in bundles:
-                        bundle_dict = dict(bundle)
-                        articles = [item['supplier_article'] for item in bundle_dict['items']]
-                        bundle_dict['in_stock'] = check_bundle_availability(conn, articles)
-                        result.append(bundle_dict)
+                    result = [dict(bundle) for bundle in bundles]
             
-            return {
+            return finalize_response(event, {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
                 'body': json.dumps(result, ensure_ascii=False, default=str)
-            }
+            }, etag)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     INSERT INTO product_bundles (name, type, color, image_url, price, description)
                     VALUES (%s, %s, %s, %s, %s, %s)
@@ -162,7 +155,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             bundle_id = params.get('id')
             body_data = json.loads(event.get('body', '{}'))
             
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     UPDATE product_bundles 
                     SET name = %s, type = %s, color = %s, image_url = %s, 
@@ -206,7 +199,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters', {})
             bundle_id = params.get('id')
             
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("DELETE FROM bundle_items WHERE bundle_id = %s", (bundle_id,))
                 cur.execute("DELETE FROM product_bundles WHERE id = %s", (bundle_id,))
                 conn.commit()
@@ -227,4 +220,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     finally:
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
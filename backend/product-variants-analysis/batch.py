@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Пакетный анализ вариантов для больших каталогов поставщиков.
+
+Товары читаются серверным курсором порциями, базовые названия считаются
+в пуле процессов, а группы собираются в исходном порядке товаров -
+результат совпадает с analyze_variants байт в байт.
+
+    DATABASE_URL=... python batch.py --workers 4 --output variants.json
+    python batch.py --check
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Set
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from index import (
+    UNGROUPED_PRODUCTS_QUERY, analyze_variants, build_variant_groups, cluster_variants_fuzzy,
+    extract_base_name, fetch_taken_group_ids, json_serial
+)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Фиксированный набор для --check: цвета, размеры, артикулы и одинаковые
+# базовые названия, разнесённые по разным порциям
+CHECK_FIXTURE_TITLES = [
+    'Кровать Айден (1400) белый',
+    'Кровать Айден (1600) белый',
+    'Кровать Айден (1600) серый',
+    'Шкаф Лофт белый',
+    'Шкаф Лофт дуб',
+    'Шкаф Лофт венге',
+    'Вешалка Айден ВШ06-600 белый',
+    'Вешалка Айден ВШ06-800 серый',
+    'Тумба Рио 800х400 черный',
+    'Тумба Рио 1000х400 черный',
+    'Комод Сонома 4 ящика',
+    'Кухня Виктория МДФ',
+    'Кухня Виктория МДФ белый',
+    'Стол обеденный Дели',
+    'Стул Дели серый',
+    'Стул Дели синий',
+    'Гостиная Альфа Дуб/Белый глянец',
+    'Гостиная Альфа Дуб/Графит',
+    'Кровать Айден (1400) серый',
+    'Шкаф Лофт черный',
+    'Прихожая Мори 2.0 белый',
+    'Прихожая Мори 2.0 венге',
+    'Зеркало Нова',
+    'Зеркало Нова',
+    'Полка Stone white',
+    'Полка Stone black',
+    'Кресло Бриз (зеленый)',
+    'Кресло Бриз (бежевый)',
+    'Тумба Рио 800х400 белый',
+    'Матрас Сон (2000)',
+    'Комод Сонома 4 ящика венге',
+    # Разные базовые названия с одинаковыми первыми тремя словами - один и тот же id
+    'Стол обеденный Дели раздвижной белый',
+    'Стол обеденный Дели раздвижной серый',
+    'Стол обеденный Дели круглый белый',
+    'Стол обеденный Дели круглый серый',
+    # Три слова в названии и два размера: при split_sizes размер должен попасть в id
+    'Шкаф-купе Лофт Премиум (1400) белый',
+    'Шкаф-купе Лофт Премиум (1400) серый',
+    'Шкаф-купе Лофт Премиум (1600) белый',
+    'Шкаф-купе Лофт Премиум (1600) серый',
+]
+CHECK_COLLIDING_BASE_NAMES = {'Стол обеденный Дели раздвижной', 'Стол обеденный Дели круглый'}
+
+def normalize_titles(titles: List[str]) -> List[str]:
+    """
+    Работа воркера: базовые названия для порции товаров в том же порядке
+    """
+    return [extract_base_name(title) for title in titles]
+
+def iter_product_chunks(conn, chunk_size: int) -> Iterator[List[Dict]]:
+    """
+    Читает товары без группы серверным курсором, не загружая весь каталог в память
+    """
+    with conn.cursor(name='variant_analysis_batch', cursor_factory=RealDictCursor) as cur:
+        cur.itersize = chunk_size
+        cur.execute(UNGROUPED_PRODUCTS_QUERY)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+def analyze_variants_parallel(chunks: Iterable[List[Dict]], workers: Optional[int] = None,
+                              taken_ids: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Параллельный аналог analyze_variants. Порции нормализуются в пуле процессов, а
+    группы собираются в главном процессе строго в порядке порций, поэтому порядок
+    групп и товаров в них такой же, как при последовательном проходе
+    """
+    workers = workers or os.cpu_count() or 1
+    base_groups = defaultdict(list)
+    total_products = 0
+    
+    def merge(chunk: List[Dict], base_names: List[str]) -> None:
+        for product, base_name in zip(chunk, base_names):
+            if base_name:
+                base_groups[base_name].append(product)
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Не больше двух порций на воркер в работе, чтобы не вычитывать каталог целиком
+        pending = deque()
+        for chunk in chunks:
+            total_products += len(chunk)
+            pending.append((chunk, pool.submit(normalize_titles, [p['title'] for p in chunk])))
+            if len(pending) >= workers * 2:
+                done_chunk, future = pending.popleft()
+                merge(done_chunk, future.result())
+        while pending:
+            done_chunk, future = pending.popleft()
+            merge(done_chunk, future.result())
+    
+    variant_groups = build_variant_groups(base_groups.items(), taken_ids)
+    return {
+        'total_products': total_products,
+        'groups_found': len(variant_groups),
+        'groups': variant_groups
+    }
+
+def split_chunks(products: List[Dict], chunk_size: int) -> Iterator[List[Dict]]:
+    for start in range(0, len(products), chunk_size):
+        yield products[start:start + chunk_size]
+
+def run_check(workers: int) -> bool:
+    """
+    Сверяет параллельный путь с последовательным на фиксированном наборе и проверяет,
+    что группы с совпавшим id не затирают друг друга - и при точном, и при нечётком
+    анализе с разделением по размерам
+    """
+    products = [
+        {
+            'id': idx,
+            'title': title,
+            'supplier_article': None,
+            'category': 'Мебель',
+            'color_variant': None,
+            'stock_quantity': idx % 3,
+            'variant_group_id': None
+        }
+        for idx, title in enumerate(CHECK_FIXTURE_TITLES, 1)
+    ]
+    products.sort(key=lambda p: (p['title'], p['id']))
+    
+    serial_groups = analyze_variants(products)
+    if not serial_groups:
+        print('Набор не дал ни одной группы', file=sys.stderr)
+        return False
+    
+    grouped_names = [group['base_name'] for group in serial_groups.values()]
+    ok = CHECK_COLLIDING_BASE_NAMES <= set(grouped_names) and len(grouped_names) == len(set(grouped_names))
+    print(f"коллизия id групп: {'OK' if ok else 'MISMATCH'}", file=sys.stderr)
+    
+    fuzzy_groups = cluster_variants_fuzzy(products, split_sizes=True)
+    wardrobes = {
+        group_id: len(group['products'])
+        for group_id, group in fuzzy_groups.items() if group['base_name'].startswith('Шкаф-купе Лофт Премиум')
+    }
+    sizes_ok = wardrobes == {'shkafkupe-loft-premium-1400': 2, 'shkafkupe-loft-premium-1600': 2}
+    print(f"размеры в нечёткой группировке: {'OK' if sizes_ok else 'MISMATCH'}", file=sys.stderr)
+    ok = ok and sizes_ok
+    
+    serial = json.dumps(serial_groups, ensure_ascii=False)
+    for chunk_size in (1, 4, 7, len(products)):
+        parallel = analyze_variants_parallel(split_chunks(products, chunk_size), workers)
+        matches = json.dumps(parallel['groups'], ensure_ascii=False) == serial
+        print(f"chunk_size={chunk_size}: {'OK' if matches else 'MISMATCH'}", file=sys.stderr)
+        ok = ok and matches
+    return ok
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Пакетный анализ вариантов товаров')
+    parser.add_argument('--workers', type=int, default=None, help='число процессов (по умолчанию - число ядер)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='товаров в одной порции')
+    parser.add_argument('--output', default='-', help='файл для JSON-результата, "-" - stdout')
+    parser.add_argument('--check', action='store_true', help='сверить с последовательным анализом на фиксированном наборе')
+    args = parser.parse_args()
+    
+    if args.check:
+        return 0 if run_check(args.workers or 2) else 1
+    
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print('DATABASE_URL not configured', file=sys.stderr)
+        return 1
+    
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            taken_ids = fetch_taken_group_ids(cur)
+        result = analyze_variants_parallel(iter_product_chunks(conn, args.chunk_size), args.workers, taken_ids)
+    finally:
+        conn.close()
+    
+    payload = json.dumps(result, default=json_serial, ensure_ascii=False)
+    if args.output == '-':
+        print(payload)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    print(f"Товаров: {result['total_products']}, групп: {result['groups_found']}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
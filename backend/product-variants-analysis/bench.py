@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк горячих функций анализа вариантов на синтетическом каталоге мебели.
+
+Работает без сети и базы: корпус названий генерируется с фиксированным seed.
+Для каждой функции и размера корпуса печатает лучшее время, пропускную
+способность и пиковую память; с --baseline сравнивает с сохранённым прогоном
+и завершается с кодом 1, если что-то замедлилось больше чем на --threshold.
+
+    python bench.py --save-baseline baseline.json
+    python bench.py --baseline baseline.json --threshold 0.2
+    python bench.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, Any, List, Callable
+
+from index import analyze_variants, extract_base_name, extract_color_variant, generate_variant_group_id
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.2
+CORPUS_SEED = 42
+
+CORPUS_TYPES = [
+    'Шкаф', 'Кровать', 'Диван', 'Тумба', 'Вешалка', 'Гостиная', 'Кухня',
+    'Стол', 'Комод', 'Прихожая', 'Стенка', 'Шкаф-купе'
+]
+CORPUS_NAMES = [
+    'Айден', 'Альфа', 'Веста', 'Виктория', 'Мори 2.0', 'ТОКИО', 'ПЕКИН',
+    'МГС 8', 'Лофт', 'Сканди', 'Милан', 'Адель'
+]
+CORPUS_COLORS = [
+    'белый', 'Белый', 'черный', 'серый', 'синий', 'дуб сонома', 'Дуб', 'венге',
+    'орех', 'вишня', 'ясень', 'графит', 'бежевый', 'коричневый', 'white', 'Grey', 'красный'
+]
+CORPUS_MATERIALS = ['ЛДСП', 'МДФ', 'глянец', 'ЛДСП / ЛДСП', '']
+
+def generate_title(rng: random.Random) -> str:
+    """
+    Название в духе каталога поставщика: тип, серия, артикул, цвета, материал, размеры
+    """
+    parts = [rng.choice(CORPUS_TYPES), rng.choice(CORPUS_NAMES)]
+    if rng.random() < 0.4:
+        prefix = rng.choice(['ВШ', 'КМ', 'ОБ', 'ШК', 'ТВ'])
+        parts.append(f'{prefix}{rng.randint(1, 99):02d}-{rng.choice([600, 800, 1000, 1200])}')
+    parts.append(rng.choice(CORPUS_COLORS))
+    if rng.random() < 0.3:
+        parts.append('/ ' + rng.choice(CORPUS_COLORS))
+    parts.append(rng.choice(CORPUS_MATERIALS))
+    if rng.random() < 0.3:
+        parts.append(f'({rng.choice([1200, 1400, 1600, 1800])})')
+    if rng.random() < 0.2:
+        parts.append(f'{rng.choice([1400, 1600])}х{rng.choice([2000, 1900])}')
+    if rng.random() < 0.1:
+        parts.append('(Ц0074620)')
+    return ' '.join(part for part in parts if part)
+
+def generate_corpus(size: int, seed: int = CORPUS_SEED) -> List[Dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            'id': idx,
+            'title': generate_title(rng),
+            'stock_quantity': rng.choice([0, 0, 1, 5, None]),
+            'category': 'Гостиная',
+            'supplier_article': f'08-{147000 + idx}'
+        }
+        for idx in range(1, size + 1)
+    ]
+
+def build_cases(products: List[Dict]) -> Dict[str, Callable[[], Any]]:
+    """
+    Замеряемые функции; каждая обрабатывает весь корпус за вызов
+    """
+    titles = [p['title'] for p in products]
+    base_groups = defaultdict(list)
+    for product in products:
+        base_groups[extract_base_name(product['title'])].append(product)
+    groups = list(base_groups.items())
+    
+    return {
+        'extract_base_name': lambda: [extract_base_name(t) for t in titles],
+        'extract_color_variant': lambda: [extract_color_variant(t) for t in titles],
+        'generate_variant_group_id': lambda: [generate_variant_group_id(name, group) for name, group in groups],
+        'analyze_variants': lambda: analyze_variants(products)
+    }
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """
+    Лучшее время из repeat запусков и пиковая память отдельным запуском под tracemalloc
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {'seconds': best, 'peak_kb': peak / 1024}
+
+def run_benchmarks(sizes: List[int], repeat: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for size in sizes:
+        products = generate_corpus(size)
+        for name, func in build_cases(products).items():
+            stats = measure(func, repeat)
+            stats['items_per_sec'] = size / stats['seconds'] if stats['seconds'] else 0.0
+            key = f'{name}[{size}]'
+            results[key] = stats
+            print(
+                f"{key:<36} {stats['seconds'] * 1000:>10.1f} ms "
+                f"{stats['items_per_sec']:>12,.0f} items/s {stats['peak_kb']:>10,.0f} KiB peak"
+            )
+    return results
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """
+    Замедления больше threshold (доля) относительно базового прогона
+    """
+    regressions = []
+    for key, stats in results.items():
+        base = baseline.get(key)
+        if not base or not base.get('seconds'):
+            continue
+        slowdown = stats['seconds'] / base['seconds'] - 1
+        if slowdown > threshold:
+            regressions.append(
+                f"{key}: {base['seconds'] * 1000:.1f} ms -> {stats['seconds'] * 1000:.1f} ms (+{slowdown:.0%})"
+            )
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк анализа вариантов товаров')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='размеры корпуса')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='запусков на замер, берётся лучший')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='допустимое замедление, доля (0.2 = 20%%)')
+    parser.add_argument('--save-baseline', help='сохранить результаты как базовый прогон')
+    args = parser.parse_args()
+    
+    results = run_benchmarks(args.sizes, args.repeat)
+    
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f'\nЗамедление больше {args.threshold:.0%}:', file=sys.stderr)
+            for line in regressions:
+                print(f'  {line}', file=sys.stderr)
+            return 1
+        print(f'\nРегрессий больше {args.threshold:.0%} нет')
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
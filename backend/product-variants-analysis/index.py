@@ -1,12 +1,84 @@
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any, List
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Dict, Any, List, Iterable, Tuple, Set, Optional
 from decimal import Decimal
 from datetime import datetime
 import re
-from collections import defaultdict
+import zlib
+import hashlib
+import random
+from collections import defaultdict, Counter
+from db import get_db_connection, release_db_connection
+from http_response import data_versions, finalize_response, make_etag, matched_etag, not_modified_response
+from slugs import TRANSLIT_MAP
+
+# Цвета, вырезаемые из базового названия (русские и английские)
+BASE_NAME_COLORS = [
+    'белый', 'черный', 'серый', 'синий', 'красный', 'зеленый', 'желтый',
+    'коричневый', 'бежевый', 'розовый', 'фиолетовый', 'оранжевый',
+    'венге', 'дуб', 'орех', 'вишня', 'ясень', 'сонома',
+    'white', 'black', 'gray', 'grey', 'blue', 'red', 'green', 'yellow',
+    'brown', 'beige', 'pink', 'purple', 'orange'
+]
+
+# Цвет в названии -> color_variant; порядок задаёт приоритет при нескольких цветах
+COLOR_VARIANTS = {
+    'белый': 'white',
+    'черный': 'black',
+    'серый': 'grey',
+    'синий': 'blue',
+    'красный': 'red',
+    'зеленый': 'green',
+    'коричневый': 'brown',
+    'бежевый': 'beige',
+    'венге': 'wenge',
+    'дуб': 'oak',
+    'орех': 'walnut',
+    'сонома': 'sonoma'
+}
+
+# Цвета, по которым группа считается явными вариантами
+VARIANT_MARKER_COLORS = ['белый', 'черный', 'серый', 'синий', 'коричневый', 'венге']
+
+# Регулярки компилируются один раз при импорте: всё, что вырезается из базового
+# названия, собрано в одну альтернацию и удаляется за один проход
+_BASE_NAME_STRIP_RE = re.compile(
+    r'\([^)]*\)'                      # всё в скобках, включая размеры (1400)
+    r'|\b[А-Я]{2,}\d{2,}-\d{3,}\b'    # коды типа ВШ06-600
+    r'|\b\d{3,}х\d{3,}\b'             # размеры типа 1400х2000
+    r'|(?i:\b(?:' + '|'.join(BASE_NAME_COLORS) + r')\b)'
+)
+_SIZE_RE = re.compile(r'\((\d{3,})\)')
+_ARTICLE_RE = re.compile(r'([А-Я]{2,}\d{2,}-\d{3,})')
+_ARTICLE_PREFIX_RE = re.compile(r'([А-Я]{2,}\d{2,})')
+_VARIANT_MARKER_RE = re.compile('|'.join(VARIANT_MARKER_COLORS))
+_DIMENSIONS_RE = re.compile(r'\b(\d{3,}х\d{3,})\b')
+_TOKEN_RE = re.compile(r'\w+')
+
+# Нечёткая кластеризация: MinHash-подписи из MINHASH_BANDS полос по MINHASH_ROWS строк.
+# Пара с похожестью 0.6 попадает в общую корзину с вероятностью ~0.98,
+# кандидаты затем проверяются точным коэффициентом Жаккара
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+MINHASH_BANDS = 16
+MINHASH_ROWS = 3
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(20241020)
+_MINHASH_PERMUTATIONS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(0, _MINHASH_PRIME))
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+# NDJSON-отчёт отдаётся страницами по группам, чтобы большие анализы не упирались в таймаут.
+# Анализ считается один раз на первой странице, остальные читаются из снимка variant_reports
+DEFAULT_NDJSON_LIMIT = 200
+MAX_NDJSON_LIMIT = 1000
+VARIANT_REPORT_TTL_HOURS = 24
+
+# Версия данных для ETag отчёта: любая правка товаров (в том числе применение группировки)
+# меняет версию products в data_versions, а инкрементальный отчёт зависит ещё и от
+# отметки прошлого прогона
+ANALYSIS_VERSION_SOURCES = ['products']
 
 def json_serial(obj):
     if isinstance(obj, Decimal):
@@ -19,25 +91,7 @@ def extract_base_name(title: str) -> str:
     """
     Извлекает базовое название товара без цвета, размера и артикула
     """
-    # Удаляем артикулы в скобках и коды типа ВШ06-600, КМ-800, ОБ-600
-    title = re.sub(r'\([^)]*\)', '', title)
-    title = re.sub(r'\b[А-Я]{2,}\d{2,}-\d{3,}\b', '', title)
-    title = re.sub(r'\b\d{3,}х\d{3,}\b', '', title)  # размеры типа 1400х2000
-    
-    # Удаляем цвета (русские и английские)
-    colors = [
-        'белый', 'черный', 'серый', 'синий', 'красный', 'зеленый', 'желтый',
-        'коричневый', 'бежевый', 'розовый', 'фиолетовый', 'оранжевый',
-        'венге', 'дуб', 'орех', 'вишня', 'ясень', 'сонома',
-        'white', 'black', 'gray', 'grey', 'blue', 'red', 'green', 'yellow',
-        'brown', 'beige', 'pink', 'purple', 'orange'
-    ]
-    
-    for color in colors:
-        title = re.sub(r'\b' + color + r'\b', '', title, flags=re.IGNORECASE)
-    
-    # Удаляем размеры в скобках типа (1400), (1600)
-    title = re.sub(r'\(\d{3,}\)', '', title)
+    title = _BASE_NAME_STRIP_RE.sub('', title)
     
     # Удаляем лишние пробелы
     title = ' '.join(title.split())
@@ -49,60 +103,41 @@ def extract_color_variant(title: str) -> str:
     Извлекает цвет/размер из названия товара
     """
     # Ищем размеры в скобках
-    size_match = re.search(r'\((\d{3,})\)', title)
+    size_match = _SIZE_RE.search(title)
     if size_match:
         return size_match.group(1)
     
-    # Ищем цвета
-    colors = {
-        'белый': 'white',
-        'черный': 'black',
-        'серый': 'grey',
-        'синий': 'blue',
-        'красный': 'red',
-        'зеленый': 'green',
-        'коричневый': 'brown',
-        'бежевый': 'beige',
-        'венге': 'wenge',
-        'дуб': 'oak',
-        'орех': 'walnut',
-        'сонома': 'sonoma'
-    }
-    
+    # Ищем цвета; при нескольких совпадениях побеждает цвет, стоящий раньше в COLOR_VARIANTS.
+    # Проверка подстрок по готовому словарю быстрее альтернации из 12 слов с выбором приоритета
     title_lower = title.lower()
-    for ru_color, en_color in colors.items():
+    for ru_color, en_color in COLOR_VARIANTS.items():
         if ru_color in title_lower:
             return en_color
     
     # Ищем артикулы как вариант
-    article_match = re.search(r'([А-Я]{2,}\d{2,}-\d{3,})', title)
+    article_match = _ARTICLE_RE.search(title)
     if article_match:
         return article_match.group(1).lower()
     
     return 'default'
 
-def generate_variant_group_id(base_name: str, products: List[Dict]) -> str:
+def generate_variant_group_id(base_name: str, products: List[Dict], size: str = '') -> str:
     """
-    Генерирует variant_group_id в формате kebab-case
+    Генерирует variant_group_id в формате kebab-case; size (группы нечёткого
+    анализа с split_sizes) всегда дописывается в конец
     """
     # Берем первые слова базового названия
-    words = base_name.lower().split()[:3]
-    
-    # Транслитерация
-    translit_map = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-    }
+    words = base_name.lower().split()
+    if size and words and words[-1] == size:
+        words = words[:-1]
+    words = words[:3]
     
     result = []
     for word in words:
         transliterated = ''
         for char in word:
-            if char in translit_map:
-                transliterated += translit_map[char]
+            if char in TRANSLIT_MAP:
+                transliterated += TRANSLIT_MAP[char]
             elif char.isalnum():
                 transliterated += char
         if transliterated:
@@ -111,33 +146,56 @@ def generate_variant_group_id(base_name: str, products: List[Dict]) -> str:
     # Если есть общий артикул, добавляем его
     if len(products) > 0:
         first_title = products[0]['title']
-        article_match = re.search(r'([А-Я]{2,}\d{2,})', first_title)
+        article_match = _ARTICLE_PREFIX_RE.search(first_title)
         if article_match and len(result) > 0:
             article = article_match.group(1).lower()
             if article not in '-'.join(result):
                 result.append(article)
     
-    return '-'.join(result)[:50]  # ограничиваем длину
+    group_id = '-'.join(result)[:50]  # ограничиваем длину
+    if size:
+        # Иначе у названий из трёх слов и больше размер отрезается и id групп разных размеров совпадают
+        group_id = f'{group_id[:50 - len(size) - 1]}-{size}'
+    return group_id
 
-def analyze_variants(products: List[Dict]) -> Dict[str, List[Dict]]:
+def disambiguate_group_id(group_id: str, taken: Set[str]) -> str:
     """
-    Анализирует товары и группирует их по вариантам
+    Добавляет суффикс -2, -3... к id, уже занятому другой группой: разные базовые названия
+    с одинаковыми первыми словами иначе попали бы под один variant_group_id
+    """
+    candidate = group_id
+    n = 2
+    while candidate in taken:
+        suffix = f'-{n}'
+        candidate = group_id[:50 - len(suffix)] + suffix
+        n += 1
+    return candidate
+
+def build_variant_entry(product: Dict, color_variant: str) -> Dict:
+    return {
+        'id': product['id'],
+        'title': product['title'],
+        'color_variant': color_variant,
+        'stock_quantity': product.get('stock_quantity', 0),
+        'category': product.get('category', ''),
+        'supplier_article': product.get('supplier_article', '')
+    }
+
+def build_variant_groups(base_groups: Iterable[Tuple[str, List[Dict]]],
+                         taken_ids: Optional[Set[str]] = None,
+                         sizes: Optional[Dict[str, str]] = None) -> Dict[str, Dict]:
+    """
+    Оставляет группы из нескольких товаров, похожие на варианты, и раскладывает их по variant_group_id.
+    Совпавшие id (в том числе с taken_ids - группами, уже записанными в БД) получают суффикс.
+    sizes - размер группы по её базовому названию, он входит в id
     """
-    # Группируем по базовому названию
-    base_groups = defaultdict(list)
-    
-    for product in products:
-        base_name = extract_base_name(product['title'])
-        if base_name:  # Игнорируем пустые названия
-            base_groups[base_name].append(product)
-    
-    # Фильтруем группы - оставляем только те, где больше 1 товара
     variant_groups = {}
+    taken = set(taken_ids or ())
     
-    for base_name, group_products in base_groups.items():
+    for base_name, group_products in base_groups:
         if len(group_products) > 1:
             # Проверяем, что товары действительно похожи (есть в наличии или явно варианты)
-            has_stock = any(p.get('stock_quantity', 0) > 0 for p in group_products)
+            has_stock = any((p.get('stock_quantity') or 0) > 0 for p in group_products)
             
             # Проверяем на явные варианты (разные цвета/размеры)
             variants_detected = False
@@ -146,40 +204,525 @@ def analyze_variants(products: List[Dict]) -> Dict[str, List[Dict]]:
                 sizes_found = set()
                 
                 for p in group_products:
-                    title = p['title'].lower()
                     # Ищем цвета
-                    if any(color in title for color in ['белый', 'черный', 'серый', 'синий', 'коричневый', 'венге']):
+                    if _VARIANT_MARKER_RE.search(p['title'].lower()):
                         colors_found.add(True)
                     # Ищем размеры
-                    if re.search(r'\(\d{3,}\)', p['title']):
+                    if _SIZE_RE.search(p['title']):
                         sizes_found.add(True)
                 
                 variants_detected = len(colors_found) > 0 or len(sizes_found) > 0
             
             if has_stock or variants_detected:
-                group_id = generate_variant_group_id(base_name, group_products)
+                size = (sizes or {}).get(base_name, '')
+                group_id = disambiguate_group_id(generate_variant_group_id(base_name, group_products, size), taken)
+                taken.add(group_id)
                 variant_groups[group_id] = {
                     'base_name': base_name,
                     'products': []
                 }
                 
                 for product in group_products:
-                    color_variant = extract_color_variant(product['title'])
-                    variant_groups[group_id]['products'].append({
-                        'id': product['id'],
-                        'title': product['title'],
-                        'color_variant': color_variant,
-                        'stock_quantity': product.get('stock_quantity', 0),
-                        'category': product.get('category', ''),
-                        'supplier_article': product.get('supplier_article', '')
-                    })
+                    variant_groups[group_id]['products'].append(
+                        build_variant_entry(product, extract_color_variant(product['title']))
+                    )
     
     return variant_groups
 
+def analyze_variants(products: List[Dict], taken_ids: Optional[Set[str]] = None) -> Dict[str, List[Dict]]:
+    """
+    Анализирует товары и группирует их по вариантам
+    """
+    # Группируем по базовому названию
+    base_groups = defaultdict(list)
+    
+    for product in products:
+        base_name = extract_base_name(product['title'])
+        if base_name:  # Игнорируем пустые названия
+            base_groups[base_name].append(product)
+    
+    return build_variant_groups(base_groups.items(), taken_ids)
+
+def name_shingles(base_name: str) -> Set[str]:
+    """
+    Шинглы базового названия: слова целиком и символьные триграммы каждого слова
+    """
+    tokens = _TOKEN_RE.findall(base_name.lower().replace('ё', 'е'))
+    shingles = set(tokens)
+    for token in tokens:
+        padded = f' {token} '
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingles
+
+def minhash_signature(shingles: Set[str]) -> List[int]:
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+    return [min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PERMUTATIONS]
+
+def extract_size(title: str) -> str:
+    size_match = _SIZE_RE.search(title) or _DIMENSIONS_RE.search(title)
+    return size_match.group(1) if size_match else ''
+
+def cluster_variants_fuzzy(products: List[Dict], threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                           split_sizes: bool = False, taken_ids: Optional[Set[str]] = None) -> Dict[str, Dict]:
+    """
+    Группирует товары с похожими (а не только совпадающими) базовыми названиями.
+    MinHash + LSH дают кандидатов без сравнения всех пар, кандидаты проверяются
+    точным коэффициентом Жаккара по шинглам. С split_sizes товары разных
+    размеров вроде (1400) и (1600) разводятся по отдельным группам
+    """
+    products_by_name = defaultdict(list)
+    for product in products:
+        base_name = extract_base_name(product['title'])
+        if base_name:
+            products_by_name[base_name].append(product)
+    
+    # Лидеры кластеров - самые частые названия; остальные присоединяются к самому похожему
+    # лидеру, а не к любому соседу, чтобы похожие названия не сцеплялись в одну цепочку
+    names = sorted(products_by_name, key=lambda n: (-len(products_by_name[n]), n))
+    shingles = [name_shingles(name) for name in names]
+    
+    leader_of = list(range(len(names)))
+    leader_buckets = defaultdict(list)
+    for idx, name_shingle_set in enumerate(shingles):
+        if not name_shingle_set:
+            continue
+        signature = minhash_signature(name_shingle_set)
+        band_keys = [
+            (band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+            for band in range(MINHASH_BANDS)
+        ]
+        
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(leader_buckets.get(band_key, ()))
+        
+        best_leader, best_similarity = None, 0.0
+        for leader in sorted(candidates):
+            similarity = len(name_shingle_set & shingles[leader]) / len(name_shingle_set | shingles[leader])
+            if similarity >= threshold and similarity > best_similarity:
+                best_leader, best_similarity = leader, similarity
+        
+        if best_leader is None:
+            for band_key in band_keys:
+                leader_buckets[band_key].append(idx)
+        else:
+            leader_of[idx] = best_leader
+    
+    clusters = defaultdict(list)
+    for idx, name in enumerate(names):
+        for product in products_by_name[name]:
+            size = extract_size(product['title']) if split_sizes else ''
+            clusters[(leader_of[idx], size)].append(product)
+    
+    base_groups = []
+    sizes = {}
+    for (_, size), group_products in sorted(clusters.items()):
+        # Название группы - самое частое базовое название среди её товаров
+        name_counts = Counter(extract_base_name(p['title']) for p in group_products)
+        base_name = min(name_counts, key=lambda n: (-name_counts[n], n))
+        if size:
+            base_name = f'{base_name} {size}'
+            sizes[base_name] = size
+        base_groups.append((base_name, group_products))
+    
+    return build_variant_groups(base_groups, taken_ids, sizes)
+
+def parse_analysis_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Проверяет параметры анализа из query или тела POST до выборки товаров.
+    Ошибка - ValueError с текстом для ответа 400
+    """
+    clustering = options.get('clustering') or 'exact'
+    if clustering not in ('exact', 'fuzzy'):
+        raise ValueError('clustering must be exact or fuzzy')
+    
+    threshold = options.get('threshold')
+    if threshold is None or threshold == '':
+        threshold = DEFAULT_SIMILARITY_THRESHOLD
+    else:
+        try:
+            threshold = float(threshold)
+        except (TypeError, ValueError) as e:
+            raise ValueError('threshold must be a number') from e
+    if not 0 < threshold <= 1:
+        raise ValueError('threshold must be in (0, 1]')
+    
+    incremental = options.get('incremental') in (True, 'true')
+    if incremental and clustering == 'fuzzy':
+        raise ValueError('incremental mode supports exact clustering only')
+    
+    return {
+        'clustering': clustering,
+        'threshold': threshold,
+        'split_sizes': options.get('split_sizes') in (True, 'true'),
+        'incremental': incremental
+    }
+
+def run_analysis(products: List[Dict], options: Dict[str, Any], taken_ids: Optional[Set[str]] = None) -> Dict[str, Dict]:
+    """
+    Выбирает способ группировки по разобранным parse_analysis_options параметрам:
+    clustering=fuzzy (threshold, split_sizes) или точное совпадение
+    """
+    if options['clustering'] != 'fuzzy':
+        return analyze_variants(products, taken_ids)
+    return cluster_variants_fuzzy(products, options['threshold'], options['split_sizes'], taken_ids)
+
+UNGROUPED_PRODUCTS_QUERY = '''
+    SELECT id, title, supplier_article, category, color_variant, stock_quantity, variant_group_id
+    FROM products
+    WHERE variant_group_id IS NULL OR variant_group_id = ''
+    ORDER BY title, id
+'''
+
+def fetch_ungrouped_products(cur) -> List[Dict]:
+    cur.execute(UNGROUPED_PRODUCTS_QUERY)
+    return [dict(p) for p in cur.fetchall()]
+
+def fetch_taken_group_ids(cur) -> Set[str]:
+    """variant_group_id, уже записанные товарам: новые группы не должны с ними совпасть"""
+    cur.execute("SELECT DISTINCT variant_group_id FROM products WHERE variant_group_id IS NOT NULL AND variant_group_id <> ''")
+    return {row['variant_group_id'] for row in cur.fetchall()}
+
+def title_fingerprint(title: str) -> str:
+    return hashlib.md5(title.encode('utf-8')).hexdigest()
+
+def fetch_analysis_watermark(cur, lock: bool = False) -> Optional[int]:
+    """
+    Возвращает горизонт транзакций прошлого прогона; с lock=True блокирует состояние до конца транзакции
+    """
+    cur.execute(
+        'SELECT last_tx_horizon FROM variant_analysis_state WHERE id = 1' + (' FOR UPDATE' if lock else '')
+    )
+    row = cur.fetchone()
+    return row['last_tx_horizon'] if row else None
+
+def current_tx_horizon(cur) -> int:
+    """Самая старая незавершённая транзакция-писатель: все транзакции ниже уже закоммичены или откачены"""
+    cur.execute('SELECT txid_snapshot_xmin(txid_current_snapshot()) AS horizon')
+    return cur.fetchone()['horizon']
+
+def fetch_changed_products(cur, since: Optional[int]) -> List[Dict]:
+    """
+    Товары, изменённые транзакциями не ниже горизонта прошлого прогона, с сохранёнными отпечатками.
+    Транзакции, шедшие во время прошлого прогона, попадают и в него, и в этот - повтор безвреден,
+    отпечатки отсеивают уже обработанные названия
+    """
+    cur.execute('''
+        SELECT p.id, p.title, p.supplier_article, p.category, p.color_variant, p.stock_quantity,
+               p.variant_group_id, f.base_name, f.title_hash
+        FROM products p
+        LEFT JOIN product_variant_fingerprints f ON f.product_id = p.id
+        WHERE %s::bigint IS NULL OR p.change_tx >= %s
+        ORDER BY p.id
+    ''', (since, since))
+    return [dict(p) for p in cur.fetchall()]
+
+def fetch_group_members(cur, base_names: List[str], exclude_ids: List[int]) -> List[Dict]:
+    """
+    Уже проанализированные товары с теми же базовыми названиями, включая сгруппированные
+    """
+    if not base_names:
+        return []
+    cur.execute('''
+        SELECT p.id, p.title, p.supplier_article, p.category, p.color_variant, p.stock_quantity,
+               p.variant_group_id, f.base_name
+        FROM product_variant_fingerprints f
+        JOIN products p ON p.id = f.product_id
+        WHERE f.base_name = ANY(%s) AND NOT (p.id = ANY(%s))
+        ORDER BY p.id
+    ''', (base_names, exclude_ids))
+    return [dict(p) for p in cur.fetchall()]
+
+def analyze_variants_incremental(cur, since: Optional[int]) -> Dict[str, Any]:
+    """
+    Анализирует только товары, изменённые после прошлого прогона.
+    Базовое название пересчитывается лишь при смене названия (по хэшу), новые товары
+    присоединяются к уже существующим группам с тем же базовым названием
+    """
+    # Горизонт берётся до выборки: всё, что ниже него, выборка уже видит
+    watermark = current_tx_horizon(cur)
+    changed_products = fetch_changed_products(cur, since)
+    
+    fingerprints = []
+    members_by_name = defaultdict(dict)
+    for product in changed_products:
+        title_hash = title_fingerprint(product['title'])
+        title_changed = title_hash != product.pop('title_hash')
+        if title_changed:
+            product['base_name'] = extract_base_name(product['title'])
+            fingerprints.append((product['id'], product['base_name'], title_hash))
+        
+        # Сгруппированные товары без смены названия (в том числе после нашего же apply) не трогаем
+        if product['base_name'] and (title_changed or not product['variant_group_id']):
+            members_by_name[product['base_name']][product['id']] = product
+    
+    changed_ids = [p['id'] for p in changed_products]
+    for product in fetch_group_members(cur, sorted(members_by_name), changed_ids):
+        members_by_name[product['base_name']][product['id']] = product
+    
+    variant_groups = {}
+    new_base_groups = []
+    for base_name in sorted(members_by_name):
+        group_products = list(members_by_name[base_name].values())
+        existing_ids = Counter(p['variant_group_id'] for p in group_products if p['variant_group_id'])
+        if not existing_ids:
+            new_base_groups.append((base_name, group_products))
+            continue
+        
+        # Есть готовая группа - новые товары вливаются в самую многочисленную
+        group_id = min(existing_ids, key=lambda g: (-existing_ids[g], g))
+        group = variant_groups.setdefault(group_id, {'base_name': base_name, 'products': []})
+        for product in group_products:
+            if product['variant_group_id'] == group_id:
+                group['products'].append(build_variant_entry(product, product['color_variant']))
+            elif not product['variant_group_id']:
+                group['products'].append(build_variant_entry(product, extract_color_variant(product['title'])))
+    
+    # Новые группы не сливаются с существующими, даже если id совпал по первым словам названия
+    variant_groups.update(build_variant_groups(new_base_groups, fetch_taken_group_ids(cur) | set(variant_groups)))
+    
+    return {
+        'groups': variant_groups,
+        'products': [p for members in members_by_name.values() for p in members.values()],
+        'changed_products': len(changed_products),
+        'fingerprints': fingerprints,
+        'watermark': watermark
+    }
+
+def save_analysis_state(cur, fingerprints: List[Tuple[int, str, str]], watermark: int) -> None:
+    """
+    Сохраняет новые отпечатки и сдвигает отметку последнего прогона
+    """
+    if fingerprints:
+        execute_values(
+            cur,
+            '''
+                INSERT INTO product_variant_fingerprints (product_id, base_name, title_hash)
+                VALUES %s
+                ON CONFLICT (product_id) DO UPDATE
+                SET base_name = EXCLUDED.base_name, title_hash = EXCLUDED.title_hash, analyzed_at = CURRENT_TIMESTAMP
+            ''',
+            fingerprints,
+            page_size=len(fingerprints)
+        )
+    cur.execute(
+        'UPDATE variant_analysis_state SET last_tx_horizon = %s, last_run_at = CURRENT_TIMESTAMP WHERE id = 1',
+        (watermark,)
+    )
+
+def build_grouping_changes(products: List[Dict], variant_groups: Dict[str, Dict]) -> List[Dict]:
+    """
+    Сравнивает найденные группы с текущими значениями и возвращает только реальные изменения
+    """
+    current = {p['id']: p for p in products}
+    changes = []
+    for group_id, group_data in variant_groups.items():
+        for product in group_data['products']:
+            before = current[product['id']]
+            if before.get('variant_group_id') == group_id and before.get('color_variant') == product['color_variant']:
+                continue
+            changes.append({
+                'id': product['id'],
+                'title': product['title'],
+                'before': {
+                    'variant_group_id': before.get('variant_group_id'),
+                    'color_variant': before.get('color_variant')
+                },
+                'after': {
+                    'variant_group_id': group_id,
+                    'color_variant': product['color_variant']
+                }
+            })
+    changes.sort(key=lambda c: c['id'])
+    return changes
+
+def apply_grouping(cur, changes: List[Dict]) -> Dict[str, Any]:
+    """
+    Записывает группы одним UPDATE ... FROM (VALUES ...) и сохраняет прогон для отката.
+    Обновляются только товары, которые всё ещё без группы, поэтому повторный запуск ничего не меняет
+    """
+    if not changes:
+        return {'runId': None, 'applied': 0}
+    
+    updated = execute_values(
+        cur,
+        '''
+            UPDATE products AS p
+            SET variant_group_id = v.variant_group_id, color_variant = v.color_variant, updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, variant_group_id, color_variant)
+            WHERE p.id = v.id AND (p.variant_group_id IS NULL OR p.variant_group_id = '')
+            RETURNING p.id
+        ''',
+        [(c['id'], c['after']['variant_group_id'], c['after']['color_variant']) for c in changes],
+        template='(%s::integer, %s::varchar, %s::varchar)',
+        page_size=len(changes),
+        fetch=True
+    )
+    updated_ids = {row['id'] for row in updated}
+    applied_changes = [c for c in changes if c['id'] in updated_ids]
+    if not applied_changes:
+        # Все товары уже сгруппированы параллельным прогоном - откатывать нечего
+        return {'runId': None, 'applied': 0}
+    
+    cur.execute(
+        'INSERT INTO variant_grouping_runs (changes, products_changed) VALUES (%s::jsonb, %s) RETURNING id',
+        (json.dumps(applied_changes, ensure_ascii=False), len(applied_changes))
+    )
+    return {'runId': cur.fetchone()['id'], 'applied': len(applied_changes)}
+
+def undo_grouping(cur, run_id: Any) -> Dict[str, Any]:
+    """
+    Откатывает прогон apply: возвращает прежние значения товарам, которые с тех пор не меняли вручную
+    """
+    if run_id:
+        cur.execute('SELECT id, changes, undone_at FROM variant_grouping_runs WHERE id = %s FOR UPDATE', (run_id,))
+    else:
+        cur.execute('SELECT id, changes, undone_at FROM variant_grouping_runs WHERE undone_at IS NULL ORDER BY id DESC LIMIT 1 FOR UPDATE')
+    run = cur.fetchone()
+    if not run:
+        raise LookupError('Grouping run not found')
+    if run['undone_at']:
+        raise ValueError(f"Grouping run {run['id']} is already undone")
+    
+    changes = run['changes']
+    restored = []
+    if changes:
+        restored = execute_values(
+            cur,
+            '''
+                UPDATE products AS p
+                SET variant_group_id = v.old_group_id, color_variant = v.old_color_variant, updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(id, old_group_id, old_color_variant, new_group_id, new_color_variant)
+                WHERE p.id = v.id
+                  AND p.variant_group_id IS NOT DISTINCT FROM v.new_group_id
+                  AND p.color_variant IS NOT DISTINCT FROM v.new_color_variant
+                RETURNING p.id
+            ''',
+            [(
+                c['id'],
+                c['before']['variant_group_id'],
+                c['before']['color_variant'],
+                c['after']['variant_group_id'],
+                c['after']['color_variant']
+            ) for c in changes],
+            template='(%s::integer, %s::varchar, %s::varchar, %s::varchar, %s::varchar)',
+            page_size=len(changes),
+            fetch=True
+        )
+    
+    cur.execute('UPDATE variant_grouping_runs SET undone_at = CURRENT_TIMESTAMP WHERE id = %s', (run['id'],))
+    return {
+        'runId': run['id'],
+        'restored': len(restored),
+        'skipped': len(changes) - len(restored)
+    }
+
+def analysis_etag(cur, event: Dict[str, Any]) -> str:
+    """
+    Сильный ETag из версии каталога, состояния инкрементального анализа и
+    параметров запроса - без повторного анализа
+    """
+    return make_etag(
+        data_versions(cur, ANALYSIS_VERSION_SOURCES), fetch_analysis_watermark(cur),
+        event.get('queryStringParameters') or {}
+    )
+
+def parse_ndjson_page(params: Dict[str, Any]) -> Tuple[int, Optional[str], Optional[int]]:
+    """limit, after и report страницы NDJSON-отчёта; ошибка - ValueError с текстом для ответа 400"""
+    limit = params.get('limit')
+    if limit is None or limit == '':
+        limit = DEFAULT_NDJSON_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError) as e:
+            raise ValueError('limit must be an integer') from e
+    if not 1 <= limit <= MAX_NDJSON_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_NDJSON_LIMIT}')
+    
+    report_id = params.get('report')
+    if report_id:
+        try:
+            report_id = int(report_id)
+        except ValueError as e:
+            raise ValueError('report must be an integer') from e
+    else:
+        report_id = None
+    after = params.get('after') or None
+    if after and report_id is None:
+        raise ValueError('after requires report from the first page')
+    return limit, after, report_id
+
+def save_report_snapshot(cur, result: Dict[str, Any]) -> int:
+    """
+    Сохраняет сводку и группы отчёта; заодно удаляет снимки старше VARIANT_REPORT_TTL_HOURS
+    """
+    cur.execute(
+        "DELETE FROM variant_reports WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'",
+        (VARIANT_REPORT_TTL_HOURS,)
+    )
+    summary = {key: value for key, value in result.items() if key != 'groups'}
+    cur.execute(
+        'INSERT INTO variant_reports (summary) VALUES (%s::jsonb) RETURNING id',
+        (json.dumps(summary, default=json_serial, ensure_ascii=False),)
+    )
+    report_id = cur.fetchone()['id']
+    
+    groups = result['groups']
+    if groups:
+        execute_values(
+            cur,
+            'INSERT INTO variant_report_groups (report_id, group_id, data) VALUES %s',
+            [
+                (report_id, group_id, json.dumps(group, default=json_serial, ensure_ascii=False))
+                for group_id, group in groups.items()
+            ],
+            template='(%s, %s, %s::jsonb)',
+            page_size=len(groups)
+        )
+    return report_id
+
+def fetch_report_page(cur, report_id: int, after: Optional[str], limit: int) -> Dict[str, Any]:
+    """
+    Страница снимка по group_id после after; LookupError, если снимок удалён или не существовал
+    """
+    cur.execute('SELECT summary FROM variant_reports WHERE id = %s', (report_id,))
+    report = cur.fetchone()
+    if not report:
+        raise LookupError(f'Report {report_id} not found or expired, request the first page again')
+    
+    cur.execute(
+        '''
+            SELECT group_id, data FROM variant_report_groups
+            WHERE report_id = %s AND (%s::varchar IS NULL OR group_id > %s)
+            ORDER BY group_id
+            LIMIT %s
+        ''',
+        (report_id, after, after, limit + 1)
+    )
+    rows = cur.fetchall()
+    return {
+        'summary': report['summary'],
+        'groups': rows[:limit],
+        'next_after': rows[limit - 1]['group_id'] if len(rows) > limit else None
+    }
+
+def build_ndjson_report(report_id: int, page: Dict[str, Any]) -> str:
+    """
+    Отчёт построчно: summary, затем по строке на группу в порядке group_id и end с курсором.
+    Следующая страница запрашивается с report=<reportId>&after=<nextAfter> и читается из того же
+    снимка, поэтому прерванную выгрузку можно продолжить, а страницы между собой согласованы
+    """
+    lines = [json.dumps({'type': 'summary', 'reportId': report_id, **page['summary']}, default=json_serial, ensure_ascii=False)]
+    for row in page['groups']:
+        lines.append(json.dumps({'type': 'group', 'group_id': row['group_id'], **row['data']}, ensure_ascii=False))
+    lines.append(json.dumps({'type': 'end', 'reportId': report_id, 'nextAfter': page['next_after']}, ensure_ascii=False))
+    return '\n'.join(lines) + '\n'
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Анализ товаров для группировки вариантов
-    Args: event - dict с httpMethod
+    Business: Анализ товаров для группировки вариантов и применение/откат группировки
+    Args: event - dict с httpMethod (GET - отчёт, с format=ndjson построчно; POST - apply/undo), body
           context - объект с request_id, function_name
     Returns: HTTP response dict с группами вариантов
     '''
@@ -190,14 +733,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    if method != 'GET':
+    if method not in ('GET', 'POST'):
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -216,35 +759,161 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cur = None
     
     try:
-        conn = psycopg2.connect(database_url)
+        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Выполняем запрос
-        cur.execute('''
-            SELECT id, title, supplier_article, category, color_variant, stock_quantity
-            FROM products
-            WHERE variant_group_id IS NULL OR variant_group_id = ''
-            ORDER BY title
-        ''')
+        if method == 'POST':
+            try:
+                body_data = json.loads(event.get('body') or '{}')
+            except json.JSONDecodeError:
+                body_data = None
+            if not isinstance(body_data, dict):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Body must be a JSON object'})
+                }
+            mode = body_data.get('mode', 'apply')
+            
+            if mode == 'undo':
+                try:
+                    result = undo_grouping(cur, body_data.get('runId'))
+                except LookupError as e:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)})
+                    }
+                except ValueError as e:
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)})
+                    }
+                conn.commit()
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(result)
+                }
+            
+            if mode != 'apply':
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'mode must be apply or undo'})
+                }
+            
+            try:
+                options = parse_analysis_options(body_data)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)})
+                }
+            
+            dry_run = body_data.get('dryRun', False)
+            incremental = options['incremental']
+            if incremental:
+                analysis = analyze_variants_incremental(cur, fetch_analysis_watermark(cur, lock=not dry_run))
+                changes = build_grouping_changes(analysis['products'], analysis['groups'])
+            else:
+                products_list = fetch_ungrouped_products(cur)
+                changes = build_grouping_changes(products_list, run_analysis(products_list, options, fetch_taken_group_ids(cur)))
+            
+            if dry_run:
+                result = {'dryRun': True, 'changes': changes}
+            else:
+                result = apply_grouping(cur, changes)
+                if incremental:
+                    save_analysis_state(cur, analysis['fingerprints'], analysis['watermark'])
+                    result['changedProducts'] = analysis['changed_products']
+                conn.commit()
+                result['dryRun'] = False
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(result, default=json_serial, ensure_ascii=False)
+            }
         
-        products = cur.fetchall()
-        products_list = [dict(p) for p in products]
+        params = event.get('queryStringParameters') or {}
+        try:
+            options = parse_analysis_options(params)
+            ndjson = params.get('format') == 'ndjson'
+            if ndjson:
+                ndjson_limit, ndjson_after, report_id = parse_ndjson_page(params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
         
-        # Анализируем варианты
-        variant_groups = analyze_variants(products_list)
+        if ndjson and report_id is not None:
+            # Продолжение выгрузки: страница из сохранённого снимка без пересчёта анализа
+            try:
+                page = fetch_report_page(cur, report_id, ndjson_after, ndjson_limit)
+            except LookupError as e:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)})
+                }
+            return finalize_response(event, {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/x-ndjson; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': build_ndjson_report(report_id, page)
+            })
         
-        # Формируем результат
-        result = {
-            'total_products': len(products_list),
-            'groups_found': len(variant_groups),
-            'groups': variant_groups
-        }
+        # Первая страница NDJSON всегда создаёт новый снимок со своим reportId, поэтому
+        # ETag и 304 у неё нет: иначе клиент с 304 продолжал бы чужой снимок, а каждый
+        # условный GET всё равно записывал бы снимок в БД
+        etag = None
+        if not ndjson:
+            etag = analysis_etag(cur, event)
+            not_modified_etag = matched_etag(event, etag)
+            if not_modified_etag:
+                return not_modified_response(not_modified_etag)
         
-        return {
+        if options['incremental']:
+            # Отчёт по изменениям с прошлого прогона; состояние сдвигает только POST apply
+            since = fetch_analysis_watermark(cur)
+            analysis = analyze_variants_incremental(cur, since)
+            result = {
+                'total_products': analysis['changed_products'],
+                'groups_found': len(analysis['groups']),
+                'groups': analysis['groups'],
+                'since': since
+            }
+        else:
+            products_list = fetch_ungrouped_products(cur)
+            
+            # Анализируем варианты
+            variant_groups = run_analysis(products_list, options, fetch_taken_group_ids(cur))
+            
+            # Формируем результат
+            result = {
+                'total_products': len(products_list),
+                'groups_found': len(variant_groups),
+                'groups': variant_groups
+            }
+        
+        if ndjson:
+            report_id = save_report_snapshot(cur, result)
+            conn.commit()
+            return finalize_response(event, {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/x-ndjson; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': build_ndjson_report(report_id, fetch_report_page(cur, report_id, None, ndjson_limit))
+            })
+        
+        return finalize_response(event, {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps(result, default=json_serial, ensure_ascii=False)
-        }
+        }, etag)
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -257,5 +926,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
@@ -1,14 +1,748 @@
 '''
-Business: Массовый импорт товаров из JSON в базу данных
-Args: event с POST запросом и JSON массивом товаров в body
-Returns: Количество импортированных товаров
+Business: Массовый импорт товаров из JSON в базу данных, целиком или поэтапно через задания импорта
+Args: event с POST запросом и JSON массивом товаров в body (или action задания), GET ?jobId= - статус задания
+Returns: Количество новых, обновлённых и неизменённых товаров
 '''
 
+import io
 import json
 import os
-from typing import Dict, Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Tuple, Optional
+import requests
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
+from db import get_db_connection, release_db_connection
+from slugs import allocate_slugs, slugify
+
+# Ограничение на часть задания импорта: память функции зависит только от размера части
+MAX_CHUNK_PRODUCTS = 1000
+
+# Перезаливка картинок поставщика на CDN: те же download + upload, что в upload-image,
+# но пулом потоков с переиспользуемыми сессиями и в пределах оставшегося времени вызова
+# за вычетом запаса; без context - в пределах IMAGE_REHOST_BUDGET_SECONDS
+IMAGE_UPLOAD_URL = 'https://api.poehali.dev/upload'
+CDN_URL_PREFIX = 'https://cdn.poehali.dev/'
+IMAGE_REHOST_WORKERS = 8
+IMAGE_REQUEST_TIMEOUT = 30
+IMAGE_REHOST_BUDGET_SECONDS = 120
+IMAGE_REHOST_RESERVE_SECONDS = 15
+# Повторная перезаливка из image_rehost_pending: порция за запрос и предел неудачных попыток
+IMAGE_REHOST_RETRY_BATCH = 200
+IMAGE_REHOST_MAX_ATTEMPTS = 5
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+_image_sessions = threading.local()
+# Соединение, через которое потоки перезаливки пишут свои результаты, и его блокировка
+_rehost_connection = None
+_rehost_db_lock = threading.Lock()
+
+# Колонки временной таблицы импорта в порядке кортежей из prepare_rows
+STAGING_COLUMNS = (
+    'row_num', 'title', 'slug', 'description', 'price', 'category', 'style',
+    'colors', 'images', 'items', 'in_stock', 'supplier_article', 'stock_quantity',
+    'variant_group_id', 'color_variant'
+)
+
+# Что записывается в уже существующий товар при совпадении артикула. discount_price и is_new
+# импорт не трогает, а группы вариантов из анализа не затираются пустыми значениями прайс-листа
+UPSERT_ASSIGNMENTS = {
+    'title': 'EXCLUDED.title',
+    'description': 'EXCLUDED.description',
+    'price': 'EXCLUDED.price',
+    'category': 'EXCLUDED.category',
+    'style': 'EXCLUDED.style',
+    'colors': 'EXCLUDED.colors',
+    'images': 'EXCLUDED.images',
+    'items': 'EXCLUDED.items',
+    'in_stock': 'EXCLUDED.in_stock',
+    'stock_quantity': 'EXCLUDED.stock_quantity',
+    'variant_group_id': 'COALESCE(EXCLUDED.variant_group_id, products.variant_group_id)',
+    'color_variant': 'COALESCE(EXCLUDED.color_variant, products.color_variant)'
+}
+
+# Товар без артикула сопоставляется с прайс-листом по названию без учёта регистра
+# и крайних пробелов вместе с категорией (p - products, s - временная таблица)
+KEYLESS_KEY = 'lower(btrim({alias}.title)), {alias}.category'
+KEYLESS_MATCH = 'lower(btrim(p.title)) = lower(btrim(s.title)) AND p.category = s.category'
+
+# Товар без артикула clear_before не удаляет, пока на него ссылаются заказы или избранное
+PRODUCT_UNREFERENCED = '''
+    NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.product_id = p.id)
+    AND NOT EXISTS (SELECT 1 FROM favorites f WHERE f.product_id = p.id)
+'''
+
+def product_images(p: Dict[str, Any]) -> List[str]:
+    """Картинки товара из массива или основная"""
+    images_list = p.get('images', [])
+    if not images_list:
+        main_image = p.get('image', '')
+        if main_image:
+            images_list = [main_image]
+    return images_list
+
+def prepare_rows(products: List[Dict[str, Any]], image_map: Optional[Dict[str, str]] = None) -> List[tuple]:
+    """
+    Приводит товары из запроса к строкам временной таблицы (порядок STAGING_COLUMNS).
+    image_map подменяет ссылки поставщика на уже перезалитые копии с CDN
+    """
+    rows = []
+    
+    for idx, p in enumerate(products):
+        # Извлекаем цену числом из строки типа "38900 ₽"
+        price_str = str(p.get('price', '0'))
+        price_num = float(''.join(filter(str.isdigit, price_str)) or '0')
+        
+        # Базовый slug из названия; свободный вариант подбирает allocate_slugs
+        title = p.get('title', '')
+        slug = slugify(title)
+        
+        images_list = [image_map.get(url, url) for url in product_images(p)] if image_map else product_images(p)
+        
+        rows.append((
+            idx,
+            title,
+            slug,
+            p.get('description', ''),
+            price_num,
+            p.get('category', ''),
+            p.get('style', 'Современный'),
+            json.dumps(p.get('colors', []), ensure_ascii=False),
+            json.dumps(images_list, ensure_ascii=False),
+            json.dumps(p.get('items', []), ensure_ascii=False),
+            p.get('inStock', True),
+            p.get('supplierArticle') or None,
+            p.get('stockQuantity'),
+            p.get('variantGroupId'),
+            p.get('colorVariant')
+        ))
+    
+    return rows
+
+def copy_value(value: Any) -> str:
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def copy_to_staging(cursor, rows: List[tuple]) -> None:
+    """Создаёт временную таблицу на время транзакции и заливает строки одним COPY FROM STDIN"""
+    cursor.execute('''
+        CREATE TEMP TABLE products_import_staging (
+            row_num INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            slug VARCHAR(255) NOT NULL,
+            description TEXT,
+            price DECIMAL(10, 2) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            style VARCHAR(100),
+            colors JSONB,
+            images JSONB,
+            items JSONB,
+            in_stock BOOLEAN,
+            supplier_article VARCHAR(200),
+            stock_quantity INTEGER,
+            variant_group_id VARCHAR(100),
+            color_variant VARCHAR(100)
+        ) ON COMMIT DROP
+    ''')
+    
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    
+    cursor.copy_expert(
+        f"COPY products_import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+        buffer
+    )
+
+def keyless_sql(expr: str) -> str:
+    """Выражение из UPSERT_ASSIGNMENTS для UPDATE ... FROM: EXCLUDED -> строка прайс-листа s, products -> p"""
+    return expr.replace('EXCLUDED.', 's.').replace('products.', 'p.')
+
+def upsert_from_staging(cursor, clear_before: bool) -> Dict[str, int]:
+    """
+    Переносит строки из временной таблицы в products. Товары с артикулом обновляются
+    на месте по артикулу, товары без артикула - по названию и категории (KEYLESS_MATCH):
+    id не меняются, ссылки из избранного и заказов остаются, а повторный импорт того же
+    прайс-листа ничего не добавляет. С clear_before сначала удаляются товары, которых нет
+    в прайс-листе; товары без артикула - только если на них не ссылаются заказы и
+    избранное. Последовательность id не сбрасывается
+    """
+    deleted = 0
+    if clear_before:
+        cursor.execute('''
+            DELETE FROM products p
+            WHERE p.supplier_article IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM products_import_staging s WHERE s.supplier_article = p.supplier_article
+              )
+        ''')
+        deleted = cursor.rowcount
+        cursor.execute(f'''
+            DELETE FROM products p
+            WHERE p.supplier_article IS NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM products_import_staging s WHERE s.supplier_article IS NULL AND {KEYLESS_MATCH}
+              )
+              AND {PRODUCT_UNREFERENCED}
+        ''')
+        deleted += cursor.rowcount
+    
+    assignments = ',\n                '.join(f'{col} = {expr}' for col, expr in UPSERT_ASSIGNMENTS.items())
+    changed = ' OR '.join(f'products.{col} IS DISTINCT FROM {expr}' for col, expr in UPSERT_ASSIGNMENTS.items())
+    cursor.execute(f'''
+        WITH upserted AS (
+            INSERT INTO products (
+                title, slug, description, price, discount_price,
+                category, style, colors, images, items, in_stock, is_new,
+                supplier_article, stock_quantity, variant_group_id, color_variant
+            )
+            SELECT DISTINCT ON (supplier_article)
+                title, slug, description, price, NULL,
+                category, style, colors, images, items, in_stock, FALSE,
+                supplier_article, stock_quantity, variant_group_id, color_variant
+            FROM products_import_staging
+            WHERE supplier_article IS NOT NULL
+            ORDER BY supplier_article, row_num DESC
+            ON CONFLICT (supplier_article) DO UPDATE SET
+                {assignments},
+                updated_at = CURRENT_TIMESTAMP
+            WHERE {changed}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE inserted) AS inserted,
+            COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+            (SELECT COUNT(DISTINCT supplier_article) FROM products_import_staging) AS with_article
+        FROM upserted
+    ''')
+    inserted, updated, with_article = cursor.fetchone()
+    
+    # Без артикула: последняя строка прайс-листа с тем же ключом обновляет совпавшие товары,
+    # строки без совпадения добавляются
+    keyless_assignments = ',\n                '.join(f'{col} = {keyless_sql(expr)}' for col, expr in UPSERT_ASSIGNMENTS.items())
+    keyless_changed = ' OR '.join(f'p.{col} IS DISTINCT FROM {keyless_sql(expr)}' for col, expr in UPSERT_ASSIGNMENTS.items())
+    cursor.execute(f'''
+        WITH keyless AS (
+            SELECT DISTINCT ON ({KEYLESS_KEY.format(alias='s')}) s.*
+            FROM products_import_staging s
+            WHERE s.supplier_article IS NULL
+            ORDER BY {KEYLESS_KEY.format(alias='s')}, s.row_num DESC
+        ),
+        matched AS (
+            UPDATE products p SET
+                {keyless_assignments},
+                updated_at = CURRENT_TIMESTAMP
+            FROM keyless s
+            WHERE p.supplier_article IS NULL AND {KEYLESS_MATCH}
+              AND ({keyless_changed})
+            RETURNING {KEYLESS_KEY.format(alias='s')}
+        ),
+        added AS (
+            INSERT INTO products (
+                title, slug, description, price, discount_price,
+                category, style, colors, images, items, in_stock, is_new,
+                supplier_article, stock_quantity, variant_group_id, color_variant
+            )
+            SELECT
+                s.title, s.slug, s.description, s.price, NULL,
+                s.category, s.style, s.colors, s.images, s.items, s.in_stock, FALSE,
+                NULL, s.stock_quantity, s.variant_group_id, s.color_variant
+            FROM keyless s
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.supplier_article IS NULL AND {KEYLESS_MATCH})
+            ORDER BY s.row_num
+            RETURNING 1
+        )
+        SELECT
+            (SELECT COUNT(*) FROM added),
+            (SELECT COUNT(*) FROM (SELECT DISTINCT * FROM matched) m),
+            (SELECT COUNT(*) FROM keyless)
+    ''')
+    keyless_inserted, keyless_updated, keyless_total = cursor.fetchone()
+    
+    return {
+        'inserted': inserted + keyless_inserted,
+        'updated': updated + keyless_updated,
+        'unchanged': with_article - inserted - updated + keyless_total - keyless_inserted - keyless_updated,
+        'deleted': deleted
+    }
+
+def fetch_keyless_product_ids(cursor) -> List[int]:
+    """id товаров без артикула, сопоставленных со строками временной таблицы (после upsert_from_staging)"""
+    cursor.execute(f'''
+        SELECT DISTINCT p.id
+        FROM products p
+        JOIN products_import_staging s ON s.supplier_article IS NULL AND {KEYLESS_MATCH}
+        WHERE p.supplier_article IS NULL
+    ''')
+    return sorted(row[0] for row in cursor.fetchall())
+
+def collect_image_urls(products: List[Dict[str, Any]]) -> List[str]:
+    """Уникальные внешние ссылки на картинки, которых ещё нет на CDN"""
+    urls = {}
+    for p in products:
+        for url in product_images(p):
+            if isinstance(url, str) and url.startswith(('http://', 'https://')) and not url.startswith(CDN_URL_PREFIX):
+                urls[url] = True
+    return list(urls)
+
+def fetch_cached_images(cursor, urls: List[str]) -> Dict[str, str]:
+    if not urls:
+        return {}
+    cursor.execute('SELECT source_url, cdn_url FROM image_rehost_cache WHERE source_url = ANY(%s)', (urls,))
+    return dict(cursor.fetchall())
+
+def get_image_session() -> requests.Session:
+    """Своя сессия на поток: keep-alive к поставщику и к CDN без гонок внутри requests"""
+    session = getattr(_image_sessions, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        _image_sessions.session = session
+    return session
+
+def rehost_image(image_url: str) -> str:
+    session = get_image_session()
+    image_response = session.get(image_url, timeout=IMAGE_REQUEST_TIMEOUT)
+    image_response.raise_for_status()
+    
+    filename = image_url.split('/')[-1].split('?')[0] or 'image.jpg'
+    if not filename.endswith(IMAGE_EXTENSIONS):
+        filename += '.jpg'
+    content_type = image_response.headers.get('Content-Type', 'image/jpeg')
+    
+    upload_response = session.post(
+        IMAGE_UPLOAD_URL,
+        files={'file': (filename, image_response.content, content_type)},
+        timeout=IMAGE_REQUEST_TIMEOUT
+    )
+    upload_response.raise_for_status()
+    cdn_url = upload_response.json().get('url')
+    if not cdn_url:
+        raise ValueError('CDN returned no url')
+    return cdn_url
+
+def rehost_budget(context: Any) -> float:
+    """
+    Бюджет перезаливки - оставшееся время вызова за вычетом запаса на обновление товаров
+    и ответ. Без context.get_remaining_time_in_millis - IMAGE_REHOST_BUDGET_SECONDS
+    """
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if not callable(get_remaining):
+        return IMAGE_REHOST_BUDGET_SECONDS
+    return max(0.0, get_remaining() / 1000 - IMAGE_REHOST_RESERVE_SECONDS)
+
+def get_rehost_connection():
+    """
+    Отдельное соединение для записи результатов из потоков перезаливки: основное
+    соединение занято транзакцией импорта. Вызывать под _rehost_db_lock
+    """
+    global _rehost_connection
+    if _rehost_connection is None or _rehost_connection.closed:
+        _rehost_connection = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    return _rehost_connection
+
+def record_rehost_result(url: str, cdn_url: Optional[str], error: Optional[str], update_products: bool) -> None:
+    """
+    Сохраняет результат одной картинки из потока перезаливки: успех пишет кеш и убирает
+    ссылку из очереди, неудача увеличивает attempts. С update_products (загрузка закончилась
+    после бюджета) ссылка сразу заменяется и в товарах - результат не теряется
+    """
+    with _rehost_db_lock:
+        try:
+            conn = get_rehost_connection()
+            with conn.cursor() as cursor:
+                if cdn_url is None:
+                    cursor.execute(
+                        '''
+                            UPDATE image_rehost_pending
+                            SET attempts = attempts + 1, last_error = %s, updated_at = CURRENT_TIMESTAMP
+                            WHERE source_url = %s
+                        ''',
+                        (error, url)
+                    )
+                else:
+                    cursor.execute(
+                        'INSERT INTO image_rehost_cache (source_url, cdn_url) VALUES (%s, %s) ON CONFLICT (source_url) DO NOTHING',
+                        (url, cdn_url)
+                    )
+                    cursor.execute('DELETE FROM image_rehost_pending WHERE source_url = %s', (url,))
+                    if update_products:
+                        replace_product_images(cursor, {url: cdn_url})
+            conn.commit()
+        except Exception as e:
+            # Запись в очереди остаётся - картинку перезальёт rehostPending
+            print(f"[images] Failed to record rehost of {url}: {str(e)}")
+            try:
+                _rehost_connection.rollback()
+            except Exception:
+                pass
+
+def rehost_images(urls: List[str], budget_seconds: float) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Перезаливает картинки пулом из IMAGE_REHOST_WORKERS потоков; каждый поток сам
+    сохраняет свой результат (record_rehost_result). По истечении budget_seconds
+    очередь отменяется, а возвращаются загрузки, закончившиеся в бюджет. Потоки, ещё
+    идущие после этого, не ждём: их результат они сами запишут в кеш и в товары
+    """
+    uploaded, failed = {}, {}
+    state_lock = threading.Lock()
+    collecting = [True]
+    
+    def rehost_and_record(url):
+        cdn_url, error = None, None
+        try:
+            cdn_url = rehost_image(url)
+        except Exception as e:
+            error = str(e)
+        with state_lock:
+            late = not collecting[0]
+            if not late:
+                if cdn_url is None:
+                    failed[url] = error
+                else:
+                    uploaded[url] = cdn_url
+        record_rehost_result(url, cdn_url, error, late)
+    
+    pool = ThreadPoolExecutor(max_workers=IMAGE_REHOST_WORKERS)
+    futures = [pool.submit(rehost_and_record, url) for url in urls]
+    try:
+        _, not_done = wait(futures, timeout=budget_seconds)
+        if not_done:
+            print(f'[images] Budget of {budget_seconds:.1f}s exceeded, cancelling queued uploads')
+    finally:
+        with state_lock:
+            collecting[0] = False
+            result = dict(uploaded), dict(failed)
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    return result
+
+def enqueue_pending_images(cursor, urls: List[str]) -> None:
+    """
+    Ставит ссылки в очередь до начала перезаливки: если вызов оборвётся по таймауту,
+    они останутся в очереди. Уже стоящие в очереди не меняются
+    """
+    if not urls:
+        return
+    execute_values(
+        cursor,
+        'INSERT INTO image_rehost_pending (source_url) VALUES %s ON CONFLICT (source_url) DO NOTHING',
+        [(url,) for url in urls],
+        page_size=len(urls)
+    )
+
+def drop_pending_images(cursor, urls: List[str]) -> None:
+    """Убирает из очереди ссылки, которые уже есть в кеше"""
+    if urls:
+        cursor.execute('DELETE FROM image_rehost_pending WHERE source_url = ANY(%s)', (urls,))
+
+def replace_product_images(cursor, image_map: Dict[str, str]) -> None:
+    """Одним UPDATE заменяет ссылки из image_map во всех товарах, где они встречаются"""
+    cursor.execute(
+        '''
+            UPDATE products p
+            SET images = (
+                SELECT jsonb_agg(COALESCE(%s::jsonb ->> img.url, img.url) ORDER BY img.ord)
+                FROM jsonb_array_elements_text(p.images) WITH ORDINALITY AS img(url, ord)
+            ),
+            updated_at = CURRENT_TIMESTAMP
+            WHERE jsonb_typeof(p.images) = 'array' AND p.images ?| %s
+        ''',
+        (json.dumps(image_map), list(image_map))
+    )
+
+def fetch_pending_images(cursor, limit: int) -> List[str]:
+    """Ссылки из очереди повтора: сначала с меньшим числом неудач, затем самые давние"""
+    cursor.execute(
+        '''
+            SELECT source_url FROM image_rehost_pending
+            WHERE attempts < %s
+            ORDER BY attempts, updated_at
+            LIMIT %s
+        ''',
+        (IMAGE_REHOST_MAX_ATTEMPTS, limit)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def rehost_product_images(conn, cursor, urls: List[str], context: Any = None) -> Dict[str, Any]:
+    """
+    Перезаливает ещё не закешированные картинки в пределах оставшегося времени вызова
+    и одним UPDATE заменяет ссылки во всех товарах, где они встречаются. Ссылки ставятся
+    в очередь image_rehost_pending до начала загрузки и убираются из неё по одной после
+    успеха. Вызывается после commit импорта, поэтому не бросает исключений: ошибка
+    попадает в ответ, а товары уже сохранены
+    """
+    if not urls:
+        return {'rehosted': 0, 'failed': 0, 'pending': 0, 'errors': {}}
+    
+    try:
+        enqueue_pending_images(cursor, urls)
+        conn.commit()
+        uploaded, failed = rehost_images(urls, rehost_budget(context))
+        if uploaded:
+            replace_product_images(cursor, uploaded)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[images] Rehost failed after import commit: {str(e)}")
+        return {'rehosted': 0, 'failed': 0, 'pending': len(urls), 'errors': {}, 'error': str(e)}
+    
+    return {
+        'rehosted': len(uploaded),
+        'failed': len(failed),
+        'pending': len(urls) - len(uploaded) - len(failed),
+        'errors': dict(list(failed.items())[:20])
+    }
+
+def import_products(cursor, products: List[Dict[str, Any]], clear_before: bool,
+                    image_map: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, int], List[tuple]]:
+    """Загружает товары через временную таблицу и возвращает счётчики upsert и сами строки"""
+    rows = prepare_rows(products, image_map)
+    slugs = allocate_slugs(cursor, [row[2] for row in rows], [row[11] for row in rows], clear_before)
+    rows = [row[:2] + (slug,) + row[3:] for row, slug in zip(rows, slugs)]
+    
+    copy_to_staging(cursor, rows)
+    return upsert_from_staging(cursor, clear_before), rows
+
+def fetch_import_job(cursor, job_id: int, lock: str = '') -> Dict[str, Any]:
+    cursor.execute(
+        f'''
+            SELECT id, status, clear_before, total_chunks, deleted, created_at, committed_at
+            FROM product_import_jobs WHERE id = %s {lock}
+        ''',
+        (job_id,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        raise LookupError(f'Import job {job_id} not found')
+    return dict(zip(('id', 'status', 'clear_before', 'total_chunks', 'deleted', 'created_at', 'committed_at'), row))
+
+def create_import_job(cursor, clear_before: bool, total_chunks: Optional[int]) -> int:
+    cursor.execute(
+        'INSERT INTO product_import_jobs (clear_before, total_chunks) VALUES (%s, %s) RETURNING id',
+        (clear_before, total_chunks)
+    )
+    return cursor.fetchone()[0]
+
+def upload_import_chunk(conn, cursor, job_id: int, seq: int, products: List[Dict[str, Any]],
+                        rehost: bool = False, context: Any = None) -> Dict[str, Any]:
+    """
+    Обрабатывает часть задания сразу при получении. Повторная отправка уже загруженной
+    части ничего не делает, а упавшую часть можно отправить заново отдельно
+    """
+    # FOR SHARE не даёт закоммитить задание, пока загружаются его части
+    job = fetch_import_job(cursor, job_id, 'FOR SHARE')
+    if job['status'] != 'open':
+        raise ValueError(f"Import job {job_id} is {job['status']}")
+    
+    cursor.execute(
+        '''
+            SELECT products_count, inserted, updated, unchanged FROM product_import_job_chunks
+            WHERE job_id = %s AND seq = %s AND status = 'done'
+        ''',
+        (job_id, seq)
+    )
+    done_chunk = cursor.fetchone()
+    if done_chunk:
+        conn.rollback()
+        return dict(zip(('products', 'inserted', 'updated', 'unchanged'), done_chunk), seq=seq, duplicate=True)
+    
+    image_urls = collect_image_urls(products) if rehost else []
+    try:
+        image_map = fetch_cached_images(cursor, image_urls)
+        counts, rows = import_products(cursor, products, False, image_map)
+        articles = sorted({row[11] for row in rows if row[11]})
+        keyless_ids = fetch_keyless_product_ids(cursor)
+        cursor.execute(
+            '''
+                INSERT INTO product_import_job_chunks
+                    (job_id, seq, status, products_count, inserted, updated, unchanged, supplier_articles, keyless_product_ids)
+                VALUES (%s, %s, 'done', %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (job_id, seq) DO UPDATE SET
+                    status = 'done', products_count = EXCLUDED.products_count,
+                    inserted = EXCLUDED.inserted, updated = EXCLUDED.updated, unchanged = EXCLUDED.unchanged,
+                    supplier_articles = EXCLUDED.supplier_articles, keyless_product_ids = EXCLUDED.keyless_product_ids,
+                    error = NULL, processed_at = CURRENT_TIMESTAMP
+            ''',
+            (job_id, seq, len(rows), counts['inserted'], counts['updated'], counts['unchanged'], articles, keyless_ids)
+        )
+        cursor.execute('UPDATE product_import_jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = %s', (job_id,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        cursor.execute(
+            '''
+                INSERT INTO product_import_job_chunks (job_id, seq, status, products_count, error)
+                VALUES (%s, %s, 'failed', %s, %s)
+                ON CONFLICT (job_id, seq) DO UPDATE SET
+                    status = 'failed', error = EXCLUDED.error, processed_at = CURRENT_TIMESTAMP
+                WHERE product_import_job_chunks.status <> 'done'
+            ''',
+            (job_id, seq, len(products), str(e))
+        )
+        conn.commit()
+        raise
+    
+    result = {'seq': seq, 'products': len(rows), **{key: counts[key] for key in ('inserted', 'updated', 'unchanged')}, 'duplicate': False}
+    if rehost:
+        pending_urls = [url for url in image_urls if url not in image_map]
+        result['images'] = {'cached': len(image_map), **rehost_product_images(conn, cursor, pending_urls, context)}
+    return result
+
+def commit_import_job(cursor, job_id: int, total_chunks: Optional[int]) -> None:
+    """
+    Проверяет, что все части загружены, и при clear_before удаляет товары, которых не было
+    ни в одной части (кроме добавленных уже после создания задания): с артикулом - по
+    артикулам частей, без артикула - по сопоставленным частями id и только если на них
+    не ссылаются заказы и избранное, как в upsert_from_staging
+    """
+    job = fetch_import_job(cursor, job_id, 'FOR UPDATE')
+    if job['status'] == 'committed':
+        return
+    
+    total_chunks = total_chunks or job['total_chunks']
+    cursor.execute('SELECT seq FROM product_import_job_chunks WHERE job_id = %s AND status = %s', (job_id, 'done'))
+    done = {row[0] for row in cursor.fetchall()}
+    if not done:
+        raise ValueError(f'Import job {job_id} has no uploaded chunks')
+    expected = set(range(total_chunks if total_chunks else max(done) + 1))
+    missing = sorted(expected - done)
+    if missing:
+        raise ValueError(f'Import job {job_id} is missing chunks: {missing}')
+    
+    deleted = 0
+    if job['clear_before']:
+        cursor.execute(
+            '''
+                WITH job_articles AS (
+                    SELECT DISTINCT unnest(supplier_articles) AS supplier_article
+                    FROM product_import_job_chunks
+                    WHERE job_id = %s
+                )
+                DELETE FROM products p
+                WHERE p.supplier_article IS NOT NULL
+                  AND (p.created_at IS NULL OR p.created_at < %s)
+                  AND NOT EXISTS (SELECT 1 FROM job_articles a WHERE a.supplier_article = p.supplier_article)
+            ''',
+            (job_id, job['created_at'])
+        )
+        deleted = cursor.rowcount
+        cursor.execute(
+            f'''
+                WITH job_products AS (
+                    SELECT DISTINCT unnest(keyless_product_ids) AS id
+                    FROM product_import_job_chunks
+                    WHERE job_id = %s
+                )
+                DELETE FROM products p
+                WHERE p.supplier_article IS NULL
+                  AND (p.created_at IS NULL OR p.created_at < %s)
+                  AND NOT EXISTS (SELECT 1 FROM job_products j WHERE j.id = p.id)
+                  AND {PRODUCT_UNREFERENCED}
+            ''',
+            (job_id, job['created_at'])
+        )
+        deleted += cursor.rowcount
+    
+    cursor.execute(
+        '''
+            UPDATE product_import_jobs
+            SET status = 'committed', total_chunks = %s, deleted = %s,
+                committed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''',
+        (len(expected), deleted, job_id)
+    )
+
+def get_import_job_status(cursor, job_id: int) -> Dict[str, Any]:
+    job = fetch_import_job(cursor, job_id)
+    cursor.execute(
+        '''
+            SELECT seq, status, products_count, inserted, updated, unchanged, error
+            FROM product_import_job_chunks WHERE job_id = %s ORDER BY seq
+        ''',
+        (job_id,)
+    )
+    chunks = cursor.fetchall()
+    done = [chunk for chunk in chunks if chunk[1] == 'done']
+    done_seqs = {chunk[0] for chunk in done}
+    
+    return {
+        'jobId': job['id'],
+        'status': job['status'],
+        'clearBefore': job['clear_before'],
+        'totalChunks': job['total_chunks'],
+        'chunksDone': len(done),
+        'missingChunks': [seq for seq in range(job['total_chunks']) if seq not in done_seqs] if job['total_chunks'] else [],
+        'failedChunks': [{'seq': chunk[0], 'error': chunk[6]} for chunk in chunks if chunk[1] == 'failed'],
+        'products': sum(chunk[2] for chunk in done),
+        'inserted': sum(chunk[3] for chunk in done),
+        'updated': sum(chunk[4] for chunk in done),
+        'unchanged': sum(chunk[5] for chunk in done),
+        'deleted': job['deleted'],
+        'createdAt': job['created_at'].isoformat() if job['created_at'] else None,
+        'committedAt': job['committed_at'].isoformat() if job['committed_at'] else None
+    }
+
+def handle_import_job(conn, cursor, body_data: Dict[str, Any], context: Any = None) -> Tuple[int, Dict[str, Any]]:
+    """
+    API поэтапного импорта: createJob -> uploadChunk (seq 0..N-1) -> commitJob, статус - GET ?jobId=.
+    rehostPending повторяет перезаливку картинок из очереди image_rehost_pending.
+    Возвращает HTTP-статус и тело ответа
+    """
+    action = body_data.get('action')
+    
+    if action == 'rehostPending':
+        pending_urls = fetch_pending_images(cursor, IMAGE_REHOST_RETRY_BATCH)
+        image_map = fetch_cached_images(cursor, pending_urls)
+        if image_map:
+            # Уже перезалиты другим импортом - только убираем из очереди
+            drop_pending_images(cursor, list(image_map))
+            conn.commit()
+        images = rehost_product_images(conn, cursor, [url for url in pending_urls if url not in image_map], context)
+        cursor.execute('SELECT COUNT(*) FROM image_rehost_pending WHERE attempts < %s', (IMAGE_REHOST_MAX_ATTEMPTS,))
+        return 200, {'images': {'cached': len(image_map), **images}, 'remaining': cursor.fetchone()[0]}
+    
+    if action == 'createJob':
+        total_chunks = body_data.get('totalChunks')
+        if total_chunks is not None and (not isinstance(total_chunks, int) or total_chunks < 1):
+            return 400, {'error': 'totalChunks must be a positive integer'}
+        job_id = create_import_job(cursor, bool(body_data.get('clearBefore', False)), total_chunks)
+        conn.commit()
+        return 201, {'jobId': job_id, 'status': 'open', 'maxChunkProducts': MAX_CHUNK_PRODUCTS}
+    
+    job_id = body_data.get('jobId')
+    if not isinstance(job_id, int):
+        return 400, {'error': 'jobId must be an integer'}
+    
+    if action == 'uploadChunk':
+        seq = body_data.get('seq')
+        chunk_products = body_data.get('products')
+        if not isinstance(seq, int) or seq < 0:
+            return 400, {'error': 'seq must be a non-negative integer'}
+        if not chunk_products or not isinstance(chunk_products, list):
+            return 400, {'error': 'Products array required'}
+        if len(chunk_products) > MAX_CHUNK_PRODUCTS:
+            return 400, {'error': f'Chunk exceeds {MAX_CHUNK_PRODUCTS} products'}
+        rehost = bool(body_data.get('rehostImages', False))
+        return 200, {'jobId': job_id, **upload_import_chunk(conn, cursor, job_id, seq, chunk_products, rehost, context)}
+    
+    if action == 'commitJob':
+        commit_import_job(cursor, job_id, body_data.get('totalChunks'))
+        conn.commit()
+        return 200, get_import_job_status(cursor, job_id)
+    
+    if action == 'status':
+        return 200, get_import_job_status(cursor, job_id)
+    
+    return 400, {'error': 'action must be createJob, uploadChunk, commitJob, status or rehostPending'}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
@@ -18,18 +752,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    if method != 'POST':
+    if method not in ('GET', 'POST'):
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Only POST allowed'})
+            'body': json.dumps({'error': 'Only GET and POST allowed'})
         }
     
     headers = event.get('headers', {})
@@ -42,7 +776,40 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Forbidden - admin key required'})
         }
     
-    body_data = json.loads(event.get('body', '{}'))
+    if method == 'GET':
+        job_id = (event.get('queryStringParameters') or {}).get('jobId', '')
+        if not job_id.isdigit():
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'jobId required'})
+            }
+        body_data = {'action': 'status', 'jobId': int(job_id)}
+    else:
+        body_data = json.loads(event.get('body', '{}'))
+    
+    if 'action' in body_data:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            status_code, payload = handle_import_job(conn, cursor, body_data, context)
+        except LookupError as e:
+            status_code, payload = 404, {'error': str(e)}
+        except ValueError as e:
+            status_code, payload = 409, {'error': str(e)}
+        except Exception as e:
+            print(f"Import job error: {str(e)}")
+            status_code, payload = 500, {'error': str(e)}
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+        
+        return {
+            'statusCode': status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(payload)
+        }
+    
     products = body_data.get('products', [])
     
     if not products or not isinstance(products, list):
@@ -52,78 +819,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Products array required'})
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Очищаем таблицу перед импортом (опционально)
-    clear_before = body_data.get('clearBefore', False)
-    if clear_before:
-        cursor.execute('DELETE FROM products')
-        cursor.execute('ALTER SEQUENCE products_id_seq RESTART WITH 1')
-        conn.commit()
-    
-    # Подготавливаем данные для batch insert
-    insert_data = []
-    slug_counter = {}
-    
-    for idx, p in enumerate(products):
-        # Извлекаем цену числом из строки типа "38900 ₽"
-        price_str = str(p.get('price', '0'))
-        price_num = float(''.join(filter(str.isdigit, price_str)) or '0')
+    try:
+        rehost = body_data.get('rehostImages', False)
+        image_urls = collect_image_urls(products) if rehost else []
+        image_map = fetch_cached_images(cursor, image_urls)
         
-        # Генерируем уникальный slug из названия
-        title = p.get('title', '')
-        base_slug = title.lower().replace(' ', '-').replace('"', '').replace("'", '').replace('(', '').replace(')', '')
-        base_slug = ''.join(c for c in base_slug if c.isalnum() or c == '-')[:50]
-        
-        # Добавляем счётчик для уникальности
-        if base_slug in slug_counter:
-            slug_counter[base_slug] += 1
-            slug = f"{base_slug}-{slug_counter[base_slug]}"
-        else:
-            slug_counter[base_slug] = 0
-            slug = base_slug
-        
-        # Первая картинка из массива или основная
-        images_list = p.get('images', [])
-        if not images_list:
-            main_image = p.get('image', '')
-            if main_image:
-                images_list = [main_image]
+        counts, rows = import_products(cursor, products, body_data.get('clearBefore', False), image_map)
+        conn.commit()
         
-        insert_data.append((
-            title,
-            slug,
-            p.get('description', ''),
-            price_num,
-            None,  # discount_price
-            p.get('category', ''),
-            p.get('style', 'Современный'),
-            json.dumps(p.get('colors', [])),
-            json.dumps(images_list),
-            json.dumps(p.get('items', [])),
-            p.get('inStock', True),
-            False,  # is_new
-            p.get('supplierArticle'),  # supplier_article
-            p.get('stockQuantity'),  # stock_quantity
-            p.get('variantGroupId'),  # variant_group_id
-            p.get('colorVariant')  # color_variant
-        ))
-    
-    # Массовая вставка (вставляем без ID, база сама сгенерирует)
-    execute_batch(cursor, '''
-        INSERT INTO products (
-            title, slug, description, price, discount_price,
-            category, style, colors, images, items, in_stock, is_new,
-            supplier_article, stock_quantity, variant_group_id, color_variant
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb, %s, %s, %s, %s, %s, %s)
-    ''', insert_data)
-    
-    conn.commit()
-    imported_count = len(insert_data)
+        if rehost:
+            pending_urls = [url for url in image_urls if url not in image_map]
+            counts['images'] = {'cached': len(image_map), **rehost_product_images(conn, cursor, pending_urls, context)}
+    finally:
+        cursor.close()
+        release_db_connection(conn)
     
-    cursor.close()
-    conn.close()
+    imported_count = len(rows)
     
     return {
         'statusCode': 200,
@@ -131,6 +845,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'body': json.dumps({
             'success': True,
             'imported': imported_count,
-            'message': f'Successfully imported {imported_count} products'
+            **counts,
+            'message': f"Imported {imported_count} products: {counts['inserted']} new, "
+                       f"{counts['updated']} updated, {counts['unchanged']} unchanged"
         })
     }
\ No newline at end of file
@@ -1,10 +1,54 @@
 import json
 import os
-import psycopg2
+import base64
 from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from decimal import Decimal
 from datetime import datetime
+from db import get_db_connection, release_db_connection
+from http_response import data_versions, finalize_response, make_etag, matched_etag, not_modified_response
+from slugs import allocate_slugs, escape_like, slugify
+
+DEFAULT_PAGE_LIMIT = 48
+MAX_PAGE_LIMIT = 200
+
+# sort -> (колонка, направление, тип для приведения значения из курсора)
+SORT_OPTIONS = {
+    'new': ('created_at', 'DESC', 'timestamp'),
+    'price_asc': ('price', 'ASC', 'numeric'),
+    'price_desc': ('price', 'DESC', 'numeric'),
+    'title': ('title', 'ASC', 'text')
+}
+
+# Поля, доступные для проекции через ?fields=; image - первая картинка из images
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+    'price': 'price',
+    'discount_price': 'discount_price',
+    'category': 'category',
+    'style': 'style',
+    'colors': 'colors',
+    'images': 'images',
+    'image': "images->>0 AS image",
+    'items': 'items',
+    'in_stock': 'in_stock',
+    'is_new': 'is_new',
+    'supplier_article': 'supplier_article',
+    'stock_quantity': 'stock_quantity',
+    'variant_group_id': 'variant_group_id',
+    'color_variant': 'color_variant',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at'
+}
+
+# Все реальные колонки, кроме служебной search_vector
+PRODUCT_COLUMNS = ', '.join(c for c in PRODUCT_FIELDS if c != 'image')
+
+# Таблицы data_versions, от которых зависит ответ каталога (версию меняет любая правка товаров)
+CATALOG_VERSION_SOURCES = ['products']
 
 def json_serial(obj):
     if isinstance(obj, Decimal):
@@ -13,6 +57,186 @@ def json_serial(obj):
         return obj.isoformat()
     raise TypeError(f"Type {type(obj)} not serializable")
 
+def catalog_etag(cur, event: Dict[str, Any]) -> str:
+    """
+    Сильный ETag из версии каталога и параметров запроса - без выборки самих товаров
+    """
+    return make_etag(
+        data_versions(cur, CATALOG_VERSION_SOURCES),
+        event.get('queryStringParameters') or {}, event.get('pathParams') or {}
+    )
+
+def parse_fields(raw: Optional[str]) -> Optional[List[str]]:
+    """
+    Разбирает параметр fields=id,title,price в список полей
+    """
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def build_select_list(fields: Optional[List[str]], sort_column: str) -> str:
+    """
+    Строит список колонок для SELECT; id и колонка сортировки нужны всегда для курсора
+    """
+    if not fields:
+        return PRODUCT_COLUMNS
+    required = ['id', sort_column]
+    columns = required + [f for f in fields if f not in required]
+    return ', '.join(PRODUCT_FIELDS[c] for c in columns)
+
+def project_row(row: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if not fields:
+        return dict(row)
+    return {f: row[f] for f in fields}
+
+def split_param(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return []
+    return [v.strip() for v in raw.split(',') if v.strip()]
+
+def parse_price(raw: str, name: str) -> Decimal:
+    try:
+        return Decimal(raw)
+    except ArithmeticError as e:
+        raise ValueError(f"{name} must be a number") from e
+
+def build_filters(query_params: Dict[str, str]) -> Tuple[List[str], List[Any]]:
+    """
+    Строит условия WHERE из category, style, in_stock, price_min, price_max, colors
+    """
+    conditions = []
+    args = []
+    
+    categories = split_param(query_params.get('category'))
+    if categories:
+        conditions.append('category = ANY(%s)')
+        args.append(categories)
+    
+    styles = split_param(query_params.get('style'))
+    if styles:
+        conditions.append('style = ANY(%s)')
+        args.append(styles)
+    
+    in_stock = query_params.get('in_stock')
+    if in_stock in ('true', 'false'):
+        conditions.append('in_stock = %s')
+        args.append(in_stock == 'true')
+    elif in_stock:
+        raise ValueError('in_stock must be true or false')
+    
+    if query_params.get('price_min'):
+        conditions.append('price >= %s')
+        args.append(parse_price(query_params['price_min'], 'price_min'))
+    
+    if query_params.get('price_max'):
+        conditions.append('price <= %s')
+        args.append(parse_price(query_params['price_max'], 'price_max'))
+    
+    # Товар подходит, если содержит хотя бы один из выбранных цветов (GIN по colors)
+    colors = split_param(query_params.get('colors'))
+    if colors:
+        conditions.append('(' + ' OR '.join(['colors @> %s::jsonb'] * len(colors)) + ')')
+        args.extend(json.dumps([color], ensure_ascii=False) for color in colors)
+    
+    return conditions, args
+
+def fetch_facets(cur, conditions: List[str], args: List[Any]) -> Dict[str, Any]:
+    """
+    Считает фасеты для боковой панели фильтров одним сгруппированным запросом
+    """
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cur.execute(f'''
+        WITH filtered AS (
+            SELECT category, style, in_stock, colors, price FROM products {where_sql}
+        )
+        SELECT 'category' AS facet, category AS value, COUNT(*) AS count FROM filtered GROUP BY category
+        UNION ALL
+        SELECT 'style', style, COUNT(*) FROM filtered GROUP BY style
+        UNION ALL
+        SELECT 'in_stock', in_stock::text, COUNT(*) FROM filtered GROUP BY in_stock
+        UNION ALL
+        SELECT 'colors', color, COUNT(*)
+        FROM filtered, jsonb_array_elements_text(COALESCE(colors, '[]'::jsonb)) AS color
+        GROUP BY color
+        UNION ALL
+        SELECT 'price_min', MIN(price)::text, COUNT(*) FROM filtered
+        UNION ALL
+        SELECT 'price_max', MAX(price)::text, COUNT(*) FROM filtered
+    ''', args)
+    
+    facets = {'category': {}, 'style': {}, 'in_stock': {}, 'colors': {}, 'price': {'min': None, 'max': None}}
+    for row in cur.fetchall():
+        if row['facet'] in ('price_min', 'price_max'):
+            facets['price'][row['facet'][6:]] = float(row['value']) if row['value'] is not None else None
+        elif row['value'] is not None:
+            facets[row['facet']][row['value']] = row['count']
+    return facets
+
+def search_products(cur, q: str, fields: Optional[List[str]], conditions: List[str], args: List[Any],
+                    limit: int, offset: int) -> Dict[str, Any]:
+    """
+    Полнотекстовый поиск (russian tsvector) с нечётким добором по триграммам:
+    опечатки в названии через word_similarity, части артикулов вроде ВШ06-600 через ILIKE
+    """
+    select_list = build_select_list(fields, 'created_at')
+    pattern = f'%{escape_like(q)}%'
+    filters_sql = ''.join(f' AND {c}' for c in conditions)
+    cur.execute(f'''
+        WITH query AS (SELECT websearch_to_tsquery('russian', %s) AS tsq)
+        SELECT {select_list},
+               ts_rank_cd(search_vector, query.tsq)
+                   + word_similarity(%s, title)
+                   + similarity(COALESCE(supplier_article, ''), %s) AS rank
+        FROM products, query
+        WHERE (search_vector @@ query.tsq
+               OR %s <%% title
+               OR title ILIKE %s
+               OR supplier_article ILIKE %s){filters_sql}
+        ORDER BY rank DESC, id DESC
+        LIMIT %s OFFSET %s
+    ''', [q, q, q, q, pattern, pattern] + args + [limit + 1, offset])
+    rows = cur.fetchall()
+    
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    
+    products = []
+    for row in rows:
+        product = project_row(row, fields)
+        product['rank'] = round(float(row['rank']), 4)
+        products.append(product)
+    
+    return {'products': products, 'nextOffset': next_offset}
+
+def encode_cursor(sort: str, value: Any, product_id: int) -> str:
+    raw = json.dumps([sort, value, product_id], default=str, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, product_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if cursor_sort != sort:
+        raise ValueError('Cursor does not match sort order')
+    return value, int(product_id)
+
+def parse_limit(raw: Optional[str]) -> int:
+    if not raw:
+        return DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError as e:
+        raise ValueError('limit must be an integer') from e
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления товарами мебельного каталога
@@ -28,7 +252,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -47,7 +271,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     try:
         print(f"Connecting to database...")
-        conn = psycopg2.connect(database_url)
+        conn = get_db_connection()
         print(f"Connection established")
         cur = conn.cursor(cursor_factory=RealDictCursor)
         print(f"Cursor created, method: {method}")
@@ -56,8 +280,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             path_params = event.get('pathParams', {})
             product_id = path_params.get('id')
             
+            etag = catalog_etag(cur, event)
+            not_modified_etag = matched_etag(event, etag)
+            if not_modified_etag:
+                return not_modified_response(not_modified_etag)
+            
             if product_id:
-                cur.execute('SELECT * FROM products WHERE id = %s', (product_id,))
+                cur.execute(f'SELECT {PRODUCT_COLUMNS} FROM products WHERE id = %s', (product_id,))
                 product = cur.fetchone()
                 if not product:
                     return {
@@ -65,30 +294,106 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                         'body': json.dumps({'error': 'Product not found'})
                     }
-                return {
+                return finalize_response(event, {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps(dict(product), default=json_serial)
-                }
+                }, etag)
             else:
-                cur.execute('SELECT * FROM products ORDER BY created_at DESC')
+                query_params = event.get('queryStringParameters') or {}
+                try:
+                    fields = parse_fields(query_params.get('fields'))
+                    sort = query_params.get('sort') or 'new'
+                    if sort not in SORT_OPTIONS:
+                        raise ValueError(f"Unknown sort: {sort}. Must be one of: {', '.join(SORT_OPTIONS)}")
+                    conditions, args = build_filters(query_params)
+                    with_facets = query_params.get('facets') == 'true'
+                    paginated = 'limit' in query_params or 'after' in query_params or with_facets
+                    limit = parse_limit(query_params.get('limit'))
+                    after = decode_cursor(query_params['after'], sort) if query_params.get('after') else None
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)})
+                    }
+                
+                search_query = (query_params.get('q') or '').strip()
+                if search_query:
+                    try:
+                        offset = max(0, int(query_params.get('offset') or 0))
+                    except ValueError:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'offset must be an integer'})
+                        }
+                    result = search_products(cur, search_query, fields, conditions, args, limit, offset)
+                    return finalize_response(event, {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps(result, default=json_serial)
+                    }, etag)
+                
+                sort_column, direction, cast = SORT_OPTIONS[sort]
+                select_list = build_select_list(fields, sort_column)
+                order_sql = f'ORDER BY {sort_column} {direction}, id {direction}'
+                
+                if not paginated:
+                    # Старый формат ответа - весь (отфильтрованный) каталог массивом
+                    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+                    cur.execute(f'SELECT {select_list} FROM products {where_sql} {order_sql}', args)
+                    products = cur.fetchall()
+                    return finalize_response(event, {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps([project_row(p, fields) for p in products], default=json_serial)
+                    }, etag)
+                
+                # Keyset-пагинация по (колонка сортировки, id): берём на одну запись больше, чтобы узнать о следующей странице
+                page_conditions = list(conditions)
+                page_args = list(args)
+                if after:
+                    comparison = '<' if direction == 'DESC' else '>'
+                    page_conditions.append(f'({sort_column}, id) {comparison} (%s::{cast}, %s)')
+                    page_args.extend(after)
+                where_sql = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+                cur.execute(
+                    f'SELECT {select_list} FROM products {where_sql} {order_sql} LIMIT %s',
+                    page_args + [limit + 1]
+                )
                 products = cur.fetchall()
-                return {
+                
+                next_cursor = None
+                if len(products) > limit:
+                    products = products[:limit]
+                    last = products[-1]
+                    next_cursor = encode_cursor(sort, last[sort_column], last['id'])
+                
+                result = {
+                    'products': [project_row(p, fields) for p in products],
+                    'nextCursor': next_cursor
+                }
+                if with_facets:
+                    result['facets'] = fetch_facets(cur, conditions, args)
+                
+                return finalize_response(event, {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps([dict(p) for p in products], default=json_serial)
-                }
+                    'body': json.dumps(result, default=json_serial)
+                }, etag)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
+            slug = allocate_slugs(cur, [slugify(body_data.get('slug') or body_data.get('title') or '')])[0]
             
-            cur.execute('''
+            cur.execute(f'''
                 INSERT INTO products (title, slug, description, price, discount_price, category, style, colors, images, items, in_stock, is_new, supplier_article, stock_quantity, variant_group_id, color_variant)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *
+                RETURNING {PRODUCT_COLUMNS}
             ''', (
                 body_data.get('title'),
-                body_data.get('slug'),
+                slug,
                 body_data.get('description', ''),
                 body_data.get('price'),
                 body_data.get('discount_price'),
@@ -127,14 +432,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             body_data = json.loads(event.get('body', '{}'))
             
-            cur.execute('''
+            cur.execute(f'''
                 UPDATE products 
                 SET title = %s, slug = %s, description = %s, price = %s, discount_price = %s, 
                     category = %s, style = %s, colors = %s, images = %s, items = %s, 
                     in_stock = %s, is_new = %s, supplier_article = %s, stock_quantity = %s, 
                     variant_group_id = %s, color_variant = %s, updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
-                RETURNING *
+                RETURNING {PRODUCT_COLUMNS}
             ''', (
                 body_data.get('title'),
                 body_data.get('slug'),
@@ -220,5 +525,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Индекс для keyset-пагинации каталога по (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_products_created_at_id ON products(created_at DESC, id DESC);
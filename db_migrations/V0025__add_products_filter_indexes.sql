@@ -0,0 +1,8 @@
+-- Индексы для серверной фильтрации и сортировки каталога
+
+-- Фильтр по цветам через JSONB containment (colors @> '["Белый"]')
+CREATE INDEX IF NOT EXISTS idx_products_colors ON products USING GIN (colors jsonb_path_ops);
+
+-- Сортировка и keyset-пагинация по цене и названию
+CREATE INDEX IF NOT EXISTS idx_products_price_id ON products(price, id);
+CREATE INDEX IF NOT EXISTS idx_products_title_id ON products(title, id);
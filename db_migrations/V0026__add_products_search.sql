@@ -0,0 +1,17 @@
+-- Поиск по каталогу: полнотекстовый индекс (русская морфология) и триграммы для опечаток и артикулов
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Название и артикул весят больше описания; артикул индексируется без стемминга
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(supplier_article, '')), 'A') ||
+    setweight(to_tsvector('russian', COALESCE(description, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
+
+-- Триграммы: word_similarity по названию и ILIKE по частям артикулов вроде ВШ06-600
+CREATE INDEX IF NOT EXISTS idx_products_title_trgm ON products USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_supplier_article_trgm ON products USING GIN (supplier_article gin_trgm_ops);
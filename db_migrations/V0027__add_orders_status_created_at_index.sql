@@ -0,0 +1,2 @@
+-- Составной индекс для лент заказов сотрудников по статусу (новые сверху, keyset по id)
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders(status, created_at DESC, id DESC);
@@ -0,0 +1,2 @@
+-- Индекс для ленты изменений заказов (since=<курсор по updated_at, id>)
+CREATE INDEX IF NOT EXISTS idx_orders_updated_at_id ON orders(updated_at, id);
@@ -0,0 +1,9 @@
+-- Номера заказов из последовательности вместо времени и user_id
+CREATE SEQUENCE IF NOT EXISTS order_number_seq;
+
+-- Ключ идемпотентности: повтор запроса клиентом не создаёт дубликат заказа
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(100);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders(idempotency_key);
+
+COMMENT ON COLUMN orders.idempotency_key IS 'Значение заголовка X-Idempotency-Key при оформлении заказа';
@@ -0,0 +1,138 @@
+-- Предрассчитанная доступность наборов: обновляется триггерами при изменении остатков,
+-- цен и артикулов товаров или состава набора, чтобы GET наборов был простым чтением
+
+CREATE TABLE IF NOT EXISTS bundle_availability (
+    bundle_id INTEGER PRIMARY KEY REFERENCES product_bundles(id) ON DELETE CASCADE,
+    in_stock BOOLEAN NOT NULL DEFAULT false,
+    available_count INTEGER NOT NULL DEFAULT 0,
+    missing_articles TEXT[] NOT NULL DEFAULT '{}',
+    components_price DECIMAL(12, 2),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE bundle_availability IS 'Доступность наборов по остаткам товаров (поддерживается триггерами)';
+COMMENT ON COLUMN bundle_availability.available_count IS 'Сколько полных наборов можно собрать из остатков';
+COMMENT ON COLUMN bundle_availability.missing_articles IS 'Артикулы, которых не хватает хотя бы на один набор';
+COMMENT ON COLUMN bundle_availability.components_price IS 'Сумма цен товаров набора с учётом количества';
+
+-- Пересчёт указанных наборов; остатки товаров с одинаковым артикулом суммируются
+CREATE OR REPLACE FUNCTION refresh_bundle_availability(p_bundle_ids INTEGER[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO bundle_availability (bundle_id, in_stock, available_count, missing_articles, components_price, updated_at)
+    SELECT pb.id,
+           COUNT(bi.id) > 0 AND COALESCE(bool_and(s.stock >= bi.qty), false),
+           COALESCE(MIN(s.stock / bi.qty), 0),
+           COALESCE(array_agg(bi.supplier_article ORDER BY bi.supplier_article) FILTER (WHERE s.stock < bi.qty), '{}'),
+           SUM(s.price * bi.qty),
+           CURRENT_TIMESTAMP
+    FROM product_bundles pb
+    LEFT JOIN LATERAL (
+        SELECT id, supplier_article, GREATEST(COALESCE(quantity, 1), 1) AS qty
+        FROM bundle_items
+        WHERE bundle_id = pb.id
+    ) bi ON true
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(SUM(GREATEST(p.stock_quantity, 0)), 0) AS stock, MIN(p.price) AS price
+        FROM products p
+        WHERE p.supplier_article = bi.supplier_article
+    ) s ON true
+    WHERE pb.id = ANY(p_bundle_ids)
+    GROUP BY pb.id
+    ON CONFLICT (bundle_id) DO UPDATE SET
+        in_stock = EXCLUDED.in_stock,
+        available_count = EXCLUDED.available_count,
+        missing_articles = EXCLUDED.missing_articles,
+        components_price = EXCLUDED.components_price,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Товары: statement-level триггеры с transition tables, чтобы массовый импорт пересчитывал наборы один раз
+CREATE OR REPLACE FUNCTION products_refresh_bundle_availability() RETURNS trigger AS $$
+DECLARE
+    affected INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT bi.bundle_id) INTO affected
+        FROM new_rows n
+        JOIN bundle_items bi ON bi.supplier_article = n.supplier_article;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT bi.bundle_id) INTO affected
+        FROM old_rows o
+        JOIN bundle_items bi ON bi.supplier_article = o.supplier_article;
+    ELSE
+        SELECT array_agg(DISTINCT bi.bundle_id) INTO affected
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN bundle_items bi ON bi.supplier_article IN (n.supplier_article, o.supplier_article)
+        WHERE n.stock_quantity IS DISTINCT FROM o.stock_quantity
+           OR n.price IS DISTINCT FROM o.price
+           OR n.supplier_article IS DISTINCT FROM o.supplier_article;
+    END IF;
+
+    IF affected IS NOT NULL THEN
+        PERFORM refresh_bundle_availability(affected);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_bundle_availability_insert ON products;
+CREATE TRIGGER trg_products_bundle_availability_insert
+    AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION products_refresh_bundle_availability();
+
+DROP TRIGGER IF EXISTS trg_products_bundle_availability_update ON products;
+CREATE TRIGGER trg_products_bundle_availability_update
+    AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION products_refresh_bundle_availability();
+
+DROP TRIGGER IF EXISTS trg_products_bundle_availability_delete ON products;
+CREATE TRIGGER trg_products_bundle_availability_delete
+    AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION products_refresh_bundle_availability();
+
+-- Состав набора
+CREATE OR REPLACE FUNCTION bundle_items_refresh_bundle_availability() RETURNS trigger AS $$
+DECLARE
+    affected INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT bundle_id) INTO affected FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT bundle_id) INTO affected FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT bundle_id) INTO affected
+        FROM (SELECT bundle_id FROM new_rows UNION SELECT bundle_id FROM old_rows) changed;
+    END IF;
+
+    IF affected IS NOT NULL THEN
+        PERFORM refresh_bundle_availability(affected);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bundle_items_availability_insert ON bundle_items;
+CREATE TRIGGER trg_bundle_items_availability_insert
+    AFTER INSERT ON bundle_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bundle_items_refresh_bundle_availability();
+
+DROP TRIGGER IF EXISTS trg_bundle_items_availability_update ON bundle_items;
+CREATE TRIGGER trg_bundle_items_availability_update
+    AFTER UPDATE ON bundle_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bundle_items_refresh_bundle_availability();
+
+DROP TRIGGER IF EXISTS trg_bundle_items_availability_delete ON bundle_items;
+CREATE TRIGGER trg_bundle_items_availability_delete
+    AFTER DELETE ON bundle_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bundle_items_refresh_bundle_availability();
+
+-- Начальное заполнение
+SELECT refresh_bundle_availability(ARRAY(SELECT id FROM product_bundles));
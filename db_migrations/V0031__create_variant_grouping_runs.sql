@@ -0,0 +1,10 @@
+-- Журнал применений автоматической группировки вариантов (для отката)
+CREATE TABLE IF NOT EXISTS variant_grouping_runs (
+    id SERIAL PRIMARY KEY,
+    changes JSONB NOT NULL DEFAULT '[]'::jsonb,
+    products_changed INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    undone_at TIMESTAMP
+);
+
+COMMENT ON TABLE variant_grouping_runs IS 'Прогоны группировки вариантов: значения variant_group_id/color_variant до и после';
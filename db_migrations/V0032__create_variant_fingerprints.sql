@@ -0,0 +1,24 @@
+-- Отпечатки товаров для инкрементального анализа вариантов:
+-- нормализованное базовое название и хэш названия, по которому оно посчитано
+CREATE TABLE IF NOT EXISTS product_variant_fingerprints (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    base_name VARCHAR(500) NOT NULL,
+    title_hash VARCHAR(32) NOT NULL,
+    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_variant_fingerprints_base_name ON product_variant_fingerprints(base_name);
+
+-- Отметка последнего прогона: следующий обрабатывает только товары с updated_at новее неё
+CREATE TABLE IF NOT EXISTS variant_analysis_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_product_updated_at TIMESTAMP,
+    last_run_at TIMESTAMP
+);
+
+INSERT INTO variant_analysis_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_id ON products(updated_at, id);
+
+COMMENT ON TABLE product_variant_fingerprints IS 'Базовые названия товаров для инкрементальной группировки вариантов';
+COMMENT ON TABLE variant_analysis_state IS 'Состояние инкрементального анализа вариантов';
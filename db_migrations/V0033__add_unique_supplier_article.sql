@@ -0,0 +1,53 @@
+-- Артикул поставщика становится ключом импорта (INSERT ... ON CONFLICT (supplier_article)),
+-- поэтому пустые артикулы приводим к NULL
+UPDATE products SET supplier_article = NULL WHERE supplier_article = '';
+
+-- Дубли артикулов: артикул остаётся у самого свежего товара группы (по updated_at, затем id),
+-- заказы и избранное остальных переводятся на него, а у остальных артикул обнуляется.
+-- Так ссылки не теряются, а следующий импорт обновляет именно оставленный товар
+DROP TABLE IF EXISTS supplier_article_duplicates;
+CREATE TEMP TABLE supplier_article_duplicates AS
+SELECT d.id AS duplicate_id, k.id AS keep_id
+FROM products d
+JOIN (
+    SELECT DISTINCT ON (supplier_article) supplier_article, id
+    FROM products
+    WHERE supplier_article IS NOT NULL
+    ORDER BY supplier_article, updated_at DESC NULLS LAST, id DESC
+) k ON k.supplier_article = d.supplier_article AND k.id <> d.id;
+
+UPDATE order_items oi
+SET product_id = m.keep_id
+FROM supplier_article_duplicates m
+WHERE oi.product_id = m.duplicate_id;
+
+-- У пользователя, у которого в избранном уже есть оставленный товар, дубль просто убираем
+DELETE FROM favorites f
+USING supplier_article_duplicates m
+WHERE f.product_id = m.duplicate_id
+  AND EXISTS (SELECT 1 FROM favorites kept WHERE kept.user_id = f.user_id AND kept.product_id = m.keep_id);
+
+-- Если в избранном было несколько дублей одного артикула, на оставленный товар переводится один
+DELETE FROM favorites f
+USING supplier_article_duplicates m, favorites other, supplier_article_duplicates om
+WHERE f.product_id = m.duplicate_id
+  AND other.user_id = f.user_id
+  AND other.product_id = om.duplicate_id
+  AND om.keep_id = m.keep_id
+  AND other.id < f.id;
+
+UPDATE favorites f
+SET product_id = m.keep_id
+FROM supplier_article_duplicates m
+WHERE f.product_id = m.duplicate_id;
+
+UPDATE products p
+SET supplier_article = NULL
+FROM supplier_article_duplicates m
+WHERE p.id = m.duplicate_id;
+
+DROP TABLE supplier_article_duplicates;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_supplier_article_unique ON products(supplier_article);
+
+DROP INDEX IF EXISTS idx_products_supplier_article;
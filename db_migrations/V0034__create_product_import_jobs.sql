@@ -0,0 +1,29 @@
+-- Задания поэтапного импорта товаров: каталог загружается частями, каждая часть
+-- обрабатывается сразу и может быть отправлена повторно, не теряя уже загруженное
+CREATE TABLE IF NOT EXISTS product_import_jobs (
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    clear_before BOOLEAN NOT NULL DEFAULT false,
+    total_chunks INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    committed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS product_import_job_chunks (
+    job_id INTEGER NOT NULL REFERENCES product_import_jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    products_count INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    unchanged INTEGER NOT NULL DEFAULT 0,
+    supplier_articles TEXT[] NOT NULL DEFAULT '{}',
+    error TEXT,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, seq)
+);
+
+COMMENT ON TABLE product_import_jobs IS 'Задания поэтапного импорта товаров: open -> committed';
+COMMENT ON TABLE product_import_job_chunks IS 'Части задания импорта: done или failed, с результатами upsert';
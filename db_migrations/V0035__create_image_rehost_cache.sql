@@ -0,0 +1,9 @@
+-- Соответствие ссылок на картинки поставщика и их копий на CDN:
+-- одна и та же картинка перезаливается один раз на все импорты
+CREATE TABLE IF NOT EXISTS image_rehost_cache (
+    source_url TEXT PRIMARY KEY,
+    cdn_url TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE image_rehost_cache IS 'Картинки поставщиков, перезалитые на CDN при импорте товаров';
@@ -0,0 +1,24 @@
+-- Инкрементальная синхронизация с Ozon: хэши записи списка и содержимого карточки
+-- по каждому товару Ozon. Атрибуты запрашиваются только при смене хэша записи списка
+-- (или если карточка давно не обновлялась), товар пишется только при смене хэша содержимого
+CREATE TABLE IF NOT EXISTS ozon_product_sync (
+    ozon_product_id BIGINT PRIMARY KEY,
+    offer_id VARCHAR(255),
+    list_hash VARCHAR(32) NOT NULL,
+    content_hash VARCHAR(32) NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Контрольная точка обхода: last_id последней полностью обработанной страницы.
+-- Прерванный по таймауту прогон продолжается с неё, после полного обхода она сбрасывается
+CREATE TABLE IF NOT EXISTS ozon_sync_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_id VARCHAR(255),
+    last_run_at TIMESTAMP,
+    last_completed_at TIMESTAMP
+);
+
+INSERT INTO ozon_sync_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+COMMENT ON TABLE ozon_product_sync IS 'Хэши товаров Ozon для инкрементальной синхронизации';
+COMMENT ON TABLE ozon_sync_state IS 'Контрольная точка синхронизации с Ozon';
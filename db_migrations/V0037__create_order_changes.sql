@@ -0,0 +1,47 @@
+-- Журнал изменений заказов для ленты дашбордов сотрудников. Курсор по (updated_at, id)
+-- терял изменения: updated_at берётся на старте транзакции, и заказ, закоммиченный позже
+-- соседнего, оказывался позади уже выданного курсора. Каждая запись журнала хранит номер
+-- транзакции-писателя; лента выдаёт записи только тех транзакций, что ниже горизонта
+-- txid_snapshot_xmin (все они уже завершены), поэтому поздний commit не обгоняется курсором
+
+CREATE TABLE IF NOT EXISTS order_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    status VARCHAR(50),
+    old_status VARCHAR(50),
+    tx_id BIGINT NOT NULL DEFAULT txid_current(),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_changes_tx ON order_changes(tx_id, change_id);
+
+COMMENT ON TABLE order_changes IS 'Журнал изменений заказов для ленты сотрудников (поддерживается триггерами)';
+COMMENT ON COLUMN order_changes.tx_id IS 'txid_current() транзакции, изменившей заказ';
+COMMENT ON COLUMN order_changes.old_status IS 'Статус до изменения: по нему лента сообщает об уходе заказа из фильтра сотрудника';
+
+CREATE OR REPLACE FUNCTION orders_log_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO order_changes (order_id, status)
+        SELECT n.id, n.status FROM new_rows n;
+    ELSE
+        INSERT INTO order_changes (order_id, status, old_status)
+        SELECT n.id, n.status, o.status
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_log_changes_insert ON orders;
+CREATE TRIGGER trg_orders_log_changes_insert
+    AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION orders_log_changes();
+
+DROP TRIGGER IF EXISTS trg_orders_log_changes_update ON orders;
+CREATE TRIGGER trg_orders_log_changes_update
+    AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION orders_log_changes();
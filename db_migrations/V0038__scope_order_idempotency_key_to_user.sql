@@ -0,0 +1,10 @@
+-- Ключ идемпотентности уникален в пределах покупателя, а не глобально: иначе чужой
+-- запрос с тем же ключом получал бы номер и id заказа другого пользователя
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_user_idempotency_key ON orders(user_id, idempotency_key);
+
+DROP INDEX IF EXISTS idx_orders_idempotency_key;
+
+-- Хэш тела запроса: повтор с тем же ключом, но другим заказом отклоняется, а не отдаёт старый
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_payload_hash VARCHAR(32);
+
+COMMENT ON COLUMN orders.idempotency_payload_hash IS 'md5 тела запроса, с которым создан заказ по ключу идемпотентности';
@@ -0,0 +1,26 @@
+-- Отметка инкрементального анализа вариантов по номеру транзакции вместо updated_at.
+-- updated_at берётся на старте транзакции, и товар, закоммиченный после прогона анализа,
+-- мог получить updated_at старше сохранённой отметки и навсегда выпасть из анализа.
+-- change_tx - txid_current() последней транзакции, изменившей товар; прогон запоминает
+-- горизонт txid_snapshot_xmin, ниже которого все транзакции уже завершены
+ALTER TABLE products ADD COLUMN IF NOT EXISTS change_tx BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_products_change_tx ON products(change_tx);
+
+CREATE OR REPLACE FUNCTION products_set_change_tx() RETURNS trigger AS $$
+BEGIN
+    NEW.change_tx := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_set_change_tx ON products;
+CREATE TRIGGER trg_products_set_change_tx
+    BEFORE INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION products_set_change_tx();
+
+-- Прежняя отметка по времени не переводится в txid: первый прогон после миграции полный
+ALTER TABLE variant_analysis_state ADD COLUMN IF NOT EXISTS last_tx_horizon BIGINT;
+
+COMMENT ON COLUMN products.change_tx IS 'txid_current() транзакции, последней изменившей товар (триггер)';
+COMMENT ON COLUMN variant_analysis_state.last_tx_horizon IS 'txid_snapshot_xmin на момент прошлого прогона: следующий берёт товары с change_tx не ниже';
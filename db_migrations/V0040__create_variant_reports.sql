@@ -0,0 +1,20 @@
+-- Снимки NDJSON-отчётов анализа вариантов: первая страница считает анализ и сохраняет
+-- все группы, следующие страницы читаются из снимка по group_id, а не пересчитываются.
+-- Снимки старше суток удаляются при создании нового
+CREATE TABLE IF NOT EXISTS variant_reports (
+    id SERIAL PRIMARY KEY,
+    summary JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_variant_reports_created_at ON variant_reports(created_at);
+
+CREATE TABLE IF NOT EXISTS variant_report_groups (
+    report_id INTEGER NOT NULL REFERENCES variant_reports(id) ON DELETE CASCADE,
+    group_id VARCHAR(50) COLLATE "C" NOT NULL,
+    data JSONB NOT NULL,
+    PRIMARY KEY (report_id, group_id)
+);
+
+COMMENT ON TABLE variant_reports IS 'Снимки отчётов анализа вариантов для постраничной выгрузки NDJSON';
+COMMENT ON TABLE variant_report_groups IS 'Группы вариантов снимка отчёта; страницы идут по group_id';
@@ -0,0 +1,15 @@
+-- Картинки, которые не удалось перезалить или которые не успели в бюджет времени импорта.
+-- Товары продолжают ссылаться на оригинал; action=rehostPending и следующие импорты
+-- перезаливают их повторно, после успеха запись удаляется
+CREATE TABLE IF NOT EXISTS image_rehost_pending (
+    source_url TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_rehost_pending_retry ON image_rehost_pending(attempts, updated_at);
+
+COMMENT ON TABLE image_rehost_pending IS 'Очередь повторной перезаливки картинок поставщиков на CDN';
+COMMENT ON COLUMN image_rehost_pending.attempts IS 'Число неудачных попыток; отменённые по бюджету времени не считаются';
@@ -0,0 +1,69 @@
+-- Версии данных для ETag ответов GET. Прежняя версия COUNT(*) + MAX(updated_at) теряла
+-- изменения: updated_at берётся на старте транзакции, и поздний commit с более старой
+-- отметкой не менял ETag - клиент с 304 так и оставался со старыми данными. Здесь
+-- счётчик таблицы увеличивает statement-level триггер в самой изменяющей транзакции;
+-- строка счётчика заблокирована до commit, поэтому версии идут в порядке commit
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    source VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE data_versions IS 'Счётчики изменений таблиц для ETag (поддерживаются триггерами)';
+COMMENT ON COLUMN data_versions.source IS 'Имя таблицы';
+COMMENT ON COLUMN data_versions.version IS 'Увеличивается каждой транзакцией, изменившей хотя бы одну строку таблицы';
+
+INSERT INTO data_versions (source)
+VALUES ('products'), ('product_bundles'), ('bundle_items'), ('bundle_availability')
+ON CONFLICT (source) DO NOTHING;
+
+-- Пустые UPDATE/DELETE (например, upsert без изменений) версию не трогают. У TRUNCATE
+-- transition table нет, поэтому changed_rows читается только в отдельной ветке
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO data_versions (source, version)
+    VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (source) DO UPDATE SET
+        version = data_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['products', 'product_bundles', 'bundle_items', 'bundle_availability'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_insert ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_insert AFTER INSERT ON %I '
+            'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_update ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_update AFTER UPDATE ON %I '
+            'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_delete ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_delete AFTER DELETE ON %I '
+            'REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_truncate ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_truncate AFTER TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+    END LOOP;
+END $$;
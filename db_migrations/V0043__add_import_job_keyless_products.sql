@@ -0,0 +1,11 @@
+-- Товары без артикула сопоставляются с прайс-листом по названию и категории. Часть задания
+-- запоминает id таких товаров, чтобы commitJob с clearBefore удалил только не попавшие в
+-- прайс-лист (и только те, на которые не ссылаются заказы и избранное)
+ALTER TABLE product_import_job_chunks
+    ADD COLUMN IF NOT EXISTS keyless_product_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+COMMENT ON COLUMN product_import_job_chunks.keyless_product_ids IS 'id товаров без артикула, сопоставленных со строками части';
+
+CREATE INDEX IF NOT EXISTS idx_products_keyless_match
+    ON products (lower(btrim(title)), category)
+    WHERE supplier_article IS NULL;
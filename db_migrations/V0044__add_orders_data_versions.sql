@@ -0,0 +1,39 @@
+-- Версии данных для ETag списка заказов: заказы, их позиции и покупатели (имя, телефон
+-- и email попадают в ответ сотрудникам). Те же statement-level триггеры bump_data_version,
+-- что и у каталога (V0042), поэтому ETag считается до выборки заказов
+
+INSERT INTO data_versions (source)
+VALUES ('orders'), ('order_items'), ('users')
+ON CONFLICT (source) DO NOTHING;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['orders', 'order_items', 'users'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_insert ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_insert AFTER INSERT ON %I '
+            'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_update ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_update AFTER UPDATE ON %I '
+            'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_delete ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_delete AFTER DELETE ON %I '
+            'REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_data_version_truncate ON %I', tbl, tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_data_version_truncate AFTER TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            tbl, tbl
+        );
+    END LOOP;
+END $$;
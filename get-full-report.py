@@ -1,89 +1,167 @@
 #!/usr/bin/env python3
 """
-Скрипт для получения полного отчета по вариантам товаров
+Скрипт для получения полного отчета по вариантам товаров.
+
+Группы читаются из API построчно (format=ndjson) страницами и сразу дописываются
+в текстовый отчет и SQL-файл, поэтому весь анализ в памяти не держится.
+Первая страница сохраняет на сервере снимок анализа, следующие читаются из него
+по reportId. После каждой страницы сохраняется состояние: прерванную выгрузку
+можно продолжить с флагом --resume, пока снимок не устарел (сутки).
 """
-import requests
+import argparse
 import json
+import os
+import requests
 
 API_URL = 'https://functions.poehali.dev/2654b969-f5e1-447b-9dc1-cce40403afb5'
+PAGE_LIMIT = 200
+REQUEST_TIMEOUT = 60
+
+REPORT_FILE = 'variants-report.txt'
+SQL_FILE = 'variants-update.sql'
+STATE_FILE = 'variants-report.state.json'
+
+def sql_literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+def iter_page(session, report_id, after):
+    """
+    Одна страница NDJSON: строки разбираются по мере получения
+    """
+    params = {'format': 'ndjson', 'limit': PAGE_LIMIT}
+    if report_id:
+        params['report'] = report_id
+    if after:
+        params['after'] = after
+    
+    with session.get(API_URL, params=params, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+def write_group(report, sql, idx, group_id, group_data):
+    report.write(f"\nГРУППА {idx}: {group_id}\n")
+    report.write(f"Базовое название: \"{group_data['base_name']}\"\n")
+    report.write(f"Количество вариантов: {len(group_data['products'])}\n")
+    report.write("-" * 100 + "\n")
+    
+    sql.write(f"\n-- {group_id}: {group_data['base_name']}\n")
+    
+    for product in group_data['products']:
+        stock_icon = "✓" if (product['stock_quantity'] or 0) > 0 else "✗"
+        report.write(f"  [{stock_icon}] ID {product['id']} → color_variant: \"{product['color_variant']}\"\n")
+        report.write(f"      Название: {product['title']}\n")
+        report.write(f"      Остаток: {product['stock_quantity']} | "
+                     f"Категория: {product['category'] or 'не указана'} | "
+                     f"Артикул: {product['supplier_article'] or 'нет'}\n\n")
+        
+        sql.write(f"UPDATE products SET variant_group_id = {sql_literal(group_id)}, "
+                  f"color_variant = {sql_literal(product['color_variant'])} WHERE id = {int(product['id'])};\n")
+
+def load_state(resume):
+    if resume and os.path.exists(STATE_FILE):
+        with open(STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+def save_state(state):
+    tmp_file = STATE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_file, STATE_FILE)
+
+def open_outputs(state):
+    """
+    Новый прогон пишет файлы с нуля; при продолжении они обрезаются до последней
+    сохраненной страницы, чтобы недописанная страница не задвоилась
+    """
+    if state is None:
+        report = open(REPORT_FILE, 'w', encoding='utf-8')
+        sql = open(SQL_FILE, 'w', encoding='utf-8')
+        report.write("=" * 100 + "\n")
+        report.write("АНАЛИЗ ВАРИАНТОВ ТОВАРОВ - ПОЛНЫЙ ОТЧЕТ\n")
+        report.write("=" * 100 + "\n")
+        sql.write("-- Группировка вариантов товаров\nBEGIN;\n")
+        return report, sql
+    
+    report = open(REPORT_FILE, 'r+', encoding='utf-8')
+    sql = open(SQL_FILE, 'r+', encoding='utf-8')
+    for f, offset in ((report, state['report_offset']), (sql, state['sql_offset'])):
+        f.seek(offset)
+        f.truncate()
+    return report, sql
 
 def main():
+    parser = argparse.ArgumentParser(description='Полный отчет по вариантам товаров')
+    parser.add_argument('--resume', action='store_true', help=f'продолжить прерванную выгрузку по {STATE_FILE}')
+    args = parser.parse_args()
+    
+    state = load_state(args.resume)
+    if args.resume and state is None:
+        print("Нет сохраненного состояния, начинаем заново")
+    elif state is not None:
+        print(f"Продолжаем после группы {state['after']} (уже выгружено групп: {state['groups']})")
+    
     print("Загрузка данных из API...")
     print()
     
+    report, sql = open_outputs(state)
+    state = state or {'report': None, 'after': None, 'groups': 0, 'products': 0, 'complete': False}
+    summary = None
+    
     try:
-        response = requests.get(API_URL)
-        response.raise_for_status()
-        data = response.json()
-        
-        print("=" * 100)
-        print("АНАЛИЗ ВАРИАНТОВ ТОВАРОВ - ПОЛНЫЙ ОТЧЕТ")
-        print("=" * 100)
-        print()
-        
-        print("СТАТИСТИКА:")
-        print(f"  Всего товаров без variant_group_id: {data['total_products']}")
-        print(f"  Найдено групп: {data['groups_found']}")
-        
-        total_in_groups = sum(len(g['products']) for g in data['groups'].values())
-        print(f"  Товаров в группах: {total_in_groups}")
-        print()
-        print("=" * 100)
-        print()
-        
-        # Сортируем группы по количеству товаров
-        sorted_groups = sorted(
-            data['groups'].items(), 
-            key=lambda x: len(x[1]['products']), 
-            reverse=True
-        )
-        
-        for idx, (group_id, group_data) in enumerate(sorted_groups, 1):
-            print(f"\nГРУППА {idx}: {group_id}")
-            print(f"Базовое название: \"{group_data['base_name']}\"")
-            print(f"Количество вариантов: {len(group_data['products'])}")
-            print("-" * 100)
+        with report, sql, requests.Session() as session:
+            while not state.get('complete'):
+                next_after = None
+                for record in iter_page(session, state.get('report'), state['after']):
+                    if record['type'] == 'summary':
+                        summary = record
+                    elif record['type'] == 'group':
+                        state['groups'] += 1
+                        state['products'] += len(record['products'])
+                        write_group(report, sql, state['groups'], record['group_id'], record)
+                    elif record['type'] == 'end':
+                        state['report'] = record['reportId']
+                        next_after = record['nextAfter']
+                
+                report.flush()
+                sql.flush()
+                state['after'] = next_after
+                state['complete'] = not next_after
+                state['report_offset'] = report.tell()
+                state['sql_offset'] = sql.tell()
+                save_state(state)
+                print(f"  Выгружено групп: {state['groups']}")
             
-            for product in group_data['products']:
-                stock_icon = "✓" if product['stock_quantity'] > 0 else "✗"
-                print(f"  [{stock_icon}] ID {product['id']} → color_variant: \"{product['color_variant']}\"")
-                print(f"      Название: {product['title']}")
-                print(f"      Остаток: {product['stock_quantity']} | " 
-                      f"Категория: {product['category'] or 'не указана'} | "
-                      f"Артикул: {product['supplier_article'] or 'нет'}")
-                print()
+            report.write("\n" + "=" * 100 + "\n")
+            report.write(f"Всего товаров без variant_group_id: {summary['total_products'] if summary else '?'}\n")
+            report.write(f"Найдено групп: {state['groups']}\n")
+            report.write(f"Товаров в группах: {state['products']}\n")
+            sql.write("\nCOMMIT;\n")
+        
+        os.remove(STATE_FILE)
         
         print()
         print("=" * 100)
         print("ГОТОВО!")
         print("=" * 100)
+        print(f"  Найдено групп: {state['groups']}")
+        print(f"  Товаров в группах: {state['products']}")
         print()
-        print("СЛЕДУЮЩИЕ ШАГИ:")
-        print("1. Просмотрите группы выше")
-        print("2. Для каждой группы создайте SQL UPDATE запросы")
-        print("3. Пример запроса:")
-        print()
-        
-        if sorted_groups:
-            first_group_id, first_group_data = sorted_groups[0]
-            first_product = first_group_data['products'][0]
-            print("   UPDATE products SET")
-            print(f"     variant_group_id = '{first_group_id}',")
-            print(f"     color_variant = '{first_product['color_variant']}'")
-            print(f"   WHERE id = {first_product['id']};")
-        
-        print()
-        print("=" * 100)
-        
-        # Сохраняем в JSON
-        with open('variants-full-data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        print()
-        print("Данные сохранены в: variants-full-data.json")
-        
+        print(f"Отчет сохранен в: {REPORT_FILE}")
+        print(f"SQL для применения сохранен в: {SQL_FILE}")
+    
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            print("Снимок отчета на сервере устарел, запустите выгрузку заново без --resume")
+        else:
+            print(f"Ошибка при запросе к API: {e}")
+            print("Запустите скрипт с --resume, чтобы продолжить")
+        return 1
     except requests.RequestException as e:
         print(f"Ошибка при запросе к API: {e}")
+        print("Запустите скрипт с --resume, чтобы продолжить")
         return 1
     except Exception as e:
         print(f"Ошибка: {e}")